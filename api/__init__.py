@@ -19,7 +19,7 @@ def _loadOpenApiSpec():
     except FileNotFoundError:
         import yaml
         with open("res/openapi.yaml", "r", encoding="utf-8") as file:
-            apiSpec = yaml.load(file, Loader=yaml.SafeLoader)
+            apiSpec = yaml.load(file, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
     apiVersion = apiSpec["info"]["version"]
 
 
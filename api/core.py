@@ -2,17 +2,24 @@
 # SPDX-License-Identifier: AGPL-3.0-or-later
 # SPDX-FileCopyrightText: 2020 grommunio GmbH
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, jsonify, request, make_response
 from functools import wraps
+from itertools import count
+import threading
 
 from orm import DB
 from services import Service
 from tools.config import Config
+from tools.metrics import Metrics
 
 from . import apiSpec
 
 
 class OpenApiCompat:
+    routeCacheSize = 1024
+
     def __init__(self, apiSpec):
         import openapi_core
         self.version = [int(part) for part in openapi_core.__version__.split(".")]
@@ -49,9 +56,44 @@ class OpenApiCompat:
             self.FlaskOpenAPIRequest, self.FlaskOpenAPIResponse = FlaskOpenAPIRequest, FlaskOpenAPIResponse
             self.ReqUnmarshaller = V30RequestUnmarshaller(self.spec)
             self.ResUnmarshaller = V30ResponseUnmarshaller(self.spec)
+            self.routeCache = OrderedDict()
+            self.routeCacheLock = threading.Lock()
+            self._cacheRouteLookup(self.ReqUnmarshaller)
+            self._cacheRouteLookup(self.ResUnmarshaller)
             self.validateRequest = self._validateRequest_17_0
             self.validateResponse = self._validateResponse_17_0
 
+    def _cacheRouteLookup(self, unmarshaller):
+        """Cache path and operation lookup of an unmarshaller.
+
+        Flask requests are matched against the route pattern instead of the actual URL, so the lookup result only
+        depends on method and route and can be shared between requests and responses.
+
+        Parameters
+        ----------
+        unmarshaller : openapi_core unmarshaller
+            Request or response unmarshaller to patch.
+        """
+        findPath = getattr(unmarshaller, "_find_path", None)
+        if findPath is None:
+            return
+        cache = self.routeCache
+        lock = self.routeCacheLock
+
+        def cachedFindPath(request):
+            key = (request.method, request.host_url, request.path_pattern)
+            with lock:
+                if key in cache:
+                    cache.move_to_end(key)
+                    return cache[key]
+            result = findPath(request)
+            with lock:
+                cache[key] = result
+                while len(cache) > self.routeCacheSize:
+                    cache.popitem(last=False)
+            return result
+        unmarshaller._find_path = cachedFindPath
+
     @staticmethod
     def _suppressError(exc):
         def matchBuggedError(err):
@@ -98,6 +140,18 @@ if not Config["openapi"]["validateRequest"]:
 if not Config["openapi"]["validateResponse"]:
     API.logger.warning("Response validation is disabled!")
 
+_responseValidation = Config["openapi"].get("responseValidation", "always")
+_responseSampleRate = max(1, Config["openapi"].get("responseSampleRate", 10))
+_responseCounter = count()
+_responseExecutor = ThreadPoolExecutor(Config["openapi"].get("responseValidationThreads", 2),
+                                       thread_name_prefix="response-validation") \
+    if _responseValidation == "deferred" else None
+_responseSlots = threading.BoundedSemaphore(Config["openapi"].get("responseValidationThreads", 2) +
+                                            Config["openapi"].get("responseValidationQueueSize", 100))
+if _responseValidation not in ("always", "sampled", "deferred"):
+    API.logger.warning("Unknown response validation mode '{}' - using 'always'".format(_responseValidation))
+    _responseValidation = "always"
+
 
 def validateRequest(flask_request):
     """Validate the request
@@ -119,14 +173,80 @@ def validateRequest(flask_request):
     return True, None, None
 
 
+def validateResponse(flask_request, response):
+    """Validate response and log errors.
+
+    Parameters
+    ----------
+    flask_request : flask.Request
+        The request that generated the response
+    response : flask.Response
+        The response to validate
+
+    Returns
+    -------
+    list
+        List of validation errors or None if the response could not be validated
+    """
+    try:
+        result = validator.validateResponse(flask_request, response)
+    except AttributeError as err:
+        Metrics.inc("responseValidation", "skipped")
+        API.logger.warning("Response validation skipped ({} {}): {}".format(flask_request.method, flask_request.path, err))
+        return None
+    except Exception as err:
+        API.logger.error("Response validation crashed: "+" - ".join(str(arg) for arg in err.args))
+        return None
+    Metrics.inc("responseValidation", "validated")
+    if result:
+        Metrics.inc("responseValidation", "failed")
+        log = API.logger.error if Config["openapi"]["validateResponse"] else API.logger.warning
+        log("Response validation failed ({} {}): {}".format(flask_request.method, flask_request.path, result))
+    return result
+
+
+def deferResponseValidation(flask_request, response):
+    """Validate response in a background thread.
+
+    At most `openapi.responseValidationQueueSize` validations are queued. If the queue is full, the response is not
+    validated.
+
+    Parameters
+    ----------
+    flask_request : flask.Request
+        The request that generated the response
+    response : flask.Response
+        The response to validate
+
+    Returns
+    -------
+    bool
+        True if validation was scheduled, False if it was dropped
+    """
+    if not _responseSlots.acquire(blocking=False):
+        Metrics.inc("responseValidation", "dropped")
+        return False
+    try:
+        future = _responseExecutor.submit(validateResponse, flask_request, response)
+    except Exception:
+        _responseSlots.release()
+        raise
+    future.add_done_callback(lambda _: _responseSlots.release())
+    return True
+
+
 def reloadORM():
     """Reload all active orm modules."""
     import importlib
     import sys
+    import time
     API.logger.warn("Database schema version updated detected - reloading ORM")
+    start = time.monotonic()
     DB.initVersion()
     for name, module in [(name, module) for name, module in sys.modules.items() if name.startswith("orm.")]:
         importlib.reload(module)
+    Metrics.set("orm", "lastReloadDuration", time.monotonic()-start)
+    Metrics.inc("orm", "reloads")
 
 
 def secure(requireDB=False, requireAuth=True, authLevel="basic", service=None, validateCSRF=None):
@@ -151,7 +271,8 @@ def secure(requireDB=False, requireAuth=True, authLevel="basic", service=None, v
 
        Automatically validates the request using the OpenAPI specification and returns a HTTP 400 to the client if validation
        fails. Also validates the response generated by the endpoint and returns a HTTP 500 on error. This behavior can be
-       deactivated in the configuration.
+       deactivated in the configuration. Response validation can also be restricted to a sample of responses or
+       moved to a background thread (`openapi.responseValidation`), in which case errors are only logged.
 
        If an exception is raised during execution, a HTTP 500 message is returned to the client and a short description of the
        error is sent in the 'error' field of the response.
@@ -167,17 +288,18 @@ def secure(requireDB=False, requireAuth=True, authLevel="basic", service=None, v
                         ret = func(*args, srv, **kwargs)
                 else:
                     ret = func(*args, **kwargs)
+                if _responseValidation == "sampled" and next(_responseCounter) % _responseSampleRate != 0:
+                    Metrics.inc("responseValidation", "skipped")
+                    return ret
                 response = make_response(ret)
-                try:
-                    result = validator.validateResponse(request, response)
-                except AttributeError:
-                    result = None
-                if result:
-                    if Config["openapi"]["validateResponse"]:
-                        API.logger.error("Response validation failed: "+str(result))
-                        return jsonify(message="The server generated an invalid response."), 500
-                    else:
-                        API.logger.warn("Response validation failed: "+str(result))
+                if response.is_streamed:  # Validation would consume the stream
+                    return ret
+                if _responseValidation == "deferred":
+                    deferResponseValidation(request._get_current_object(), response)
+                    return ret
+                result = validateResponse(request, response)
+                if result and _responseValidation == "always" and Config["openapi"]["validateResponse"]:
+                    return jsonify(message="The server generated an invalid response."), 500
                 return ret
 
             if requireAuth:
@@ -9,8 +9,11 @@ import time
 import jwt
 
 from base64 import b64encode
+from collections import OrderedDict
 from services import Service
+from threading import Lock
 from tools.config import Config
+from tools.metrics import Metrics
 
 
 logger = logging.getLogger("security")
@@ -39,6 +42,77 @@ except Exception:
         logger.error("Failed to save JWT RSA keys, logins will not persist across API restarts")
 
 
+class _TokenCache:
+    """LRU cache of successfully verified tokens.
+
+    Tokens are identified by their SHA-256 digest. Entries expire after the configured TTL, but never later than the
+    expiration time of the token itself.
+    """
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = Lock()
+        self.entries = OrderedDict()
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode("ascii", "replace")).digest()
+
+    def get(self, token):
+        """Get cached claims of a token.
+
+        Parameters
+        ----------
+        token : str
+            JWT
+
+        Returns
+        -------
+        dict
+            Copy of the cached claims or None if the token is not cached
+        """
+        if self.maxsize <= 0:
+            return None
+        key = self._key(token)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] <= time.time():
+                self.entries.pop(key)
+                entry = None
+            if entry is None:
+                Metrics.inc("tokenCache", "misses")
+                return None
+            self.entries.move_to_end(key)
+        Metrics.inc("tokenCache", "hits")
+        return dict(entry[1])
+
+    def put(self, token, claims):
+        """Add verified token to the cache.
+
+        Parameters
+        ----------
+        token : str
+            JWT
+        claims : dict
+            Decoded claims
+        """
+        if self.maxsize <= 0:
+            return
+        expires = time.time()+self.ttl
+        if "exp" in claims:
+            expires = min(expires, claims["exp"])
+        key = self._key(token)
+        with self.lock:
+            self.entries[key] = (expires, dict(claims))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+            Metrics.set("tokenCache", "size", len(self.entries))
+
+
+_tokenCache = _TokenCache(Config["security"].get("tokenCacheSize", 1024), Config["security"].get("tokenCacheTTL", 300))
+
+
 def getUser():
     """Load currently logged in user from database.
 
@@ -139,6 +213,8 @@ def checkCSRF(token):
 def checkToken(token):
     """Check jwt validity.
 
+    Successfully verified tokens are cached (see `security.tokenCacheSize` and `security.tokenCacheTTL`).
+
     Parameters
     ----------
     token : str
@@ -151,6 +227,9 @@ def checkToken(token):
     dict / str
         Dict containing the JWT claims if successful, error message otherwise
     """
+    claims = _tokenCache.get(token)
+    if claims is not None:
+        return True, claims
     try:
         claims = jwt.decode(token, jwtPubkey, algorithms=["RS256"])
     except jwt.ExpiredSignatureError:
@@ -159,6 +238,7 @@ def checkToken(token):
         return False, "Invalid token signature"
     except Exception:
         return False, "invalid token"
+    _tokenCache.put(token, claims)
     return True, claims
 
 
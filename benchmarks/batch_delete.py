@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2024 grommunio GmbH
+
+"""Compare per-object and set-based deletion of 10k rows (`orm.bulkDelete`).
+
+Run from the repository root with `python -m benchmarks.batch_delete`.
+"""
+
+import time
+
+from sqlalchemy import Column, Integer, String, create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from orm import NotifyTable, bulkDelete, declarative_base
+
+Base = declarative_base()
+
+
+class Entry(Base, NotifyTable):
+    __tablename__ = "entries"
+
+    ID = Column("id", Integer, primary_key=True)
+    name = Column("name", String(64))
+
+
+event.listen(Entry, "after_delete", Entry.NTtouch)
+
+
+def seed(count):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(engine)()
+    session.bulk_insert_mappings(Entry, [{"ID": i, "name": "entry{}@example.org".format(i)} for i in range(count)])
+    session.commit()
+    return session
+
+
+def perObject(session):
+    for obj in session.query(Entry).all():
+        session.delete(obj)
+    session.commit()
+
+
+def setBased(session):
+    bulkDelete(session.query(Entry))
+    session.commit()
+
+
+def main(count=10000, rounds=3):
+    for name, func in (("per-object", perObject), ("bulkDelete", setBased)):
+        best = None
+        for _ in range(rounds):
+            session = seed(count)
+            start = time.perf_counter()
+            func(session)
+            duration = time.perf_counter()-start
+            assert session.query(Entry).count() == 0
+            session.close()
+            best = duration if best is None else min(best, duration)
+        print("{:<12} {:>8.1f} ms  ({} rows)".format(name, best*1000, count))
+
+
+if __name__ == "__main__":
+    main()
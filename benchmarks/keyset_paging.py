@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2024 grommunio GmbH
+
+"""Compare offset and keyset (cursor) pagination through 100k users (`DataModel.keyset`).
+
+Uses an SQLite stand-in of the users table with an index on the username.
+Run from the repository root with `python -m benchmarks.keyset_paging`.
+"""
+
+import time
+
+from sqlalchemy import Column, Integer, String, create_engine
+from sqlalchemy.orm import sessionmaker
+
+from orm import declarative_base
+from tools.DataModel import DataModel, Id, Text
+
+Base = declarative_base()
+
+
+class Users(DataModel, Base):
+    __tablename__ = "users"
+
+    ID = Column("id", Integer, primary_key=True)
+    username = Column("username", String(320), nullable=False, index=True)
+    domainID = Column("domain_id", Integer, nullable=False)
+
+    _dictmapping_ = ((Id(), Text("username", flags="sort")), (Id("domainID"),))
+
+
+def seed(count):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(engine)()
+    session.bulk_insert_mappings(Users, [{"ID": i, "username": "user{:06d}@example{}.org".format((i*7919) % count, i % 10),
+                                          "domainID": i % 10} for i in range(1, count+1)])
+    session.commit()
+    return session
+
+
+def offsetPages(session, sorts, limit):
+    offset, pages = 0, 0
+    while True:
+        objects = Users.autosort(session.query(Users), sorts).order_by(Users.ID).limit(limit).offset(offset).all()
+        if not objects:
+            return pages
+        offset += limit
+        pages += 1
+        session.expunge_all()
+
+
+def keysetPages(session, sorts, limit):
+    cursor, pages = None, 0
+    while True:
+        objects = Users.keyset(session.query(Users), sorts, cursor).limit(limit).all()
+        if not objects:
+            return pages
+        cursor = objects[-1].keysetValues(sorts)
+        pages += 1
+        session.expunge_all()
+
+
+def main(count=100000, limit=50):
+    session = seed(count)
+    for sorts in ([], ["username"]):
+        for name, func in (("offset", offsetPages), ("keyset", keysetPages)):
+            start = time.perf_counter()
+            pages = func(session, sorts, limit)
+            duration = time.perf_counter()-start
+            print("{:<10} {:<7} {:>8.0f} ms  ({} pages, {:.2f} ms/page)"
+                  .format(",".join(sorts) or "ID", name, duration*1000, pages, duration/pages*1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2024 grommunio GmbH
+
+"""Compare per-user and batched retrieval of linked users from an LDAP directory.
+
+Measures the directory part of `tools.ldap.downsyncUsers`: fetching the LDAP data of each linked user and converting
+it to user data. The per-user variant issues one `LdapService.downsyncUser` search per user, as the previous sync
+did, the batched variant one `LdapService.getAll` search per chunk. The directory is an ldap3 MOCK_SYNC server with
+an emulated round-trip time (see `benchmarks.ldap_pool`). The mock evaluates filters by scanning all entries, so the
+directory is kept small to let the round-trips dominate. Applying the data to the database is not included.
+
+Run from the repository root with `python -m benchmarks.ldap_downsync`.
+"""
+
+import time
+
+from benchmarks.ldap_pool import LatencyConnection, directory, service
+
+
+def ldapService(server):
+    ldap = service(server, 1)
+    ldap._userAttributes = {"displayName": "displayname"}
+    ldap._defaultProps = {}
+    return ldap
+
+
+def perUser(ldap, IDs, chunkSize):
+    return [ldap.downsyncUser(ID) for ID in IDs]
+
+
+def batched(ldap, IDs, chunkSize):
+    return [result.userdata() for result in ldap.getAll(IDs, attributes="all", chunkSize=chunkSize)]
+
+
+def main(users=300, latency=0.01, chunkSizes=(100, 300)):
+    server = directory(users)
+    LatencyConnection.latency = latency
+    IDs = [str(i) for i in range(users)]
+    print("{} users, {:.1f} ms round-trip".format(users, latency*1000))
+    variants = [("per-user", perUser, None)]+[("getAll/{}".format(size), batched, size) for size in chunkSizes]
+    for name, func, chunkSize in variants:
+        ldap = ldapService(server)
+        start = time.perf_counter()
+        userdata = func(ldap, IDs, chunkSize)
+        duration = time.perf_counter()-start
+        assert len(userdata) == users and all(data is not None for data in userdata)
+        print("{:<12} {:>8.0f} users/s".format(name, users/duration))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2024 grommunio GmbH
+
+"""Compare per-group and single-pass retrieval of LDAP group members for 1000 groups.
+
+Measures the directory part of `tools.ldap.syncAllGroupMembers`. The per-group variant issues one member filter
+search per group, as `tools.ldap.syncGroupMembers` does, the single-pass variant reads all memberships with
+`LdapService.groupMemberships`. The directory is an ldap3 MOCK_SYNC server with an emulated round-trip time (see
+`benchmarks.ldap_pool`). The mock evaluates each filter by scanning all entries, which adds to the per-group cost.
+Updating the member lists in the database is not included.
+
+Run from the repository root with `python -m benchmarks.ldap_groups`.
+"""
+
+import time
+
+from ldap3 import MOCK_SYNC, MODIFY_REPLACE, Connection
+
+from benchmarks.ldap_pool import ADMIN, BASE, LatencyConnection, directory, service
+from services.ldap import ResultCache
+from tools.ldap import _groupMemberIDs
+
+
+def groupDN(i):
+    return "cn=Group {},{}".format(i, BASE)
+
+
+def populate(server, users, groups, memberships):
+    conn = Connection(server, user=ADMIN, password="secret", client_strategy=MOCK_SYNC)
+    conn.bind()
+    for i in range(groups):
+        conn.strategy.add_entry(groupDN(i), {"objectClass": "group", "entryUUID": "g{}".format(i),
+                                             "cn": "Group {}".format(i), "mail": "group{}@example.org".format(i)})
+    for i in range(users):
+        conn.modify("cn=user{},{}".format(i, BASE),
+                    {"memberOf": [(MODIFY_REPLACE, [groupDN((i*memberships+j) % groups)
+                                                    for j in range(memberships)])]})
+
+
+def ldapService(server):
+    ldap = service(server, 1)
+    ldap._config["groups"] = {"groupfilter": "(objectClass=group)", "groupaddr": "mail", "groupname": "cn"}
+    ldap.cache = ResultCache(1024, 60)
+    return ldap
+
+
+def perGroup(ldap, ldapgroups, groups):
+    return {groups[group.email]: {member.ID for member in
+                                  ldap.searchUsers(attributes="idonly", customFilter=ldap.groupMemberFilter(group.DN))}
+            for group in ldapgroups}
+
+
+def singlePass(ldap, ldapgroups, groups):
+    return _groupMemberIDs(ldapgroups, groups, ldap.groupMemberships(), ldap.normalizeDN)
+
+
+def main(users=100, groups=1000, memberships=5, latency=0.005):
+    server = directory(users)
+    populate(server, users, groups, memberships)
+    LatencyConnection.latency = 0
+    ldapgroups = ldapService(server).searchUsers(types=("group",))
+    listIDs = {group.email: ID for ID, group in enumerate(ldapgroups)}
+    assert len(ldapgroups) == groups
+    LatencyConnection.latency = latency
+    print("{} groups, {} users in {} groups each, {:.1f} ms round-trip".format(groups, users, memberships,
+                                                                                 latency*1000))
+    results = []
+    for name, func in (("per-group", perGroup), ("single pass", singlePass)):
+        ldap = ldapService(server)
+        start = time.perf_counter()
+        results.append(func(ldap, ldapgroups, listIDs))
+        duration = time.perf_counter()-start
+        print("{:<12} {:>8.2f} s".format(name, duration))
+    assert results[0] == results[1]
+    assert sum(len(members) for members in results[0].values()) == users*memberships
+
+
+if __name__ == "__main__":
+    main()
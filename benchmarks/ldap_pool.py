@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2024 grommunio GmbH
+
+"""Measure concurrent LDAP search throughput for different connection pool sizes.
+
+Searches run through `LdapService._search` against an ldap3 MOCK_SYNC directory from several threads. The mock
+directory answers instantly, so each bind and search additionally sleeps for a configurable round-trip time to
+emulate a remote server. A pool size of 1 corresponds to the previous single, serialized connection.
+
+Run from the repository root with `python -m benchmarks.ldap_pool`.
+"""
+
+import threading
+import time
+
+import ldap3
+
+from services.ldap import ConnectionPool, LdapService
+
+BASE = "dc=example,dc=org"
+ADMIN = "cn=admin,"+BASE
+
+
+class LatencyConnection(ldap3.Connection):
+    """MOCK_SYNC connection adding a fixed delay to each request."""
+    latency = 0
+
+    def bind(self, *args, **kwargs):
+        time.sleep(self.latency)
+        return super().bind(*args, **kwargs)
+
+    def search(self, *args, **kwargs):
+        time.sleep(self.latency)
+        return super().search(*args, **kwargs)
+
+
+def directory(users):
+    server = ldap3.Server("mock")
+    conn = ldap3.Connection(server, user=ADMIN, password="secret", client_strategy=ldap3.MOCK_SYNC)
+    conn.strategy.add_entry(ADMIN, {"objectClass": "person", "userPassword": "secret"})
+    for i in range(users):
+        conn.strategy.add_entry("cn=user{},{}".format(i, BASE),
+                                {"objectClass": "person", "entryUUID": str(i), "displayName": "User {}".format(i),
+                                 "mail": "user{}@example.org".format(i)})
+    return server
+
+
+def service(server, size):
+    def connect():
+        conn = LatencyConnection(server, user=ADMIN, password="secret", client_strategy=ldap3.MOCK_SYNC)
+        conn.bind()
+        return conn
+
+    ldap = LdapService.__new__(LdapService)
+    ldap._config = {"baseDn": BASE, "objectID": "entryUUID", "enableContacts": False, "groups": None,
+                    "users": {"username": "mail", "displayName": "displayName", "filter": "(objectClass=person)"}}
+    ldap.pool = ConnectionPool("search", connect, size, 60)
+    return ldap
+
+
+def run(ldap, threads, searches, users):
+    def worker(offset):
+        for i in range(offset, searches, threads):
+            results = ldap._search("(entryUUID={})".format(i % users), types=("user",))
+            assert len(results) == 1
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter()-start
+
+
+def main(users=50, threads=8, searches=400, latency=0.01, sizes=(1, 2, 4, 8)):
+    server = directory(users)
+    LatencyConnection.latency = latency
+    print("{} threads, {} searches, {:.1f} ms round-trip".format(threads, searches, latency*1000))
+    for size in sizes:
+        duration = run(service(server, size), threads, searches, users)
+        print("pool size {:<2} {:>8.0f} searches/s".format(size, searches/duration))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2024 grommunio GmbH
+
+"""Compare ranking strategies for matching a list of 50k users (`tools.DataModel.matchRank`).
+
+- unranked: first page of matches in database order, re-ranked by edit distance (previous behavior)
+- database: matches ordered by `matchRank` before the limit is applied, page re-ranked by edit distance
+- python: all matches loaded and ranked by edit distance
+
+Reports the latency and the position of the exact match on the page (- if it was not selected or does not exist).
+Uses an SQLite stand-in of the users table. Run from the repository root with `python -m benchmarks.match_rank`.
+"""
+
+import time
+
+from sqlalchemy import Column, Integer, String, create_engine
+from sqlalchemy.orm import sessionmaker
+
+from orm import declarative_base
+from tools.DataModel import matchRank
+from tools.misc import damerau_levenshtein_distance as dldist
+
+Base = declarative_base()
+
+
+class Users(Base):
+    __tablename__ = "users"
+
+    ID = Column("id", Integer, primary_key=True)
+    username = Column("username", String(320), nullable=False)
+
+
+def seed(count):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(engine)()
+    names = ("anna.john{}@example.org", "john.doe{}@example.org", "max{}@example.org")
+    session.bulk_insert_mappings(Users, [{"ID": i, "username": names[i % 3].format(i)} for i in range(1, count)])
+    session.add(Users(ID=count, username="john"))
+    session.commit()
+    return session
+
+
+def rerank(objects, expr):
+    return sorted(objects, key=lambda obj: dldist(obj.username.lower(), expr))
+
+
+def unranked(session, expr, limit):
+    return rerank(session.query(Users).filter(Users.username.ilike("%"+expr+"%")).limit(limit).all(), expr)
+
+
+def database(session, expr, limit):
+    query = session.query(Users).filter(Users.username.ilike("%"+expr+"%")).order_by(matchRank((Users.username,), expr))
+    return rerank(query.limit(limit).all(), expr)
+
+
+def python(session, expr, limit):
+    return rerank(session.query(Users).filter(Users.username.ilike("%"+expr+"%")).all(), expr)[:limit]
+
+
+def main(count=50000, limit=50, rounds=3):
+    session = seed(count)
+    for expr in ("john", "doe"):
+        for func in (unranked, database, python):
+            duration = None
+            for _ in range(rounds):
+                session.expunge_all()
+                start = time.perf_counter()
+                page = func(session, expr, limit)
+                elapsed = time.perf_counter()-start
+                duration = elapsed if duration is None else min(duration, elapsed)
+            position = next((str(i) for i, obj in enumerate(page) if obj.username == expr), "-")
+            print("{:<17} {:<9} {:>9.1f} ms  exact match at {}".format(expr, func.__name__, duration*1000, position))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2024 grommunio GmbH
+
+"""Measure OpenAPI spec loading and per-request validation with and without the route lookup cache.
+
+Run from the repository root with `python -m benchmarks.openapi_validation`.
+"""
+
+import json
+import time
+import yaml
+
+
+def best(func, rounds):
+    duration = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter()-start
+        duration = elapsed if duration is None else min(duration, elapsed)
+    return duration
+
+
+def startup(rounds=3):
+    with open("res/openapi.yaml", encoding="utf-8") as file:
+        text = file.read()
+    for name, loader in (("SafeLoader", yaml.SafeLoader), ("CSafeLoader", getattr(yaml, "CSafeLoader", None))):
+        if loader is not None:
+            print("{:<28} {:>8.1f} ms".format("load yaml ("+name+")", best(lambda: yaml.load(text, Loader=loader), rounds)*1000))
+    spec = yaml.load(text, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+    dumped = json.dumps(spec)
+    print("{:<28} {:>8.1f} ms".format("load json", best(lambda: json.loads(dumped), rounds)*1000))
+    from api.core import OpenApiCompat
+    print("{:<28} {:>8.1f} ms".format("create validator", best(lambda: OpenApiCompat(json.loads(dumped)), rounds)*1000))
+
+
+def validation(count=2000):
+    from flask import request
+    from api.core import API, validator
+    from endpoints.domain import users  # noqa: F401 - registers routes
+
+    if not hasattr(validator, "routeCache"):
+        print("Route cache not used with this openapi-core version")
+        return
+    for url in ("/api/v1/domains/1/users?level=1&limit=50&sort=username", "/api/v1/domains/1/users/2"):
+        with API.test_request_context(url, method="GET"):
+            for name, cacheSize in (("cached", 1024), ("uncached", 0)):
+                validator.routeCache.clear()
+                validator.routeCacheSize = cacheSize
+                duration = best(lambda: [validator.validateRequest(request) for _ in range(count)], 3)
+                print("{:<26} {:<9} {:>8.1f} µs/request".format(url.split("?")[0], name, duration/count*1e6))
+    del validator.routeCacheSize
+
+
+if __name__ == "__main__":
+    startup()
+    validation()
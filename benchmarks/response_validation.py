@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2024 grommunio GmbH
+
+"""Compare request latency of a user list response across response validation modes (`openapi.responseValidation`).
+
+Measures the time spent in the request thread after the endpoint returned a page of 50 users. In `deferred` mode
+the time until all background validations finished is reported separately.
+Run from the repository root with `python -m benchmarks.response_validation`.
+"""
+
+import time
+
+from itertools import count
+
+URL = "/api/v1/domains/1/users?level=1&limit=50"
+
+
+def page(size=50):
+    return {"data": [{"ID": ID, "username": "user{}@example.org".format(ID), "domainID": 1, "status": 0,
+                      "properties": {"displayname": "User {}".format(ID), "storagequotalimit": 1048576}}
+                     for ID in range(1, size+1)]}
+
+
+def main(requests=500):
+    from flask import request
+    from api import core
+    from endpoints.domain import users  # noqa: F401 - registers routes
+
+    data = page()
+    with core.API.test_request_context(URL, method="GET"):
+        errors = core.validateResponse(request, core.API.make_response((data, 200)))
+        if errors:
+            print("Warning: sample response is not valid:", errors)
+        for mode in ("none", "always", "sampled", "deferred"):
+            counter = count()
+            executor = core.ThreadPoolExecutor(2) if mode == "deferred" else None
+            core._responseExecutor = executor
+            start = time.perf_counter()
+            for _ in range(requests):
+                response = core.API.make_response((data, 200))
+                if mode == "always" or mode == "sampled" and next(counter) % core._responseSampleRate == 0:
+                    core.validateResponse(request, response)
+                elif mode == "deferred":
+                    core.deferResponseValidation(request._get_current_object(), response)
+            duration = time.perf_counter()-start
+            line = "{:<9} {:>8.3f} ms/request".format(mode, duration/requests*1000)
+            if executor is not None:
+                executor.shutdown(wait=True)
+                line += "  (drained after {:.0f} ms, {} dropped)"\
+                    .format((time.perf_counter()-start)*1000, core.Metrics.get("responseValidation").get("dropped", 0))
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2024 grommunio GmbH
+
+"""Compare index assisted matching (`tools.DataModel.matchFilters`) with the previous filter and plain `ilike`.
+
+Uses an SQLite stand-in of the trigram index with 50k objects.
+Run from the repository root with `python -m benchmarks.search_index`.
+"""
+
+import random
+import string
+import time
+import unicodedata
+
+from types import SimpleNamespace
+
+from sqlalchemy import Column, Index, Integer, String, and_, create_engine, func, or_, text
+from sqlalchemy.orm import sessionmaker
+
+from orm import declarative_base
+from tools.DataModel import DataModel, matchFilters
+
+Base = declarative_base()
+
+
+class Item(Base):
+    __tablename__ = "items"
+
+    ID = Column("id", Integer, primary_key=True)
+    username = Column("username", String(320))
+
+
+class Trigram(Base):
+    __tablename__ = "admin_search_index"
+
+    model = Column("model", String(64), primary_key=True)
+    objectID = Column("object_id", Integer, primary_key=True)
+    trigram = Column("trigram", String(3), primary_key=True)
+
+    __table_args__ = (Index("trigram_lookup", "model", "trigram", "object_id"),)
+
+
+def trigrams(text):
+    text = "".join(c for c in unicodedata.normalize("NFKD", str(text).lower()) if not unicodedata.combining(c))
+    return {text[i:i+3] for i in range(len(text)-2)}
+
+
+class SearchIndex:
+    """Stand-in for `orm.search.SearchIndex` operating on the SQLite session."""
+    session = None
+
+    @staticmethod
+    def covers(Model):
+        return True
+
+    @staticmethod
+    def indexed(prop):
+        return True
+
+    @classmethod
+    def candidates(cls, Model, word):
+        grams = trigrams(word)
+        if len(grams) == 0:
+            return None
+        return cls.session.query(Trigram.objectID)\
+            .filter(Trigram.model == Model.__tablename__, Trigram.trigram.in_(grams))\
+            .group_by(Trigram.objectID).having(func.count(Trigram.trigram) == len(grams))
+
+
+def previousFilters(Model, targets, expr):
+    """Filters as created before candidates were only used for fully indexed searches."""
+    filters = []
+    for word in expr.split():
+        indexed = [column.ilike("%"+word+"%") for _, column in targets]
+        candidates = SearchIndex.candidates(Model, word)
+        if candidates is not None:
+            filters.append(and_(or_(*indexed), or_(Model.ID.in_(candidates), ~candidates.exists())))
+        else:
+            filters += indexed
+    return filters
+
+
+def seed(count):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(engine)()
+    rand = random.Random(4711)
+    names = ["{}.{}@{}.org".format("".join(rand.choices(string.ascii_lowercase, k=rand.randint(4, 8))),
+                                   "".join(rand.choices(string.ascii_lowercase, k=rand.randint(5, 10))),
+                                   rand.choice(("example", "grommunio", "company"))) for _ in range(count)]
+    session.bulk_insert_mappings(Item, [{"ID": i, "username": name} for i, name in enumerate(names)])
+    session.bulk_insert_mappings(Trigram, [{"model": "items", "objectID": i, "trigram": gram}
+                                           for i, name in enumerate(names) for gram in trigrams(name)])
+    session.execute(text("ANALYZE"))
+    session.commit()
+    return session
+
+
+def main(count=50000, rounds=5):
+    session = SearchIndex.session = seed(count)
+    targets = [(SimpleNamespace(match="default"), Item.username)]
+    variants = (("ilike", lambda expr: [Item.username.ilike("%"+expr+"%")]),
+                ("previous", lambda expr: previousFilters(Item, targets, expr)),
+                ("matchFilters", lambda expr: matchFilters(Item, targets, expr)))
+    DataModel.searchIndex = SearchIndex
+    sample = session.query(Item.username).filter(Item.ID == count//2).scalar()
+    for expr in (sample[2:9], sample.split("@")[0][-5:], "xq", "zzzzz"):
+        for name, filters in variants:
+            best, result = None, None
+            for _ in range(rounds):
+                start = time.perf_counter()
+                result = session.query(Item.ID).filter(or_(*filters(expr))).all()
+                duration = time.perf_counter()-start
+                best = duration if best is None else min(best, duration)
+            print("{:<18} {:<12} {:>8.2f} ms  ({} matches)".format(expr, name, best*1000, len(result)))
+    DataModel.searchIndex = None
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2024 grommunio GmbH
+
+"""Compare compiled per-level serializers (`DataModel.todict`) with the generic property evaluation.
+
+Serializes 10k objects of a stand-in of the users model at levels 0 to 2.
+Run from the repository root with `python -m benchmarks.serializer`.
+"""
+
+import datetime
+import time
+
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, String
+from sqlalchemy.orm import relationship
+
+from orm import declarative_base
+from tools.DataModel import BoolP, DataModel, Date, Id, Int, RefProp, Text
+
+Base = declarative_base()
+
+
+class Aliases(DataModel, Base):
+    __tablename__ = "aliases"
+
+    aliasname = Column("aliasname", String(128), primary_key=True)
+    mainID = Column("main_id", Integer, ForeignKey("users.id"))
+
+    _dictmapping_ = ((Text("aliasname"),),)
+
+    def __init__(self, aliasname):
+        self.aliasname = aliasname
+
+
+class Users(DataModel, Base):
+    __tablename__ = "users"
+
+    ID = Column("id", Integer, primary_key=True)
+    username = Column("username", String(320))
+    domainID = Column("domain_id", Integer)
+    status = Column("status", Integer)
+    lang = Column("lang", String(32))
+    privilegeBits = Column("privilege_bits", Integer)
+    created = Column("created", DateTime)
+    aliases = relationship(Aliases)
+
+    _dictmapping_ = ((Id(), Text("username", flags="patch")),
+                     (Id("domainID", flags="init"),
+                      Int("status", filter="set", flags="patch"),
+                      Date("created", time=True)),
+                     (Text("lang", match=False, flags="patch"),
+                      BoolP("pop3_imap", flags="patch"),
+                      BoolP("smtp", flags="patch"),
+                      BoolP("changePassword", flags="patch"),
+                      BoolP("privChat", flags="patch"),
+                      BoolP("privFiles", flags="patch"),
+                      RefProp("aliases", flat="aliasname")))
+
+    def __init__(self, ID):
+        self.ID = ID
+        self.username = "user{}@example.org".format(ID)
+        self.domainID = ID % 10
+        self.status = 0
+        self.lang = "en_US"
+        self.privilegeBits = ID
+        self.created = datetime.datetime(2024, 1, 1)
+        self.aliases = [Aliases("alias{}@example.org".format(ID))]
+
+    pop3_imap = property(lambda self: bool(self.privilegeBits & 1))
+    smtp = property(lambda self: bool(self.privilegeBits & 2))
+    changePassword = property(lambda self: bool(self.privilegeBits & 4))
+    privChat = property(lambda self: bool(self.privilegeBits & 8))
+    privFiles = property(lambda self: bool(self.privilegeBits & 16))
+
+
+def generic(obj, level):
+    """Serialization as performed before the serializers were compiled."""
+    propsel = lambda prop: "hidden" not in prop.flags and prop.proxy is None
+    return {prop.key: prop.value(obj) for prop in obj._meta.props(level, propsel)}
+
+
+def main(count=10000, rounds=3):
+    users = [Users(ID) for ID in range(1, count+1)]
+    Users._init()
+    for level in range(3):
+        assert generic(users[0], level) == users[0].todict(level)
+        for name, func in (("generic", lambda obj: generic(obj, level)), ("compiled", lambda obj: obj.todict(level))):
+            duration = None
+            for _ in range(rounds):
+                start = time.perf_counter()
+                for obj in users:
+                    func(obj)
+                elapsed = time.perf_counter()-start
+                duration = elapsed if duration is None else min(duration, elapsed)
+            print("level {}  {:<9} {:>8.1f} ms  ({:.2f} µs/object)".format(level, name, duration*1000, duration/count*1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2024 grommunio GmbH
+
+"""Compare sequential and concurrent embedding of store properties (`Users.embedStorePropertiesBulk`).
+
+Embeds the store properties of a page of users spread over two home servers, using a stub exmdb service that delays
+every request. Requires a database configuration (orm.users cannot be imported otherwise), the database itself is not
+accessed. Run from the repository root with `python -m benchmarks.store_properties [--latency MS]`.
+"""
+
+import argparse
+import time
+
+from types import SimpleNamespace
+
+TAGS = [0x3001001F, 0x3A06001F, 0x3A11001F, 0x3A08001F, 0x3A19001F, 0x0E080014, 0x66A20003]
+
+
+class StubClient:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def getAllStoreProperties(self):
+        time.sleep(self.latency)
+        return TAGS+[0x0FFF0102]  # Binary properties are not fetched
+
+    def getStoreProperties(self, cpid, tags):
+        time.sleep(self.latency)
+        return [SimpleNamespace(tag=tag, val="value") for tag in tags]
+
+
+class StubService:
+    """Replacement for `services.Service` providing the stub exmdb client."""
+    SUPPRESS_ALL = 2
+
+    def __init__(self, latency):
+        self.exmdb = SimpleNamespace(user=lambda store: StubClient(latency))
+
+    def __call__(self, name, *args, **kwargs):
+        return self
+
+    def __enter__(self):
+        return self.exmdb
+
+    def __exit__(self, *args):
+        return False
+
+
+def stubUsers(count):
+    servers = [SimpleNamespace(hostname="mx1"), SimpleNamespace(hostname="mx2")]
+    return [SimpleNamespace(ID=ID, maildir="/var/lib/gromox/user/{}".format(ID), homeserver=servers[ID % 2], properties={})
+            for ID in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--count", type=int, default=100, help="Number of users")
+    parser.add_argument("--latency", type=float, default=2, help="Delay of each exmdb request in milliseconds")
+    args = parser.parse_args()
+
+    from orm import DB
+    if DB is None:
+        raise SystemExit("Database not configured")
+    from orm import users
+    users.Service = StubService(args.latency/1000)
+
+    def sequential(page):
+        for user in page:
+            user._fetchStoreProperties = users.Users._fetchStoreProperties
+            users.Users.embedStoreProperties(user)
+
+    for name, func in (("sequential", sequential), ("concurrent", users.Users.embedStorePropertiesBulk)):
+        page = stubUsers(args.count)
+        start = time.perf_counter()
+        func(page)
+        duration = time.perf_counter()-start
+        assert all(len(user.properties) == len(TAGS) for user in page)
+        print("{:<10} {:>8.1f} ms  ({} users, {:.1f} ms exmdb latency)".format(name, duration*1000, args.count, args.latency))
+
+
+if __name__ == "__main__":
+    main()
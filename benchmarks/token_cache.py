@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2024 grommunio GmbH
+
+"""Compare authenticated requests per second with and without the JWT verification cache (`security.tokenCacheSize`).
+
+Each request runs `api.security.getSecurityContext` for one of 100 active sessions.
+Run from the repository root with `python -m benchmarks.token_cache`.
+"""
+
+import time
+
+
+def main(requests=20000, sessions=100):
+    from api import security
+    from api.core import API
+
+    tokens = [security.mkJWT({"usr": "user{}@example.org".format(i)}) for i in range(sessions)]
+    contexts = [API.test_request_context("/api/v1/status", headers={"Cookie": "grommunioAuthJwt="+token})
+                for token in tokens]
+    for name, size in (("uncached", 0), ("cached", 1024)):
+        security._tokenCache = security._TokenCache(size, 300)
+        start = time.perf_counter()
+        for i in range(requests):
+            with contexts[i % sessions]:
+                assert security.getSecurityContext("basic") is None
+        duration = time.perf_counter()-start
+        print("{:<9} {:>9.0f} requests/s".format(name, requests/duration))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2024 grommunio GmbH
+
+"""Compare user creation throughput of `Users.create` and `Users.createBatch`.
+
+Creates users with stores in the given domain of the configured installation and deletes them afterwards.
+Only run this on a test system. Run from the repository root with
+`python -m benchmarks.user_creation <domain> [--count N] [--chunk-size N]`.
+"""
+
+import argparse
+import shutil
+import time
+import uuid
+
+
+def cleanup(users):
+    from orm import DB
+    from services import Service
+    for user in users:
+        maildir = user.maildir
+        with Service("exmdb", errors=Service.SUPPRESS_INOP) as exmdb:
+            exmdb.user(user).unloadStore()
+        user.delete(False)
+        DB.session.commit()
+        if maildir:
+            shutil.rmtree(maildir, ignore_errors=True)
+
+
+def entries(domain, mode, count):
+    tag = uuid.uuid4().hex[:8]
+    return [{"username": "bench-{}-{}-{}@{}".format(mode, tag, i, domain.domainname), "domainID": domain.ID,
+             "properties": {"displayname": "Benchmark user {}".format(i)}} for i in range(count)]
+
+
+def single(domain, count, chunkSize):
+    from orm.users import Users
+    results = [Users.create(props) for props in entries(domain, "single", count)]
+    return [user for user, code in results if code == 201]
+
+
+def batch(domain, count, chunkSize):
+    from orm.users import Users
+    return [user for _, user, code in Users.createBatch(entries(domain, "batch", count), chunkSize) if code == 201]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("domain", help="Name of the domain to create users in")
+    parser.add_argument("--count", type=int, default=200, help="Number of users to create per mode")
+    parser.add_argument("--chunk-size", type=int, default=100, help="Chunk size of the batch creation")
+    args = parser.parse_args()
+
+    from orm import DB
+    if DB is None or DB.testConnection() is not None:
+        raise SystemExit("Database not available")
+    from orm.domains import Domains
+    domain = Domains.query.filter(Domains._domainname == args.domain).first()
+    if domain is None:
+        raise SystemExit("Domain '{}' not found".format(args.domain))
+    for func in (single, batch):
+        start = time.perf_counter()
+        users = func(domain, args.count, args.chunk_size)
+        duration = time.perf_counter()-start
+        print("{:<7} {:>5} of {} users in {:>7.1f} s  ({:.1f} users/s)"
+              .format(func.__name__, len(users), args.count, duration, len(users)/duration))
+        cleanup(users)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2024 grommunio GmbH
+
+"""Compare lazy and batched loading of user properties for a page of 1000 users (`Users.optimize_query`).
+
+Uses an SQLite stand-in of the users and user_properties tables with 20 properties per user and reports the time
+and number of queries needed to load the page and access all properties. As SQLite runs in-process, the round trip
+to a database server is emulated by delaying every query.
+Run from the repository root with `python -m benchmarks.user_page`.
+"""
+
+import time
+
+from sqlalchemy import Column, ForeignKey, Integer, String, create_engine, event
+from sqlalchemy.orm import relationship, selectinload, sessionmaker
+
+from orm import declarative_base
+
+Base = declarative_base()
+
+
+class UserProperties(Base):
+    __tablename__ = "user_properties"
+
+    userID = Column("user_id", Integer, ForeignKey("users.id"), primary_key=True)
+    tag = Column("proptag", Integer, primary_key=True)
+    orderID = Column("order_id", Integer)
+    propvalstr = Column("propval_str", String(64))
+
+
+class Users(Base):
+    __tablename__ = "users"
+
+    ID = Column("id", Integer, primary_key=True)
+    username = Column("username", String(320))
+    _properties = relationship(UserProperties, order_by=UserProperties.orderID)
+
+
+def seed(users, props):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(engine)()
+    session.bulk_insert_mappings(Users, [{"ID": ID, "username": "user{}@example.org".format(ID)} for ID in range(users)])
+    session.bulk_insert_mappings(UserProperties, [{"userID": ID, "tag": tag, "orderID": 1, "propvalstr": str(tag)}
+                                                  for ID in range(users) for tag in range(props)])
+    session.commit()
+    return session, engine
+
+
+def main(users=1000, props=20, rounds=5):
+    session, engine = seed(users, props)
+    statements, latency = [], [0]
+
+    def execute(conn, cursor, statement, *args):
+        statements.append(statement)
+        time.sleep(latency[0])
+
+    event.listen(engine, "before_cursor_execute", execute)
+    for latency[0], name, options in ((0, "lazy", ()), (0, "selectinload", (selectinload(Users._properties),)),
+                                      (0.0002, "lazy", ()), (0.0002, "selectinload", (selectinload(Users._properties),))):
+        duration = None
+        for _ in range(rounds):
+            session.expunge_all()
+            statements.clear()
+            start = time.perf_counter()
+            page = session.query(Users).options(*options).order_by(Users.ID).limit(users).all()
+            loaded = sum(len(user._properties) for user in page)
+            elapsed = time.perf_counter()-start
+            duration = elapsed if duration is None else min(duration, elapsed)
+        assert loaded == users*props
+        print("{:<13} {:>8.1f} ms  {:>5} queries  ({:.1f} ms round trip)"
+              .format(name, duration*1000, len(statements), latency[0]*1000))
+
+
+if __name__ == "__main__":
+    main()
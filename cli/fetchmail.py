@@ -78,10 +78,11 @@ def cliCreateFetchmail(args):
 def cliDeleteFetchmail(args):
     cli = args._cli
     cli.require("DB")
-    from orm import DB
+    from orm import DB, bulkDelete
     from orm.users import Fetchmail
-    fmls = Fetchmail.query.filter(Fetchmail.ID == args.mbspec if args.mbspec.isdigit() else
-                                  Fetchmail.mailbox.ilike(args.mbspec+"%")).all()
+    query = Fetchmail.query.filter(Fetchmail.ID == args.mbspec if args.mbspec.isdigit() else
+                                   Fetchmail.mailbox.ilike(args.mbspec+"%"))
+    fmls = query.with_entities(Fetchmail.ID, Fetchmail.mailbox).all()
     if len(fmls) == 0:
         cli.print(cli.col("Fetchmail entry not found.", "yellow"))
         return 1
@@ -90,14 +91,13 @@ def cliDeleteFetchmail(args):
         if cli.confirm(prompt) != Cli.SUCCESS:
             return 2
     try:
-        for fml in fmls:
-            DB.session.delete(fml)
+        _, affected = bulkDelete(query.filter(Fetchmail.ID.in_([fml.ID for fml in fmls])))
         DB.session.commit()
     except BaseException as err:
         cli.print(cli.col("Deletion failed: "+" - ".join(str(arg) for arg in err.args), "red"))
         DB.session.rollback()
         return 4
-    cli.print("{} entr{} deleted.\n".format(len(fmls), "y" if len(fmls) == 1 else "ies")+
+    cli.print("{} entr{} deleted.\n".format(affected, "y" if affected == 1 else "ies")+
               cli.col("Entry deletion will not be handled automatically, consider running ", "yellow")+
               cli.col("write-rc -f", "yellow", attrs=["bold", "dark"])+
               cli.col(" to manually update the configuration.", "yellow"))
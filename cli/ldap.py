@@ -123,8 +123,8 @@ def cliLdapInfo(args):
     from services import Service
     for orgID in _getOrgIDs(args):
         with Service("ldap", orgID, errors=Service.SUPPRESS_INOP) as ldap:
-            cli.print("Successfully connected to {}:{} as {}".format(cli.col(ldap.conn.server.host, attrs=["bold"]),
-                                                                     cli.col(ldap.conn.server.port, attrs=["dark"]),
+            cli.print("Successfully connected to {}:{} as {}".format(cli.col(ldap.server.host, attrs=["bold"]),
+                                                                     cli.col(ldap.server.port, attrs=["dark"]),
                                                                      ldap._config["connection"].get("bindUser", "<anonymous>")))
 
 
@@ -239,14 +239,17 @@ def _import(args, candidate, ldap, orgID, **kwargs):
 
 def _syncGroupMembers(args, orgID, groupID=None):
     from services import Service
-    from tools.ldap import syncGroupMembers
+    from tools.ldap import syncAllGroupMembers, syncGroupMembers
     cli = args._cli
 
     with Service("ldap", orgID) as ldap:
-        ldapgroups = [ldap.getUserInfo(groupID)] if groupID else ldap.searchUsers(types=("group",))
-        for ldapgroup in ldapgroups:
-            cli.print(f"Synchronizing members of group {ldapgroup.email}...", end="", flush=True)
-            add, remove = syncGroupMembers(orgID, ldapgroup, ldap)
+        if groupID:
+            ldapgroup = ldap.getUserInfo(groupID)
+            results = [(ldapgroup.email, *syncGroupMembers(orgID, ldapgroup, ldap))]
+        else:
+            results = syncAllGroupMembers(orgID, ldap)
+        for email, add, remove in results:
+            cli.print(f"Synchronizing members of group {email}...", end="")
             if None in (add, remove):
                 cli.print(cli.col("group not found", attrs=["dark"]))
             else:
@@ -261,13 +264,16 @@ def _downsyncOrg(args, orgID, ldap, resCount):
     if len(domainnames) == 0:
         cli.print(cli.col("Organization '{}' has no domains - skipping.".format(_getOrgName(orgID)), "yellow"))
         return (0, 0)
+    from sqlalchemy.orm import selectinload
+    from tools.ldap import downsyncUsers
     synced = set()
-    for user in Users.query.filter(Users.orgID == orgID, Users.externID != None):
-        result = _downsync(args, user)
+    users = Users.query.filter(Users.orgID == orgID, Users.externID != None).options(selectinload(Users._properties))
+    for user, message, code in downsyncUsers(users.all()):
+        cli.print("Synchronizing {}...{}".format(user.username, cli.col(message, "green" if _isSuccess(code) else "red")))
         if user.status != Users.CONTACT:
             synced.add(user.externID)
-        resCount.success += result
-        resCount.failed += not result
+        resCount.success += _isSuccess(code)
+        resCount.failed += not _isSuccess(code)
 
     if args.complete:
         from services import Service
@@ -303,24 +309,73 @@ def _downsyncSpecific(args, orgIDs, resCount):
                 resCount.failed += of
 
 
+class _BufferedCli:
+    """Cli proxy collecting printed output in a buffer."""
+    def __init__(self, cli):
+        from io import StringIO
+        self._cli = cli
+        self.buffer = StringIO()
+
+    def __getattr__(self, name):
+        return getattr(self._cli, name)
+
+    def print(self, msg="", *args, **kwargs):
+        self._cli.print(msg, *args, file=self.buffer, **kwargs)
+
+
+def _downsyncOrgChecked(args, orgID, resCount):
+    from services import Service, ServiceUnavailableError
+    cli = args._cli
+    try:
+        with Service("ldap", orgID, errors=Service.SUPPRESS_INOP) as ldap:
+            _downsyncOrg(args, orgID, ldap, resCount)
+    except ServiceUnavailableError:
+        cli.print(cli.col(f"Failed to synchronize organization #{orgID} - service unavailable"))
+
+
+def _downsyncOrgParallel(args, orgID):
+    from argparse import Namespace
+    from orm import DB
+    from tools.misc import GenericObject
+    import time
+    orgArgs = Namespace(**vars(args))
+    orgArgs._cli = _BufferedCli(args._cli)
+    resCount = GenericObject(success=0, failed=0)
+    start = time.time()
+    try:
+        _downsyncOrgChecked(orgArgs, orgID, resCount)
+    finally:
+        DB.session.remove()
+    return orgArgs._cli.buffer.getvalue(), resCount, time.time()-start
+
+
 def cliLdapDownsync(args):
     cli = args._cli
     cli.require("DB")
     from orm.users import Aliases, Users
-    from services import Service, ServiceUnavailableError
+    from tools.config import Config
     from tools.misc import GenericObject
     Aliases.NTactive(False)
     Users.NTactive(False)
     orgIDs = _getOrgIDs(args)
     resCount = GenericObject(success=0, failed=0)
     _downsyncSpecific(args, orgIDs, resCount)
-    if not resCount.success+resCount.failed:
+    jobs = args.jobs or Config["options"].get("ldapSyncThreads", 4)
+    if resCount.success+resCount.failed:
+        pass
+    elif jobs <= 1 or len(orgIDs) <= 1:
         for orgID in orgIDs:
-            try:
-                with Service("ldap", orgID, errors=Service.SUPPRESS_INOP) as ldap:
-                    _downsyncOrg(args, orgID, ldap, resCount)
-            except ServiceUnavailableError:
-                cli.print(cli.col(f"Failed to synchronize organization #{orgID} - service unavailable"))
+            _downsyncOrgChecked(args, orgID, resCount)
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(min(jobs, len(orgIDs)), thread_name_prefix="LDAP sync") as executor:
+            futures = [(orgID, executor.submit(_downsyncOrgParallel, args, orgID)) for orgID in orgIDs]
+            for orgID, future in futures:
+                output, orgCount, duration = future.result()
+                cli.print(output, end="")
+                cli.print(cli.col("Synchronized {} in {:.1f}s".format(_getOrgName(orgID), duration), attrs=["dark"]))
+                resCount.success += orgCount.success
+                resCount.failed += orgCount.failed
     Aliases.NTactive(True)
     Users.NTactive(True)
     cli.print(cli.col("{} synchronized, {} failed".format(resCount.success, resCount.failed), attrs=["dark"]))
@@ -365,6 +420,7 @@ def cliLdapCheck(args):
     from time import time
     from orm import DB
     from orm.users import Users
+    from tools.ldap import checkLinkedUsers
     users = Users.query.filter(Users.externID != None, *_userOrgFilter(args))\
                        .with_entities(Users.ID, Users.username, Users.externID, Users.maildir, Users.orgID).all()
     if len(users) == 0:
@@ -373,18 +429,15 @@ def cliLdapCheck(args):
     cli.print("Checking {} user{}...".format(len(users), "" if len(users) == 1 else "s"))
     count, last = 0, time()
     orphaned = []
-    for user in users:
-        try:
-            with Service("ldap", user.orgID) as ldap:
-                if ldap.getUserInfo(user.externID) is None:
-                    orphaned.append(user)
-                count += 1
-                if time()-last > 1:
-                    last = time()
-                    cli.print("\t{}/{} checked ({:.0f}%), {} orphaned"
-                              .format(count, len(users), count/len(users)*100, len(orphaned)))
-        except ServiceUnavailableError:
+    for checked, chunkOrphaned, failed in checkLinkedUsers(users):
+        count += len(checked)
+        orphaned += chunkOrphaned
+        for user in failed:
             cli.print(cli.col("\tFailed to check user '"+user.username+"' - LDAP not available", "red"))
+        if time()-last > 1:
+            last = time()
+            cli.print("\t{}/{} checked ({:.0f}%), {} orphaned"
+                      .format(count, len(users), count/len(users)*100, len(orphaned)))
     if len(orphaned) == 0:
         cli.print("Everything is ok")
         return
@@ -604,6 +657,7 @@ def _cliLdapParserSetup(subp: ArgumentParser):
                                                   "LDAP object are updated.")
     downsync.add_argument("-c", "--complete", action="store_true", help="Import/update all users in the ldap tree")
     downsync.add_argument("-f", "--force", action="store_true", help="Force synchronization of unassociated users")
+    downsync.add_argument("-j", "--jobs", type=int, help="Maximum number of organizations to synchronize concurrently")
     downsync.add_argument("-l", "--lang", help="Default language for imported users")
     downsync.add_argument("-o", "--organization", metavar="ORGSPEC", action="append",
                           help="Use organization specific LDAP connection").completer = _cliOrgspecCompleter
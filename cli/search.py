@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2024 grommunio GmbH
+
+from . import Cli, InvalidUseError
+from argparse import ArgumentParser
+
+
+def cliSearchRebuild(args):
+    cli = args._cli
+    cli.require("DB")
+    from orm import DB
+    from orm.search import SearchIndex
+    from tools.config import Config
+    models = args.model or sorted(SearchIndex.models)
+    for name in models:
+        cli.print("Rebuilding search index of {}...".format(cli.col(name, attrs=["bold"])), end="", flush=True)
+        try:
+            count = SearchIndex.rebuild(SearchIndex.models[name], args.chunk_size)
+            DB.session.commit()
+        except Exception as err:
+            DB.session.rollback()
+            cli.print(cli.col("failed: "+" - ".join(str(arg) for arg in err.args), "red"))
+            return 1
+        cli.print("done ({} object{})".format(count, "" if count == 1 else "s"))
+    if not Config["options"].get("searchIndex"):
+        cli.print(cli.col("Search index is not enabled, set options.searchIndex to use it", "yellow"))
+
+
+def _setupCliSearchParser(subp: ArgumentParser):
+    Cli.parser_stub(subp)
+    sub = subp.add_subparsers()
+    rebuild = sub.add_parser("rebuild", help="Create and fill search index")
+    rebuild.description = "Create the search index table if necessary and rebuild the index from the current data"
+    rebuild.set_defaults(_handle=cliSearchRebuild)
+    rebuild.add_argument("-m", "--model", action="append", choices=("domains", "users"),
+                         help="Only rebuild index of specified objects")
+    rebuild.add_argument("-c", "--chunk-size", type=int, default=1000, metavar="SIZE",
+                         help="Number of objects to process at once (default 1000)")
+
+
+@Cli.command("search", _setupCliSearchParser, help="Search index management")
+def cliSearchStub(args):
+    raise InvalidUseError()
@@ -128,7 +128,7 @@ def _getUser(args, requireMailbox=False):
 
 def _splitData(args):
     cli = args["_cli"]
-    cliargs = {"_handle", "_cli", "userspec", "no_defaults"}
+    cliargs = {"_handle", "_cli", "userspec", "no_defaults", "from_file", "chunk_size"}
     data = {}
     attributes = data["attributes"] = {key: value for key, value in args.items() if value is not None and key not in cliargs}
     if "storeprop" in attributes or "remove_storeprop" in attributes:
@@ -235,27 +235,88 @@ def cliUserList(args):
     cli.print("({} users total)".format(len(users)))
 
 
+def _userDefaults(username, cache):
+    """Load configured default values for a new user.
+
+    Parameters
+    ----------
+    username : str
+        Name of the user. Domain defaults are applied if it contains a domain part.
+    cache : dict
+        Dictionary used to cache the defaults between calls
+
+    Returns
+    -------
+    dict
+        Default user values
+    """
+    from orm.domains import Domains
+    from orm.misc import DBConf
+    from tools.misc import RecursiveDict
+    import copy
+    domainname = username.split("@", 1)[1] if "@" in username else None
+    if domainname not in cache:
+        if None not in cache:
+            cache[None] = DBConf.getFile("grommunio-admin", "defaults-system", True).get("user", RecursiveDict())
+        defaults = copy.deepcopy(cache[None])
+        if domainname is not None:
+            domain = Domains.query.filter(Domains.domainname == domainname).with_entities(Domains.ID).first()
+            if domain is not None:
+                defaults.update(DBConf.getFile("grommunio-admin", "defaults-domain-"+str(domain.ID), True).get("user", {}))
+        cache[domainname] = defaults
+    return copy.deepcopy(cache[domainname])
+
+
+def _cliUserCreateBatch(args, common):
+    import json
+    import sys
+    cli = args._cli
+    from orm.users import Users
+    defaults = {}
+    entries = []
+    with (sys.stdin if args.from_file == "-" else open(args.from_file)) as file:
+        for lineno, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError as err:
+                cli.print(cli.col("Invalid entry in line {}: {}".format(lineno, err.args[0]), "red"))
+                return 2
+            if not isinstance(entry, dict) or not isinstance(entry.get("username"), str):
+                cli.print(cli.col("Invalid entry in line {}: Missing username".format(lineno), "red"))
+                return 2
+            props = {} if args.no_defaults else _userDefaults(entry["username"], defaults)
+            props.update(common)
+            props.update(entry)
+            props["properties"] = dict(common["properties"], **entry.get("properties", {}))
+            entries.append(props)
+    created = failed = 0
+    for index, result, code in Users.createBatch(entries, args.chunk_size):
+        if code == 201:
+            created += 1
+            cli.print("{}:\t{}".format(result.ID, cli.col(result.username, attrs=["bold"])))
+        else:
+            failed += 1
+            cli.print(cli.col("Could not create user '{}': {}".format(entries[index]["username"], result), "red"))
+    cli.print("{} users created, {} failed.".format(created, failed))
+    return 1 if failed else 0
+
+
 def cliUserCreate(args):
     cli = args._cli
     cli.require("DB")
     from orm.domains import Domains
-    from orm.misc import DBConf
     from orm.users import DB, Users
-    from tools.misc import RecursiveDict
-    if args.no_defaults:
-        props = {}
-    else:
-        props = DBConf.getFile("grommunio-admin", "defaults-system", True).get("user", RecursiveDict())
-        if "@" in args.username:
-            domain = Domains.query.filter(Domains.domainname == args.username.split("@", 1)[1]).with_entities(Domains.ID).first()
-            if domain is not None:
-                props.update(DBConf.getFile("grommunio-admin", "defaults-domain-"+str(domain.ID), True).get("user", {}))
+    if args.username is None and args.from_file is None:
+        cli.print(cli.col("Either username or --from-file is required.", "red"))
+        return 2
     data = _splitData(args.__dict__)
-    props.update(data["attributes"])
-    props["username"] = args.username
-    props["aliases"] = data["aliases"]
-    props["altnames"] = data["altnames"]
-    properties = data["properties"] = {}
+    common = data["attributes"]
+    common.pop("username", None)
+    common["aliases"] = data["aliases"]
+    common["altnames"] = data["altnames"]
+    properties = common["properties"] = {}
     if args.domain:
         from .common import domainCandidates
         domain = domainCandidates(args.domain).with_entities(Domains.ID).all()
@@ -265,13 +326,17 @@ def cliUserCreate(args):
         if len(domain) != 1:
             cli.print(cli.col("Domain specification is ambiguous.", "red"))
             return 3
-        props["domainID"] = domain[0].ID
+        common["domainID"] = domain[0].ID
 
     for pv in data["props"]:
         if "=" in pv:
             prop, val = pv.split("=", 1)
             properties[prop] = val
-    props["properties"] = properties
+    if args.from_file is not None:
+        return _cliUserCreateBatch(args, common)
+    props = {} if args.no_defaults else _userDefaults(args.username, {})
+    props.update(common)
+    props["username"] = args.username
     result, code = Users.mkContact(props) if props.get("status", 0) == Users.CONTACT else Users.create(props)
     if code != 201:
         cli.print(cli.col("Could not create user: "+result, "red"))
@@ -430,6 +495,7 @@ def cliUserDevicesShow(args):
 
 
 def cliUserDevicesRemoveResync(args):
+    from orm import bulkDelete
     from orm.users import DB, UserDevices
     from services import Service
     from tools.config import Config
@@ -444,7 +510,7 @@ def cliUserDevicesRemoveResync(args):
         if args.action == "remove" and not args.device:
             client.removeSyncStates(Config["sync"]["syncStateFolder"])
             cli.print(cli.col("Removed all devices", "green"))
-            UserDevices.query.filter(UserDevices.userID == user.ID).delete()
+            bulkDelete(UserDevices.query.filter(UserDevices.userID == user.ID))
             DB.session.commit()
             return
 
@@ -453,11 +519,13 @@ def cliUserDevicesRemoveResync(args):
         for device in devices:
             if args.action == "remove":
                 client.removeDevice(Config["sync"]["syncStateFolder"], device)
-                UserDevices.query.filter(UserDevices.userID == user.ID, UserDevices.deviceID == device).delete()
                 cli.print(f"Removed {device}")
             else:
                 client.resyncDevice(Config["sync"]["syncStateFolder"], device, user.ID)
                 cli.print(f"Removed states of {device}")
+        if args.action == "remove" and devices:
+            bulkDelete(UserDevices.query.filter(UserDevices.userID == user.ID, UserDevices.deviceID.in_(devices)))
+            DB.session.commit()
 
 
 def cliUserDeviceWipe(args):
@@ -496,7 +564,7 @@ def cliUserDeviceWipe(args):
 def cliUserModify(args):
     cli = args._cli
     cli.require("DB")
-    from orm import DB
+    from orm import DB, bulkDelete
     from orm.users import Aliases, Altnames
     ret, user = _getUser(args)
     if ret:
@@ -523,7 +591,8 @@ def cliUserModify(args):
             existing = {a.aliasname for a in user.aliases}
             [Aliases(alias, user) for alias in data["aliases"] if alias not in existing]
         if data["aliases_rm"]:
-            user.aliases = [alias for alias in user.aliases if alias.aliasname not in data["aliases_rm"]]
+            bulkDelete(Aliases.query.filter(Aliases.mainname == user.username, Aliases.aliasname.in_(data["aliases_rm"])))
+            DB.session.expire(user, ["aliases"])
         if data["altnames"]:
             existing = {a.altname for a in user.altnames}
             [Altnames(altname, user) for altname in data["altnames"] if altname["altname"] not in existing]
@@ -715,8 +784,12 @@ def _setupCliUser(subp: ArgumentParser):
     Cli.parser_stub(subp)
     sub = subp.add_subparsers()
     create = sub.add_parser("create",  help="Create user")
-    create.add_argument("username", help="E-Mail address of the user")
+    create.add_argument("username", nargs="?", help="E-Mail address of the user")
     create.add_argument("--no-defaults", action="store_true", help="Do not apply configured default values")
+    create.add_argument("--from-file", metavar="FILE",
+                        help="Create users from file containing one JSON object per line ('-' for stdin)")
+    create.add_argument("--chunk-size", type=int, default=100, metavar="SIZE",
+                        help="Number of users to insert at once when creating from file (default 100)")
     create.set_defaults(_handle=cliUserCreate)
     _cliAddUserAttributes(create)
     userListFileParser(sub, "delegates", "delegate", cliUserManageFileList)
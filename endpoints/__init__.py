@@ -4,15 +4,139 @@
 
 __all__ = ["domain", "system", "defaults", "misc", "service", "tasq"]
 
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from flask import request, jsonify
 from orm import DB
 from tools.DataModel import MissingRequiredAttributeError, InvalidAttributeError, MismatchROError
+from tools.config import Config
+from tools.metrics import Metrics
 from tools.misc import damerau_levenshtein_distance as dldist
+import json
 import re
+import time
 
 from sqlalchemy.exc import IntegrityError
 
 matchStringRe = re.compile(r"([\w\-]*)")
+_cardinalityCache = {}
+
+
+def _encodeCursor(values):
+    """Encode key values into an opaque pagination cursor."""
+    return urlsafe_b64encode(json.dumps(values, default=str, separators=(",", ":")).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decodeCursor(cursor):
+    """Decode pagination cursor.
+
+    Parameters
+    ----------
+    cursor : str
+        Cursor as created by `_encodeCursor`. An empty string denotes the first page.
+
+    Raises
+    ------
+    ValueError
+        The cursor is malformed
+
+    Returns
+    -------
+    list
+        Key values or None for the first page
+    """
+    if len(cursor) == 0:
+        return None
+    try:
+        values = json.loads(urlsafe_b64decode(cursor+"="*(-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def _nextCursor(objects, limit, sorts):
+    """Create cursor pointing after the last object or None if there are no more results."""
+    if limit is None or len(objects) < int(limit) or len(objects) == 0:
+        return None
+    return _encodeCursor(objects[-1].keysetValues(sorts))
+
+
+def _tableCardinality(Model):
+    """Get estimated number of rows in the table of the model.
+
+    Uses the table statistics of the database. Results are cached for `options.countEstimateCacheTime` seconds.
+    """
+    from sqlalchemy import text
+    table = Model.__tablename__
+    now = time.monotonic()
+    cached = _cardinalityCache.get(table)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+    rows = DB.session.execute(text("SELECT `TABLE_ROWS` FROM `information_schema`.`TABLES` "
+                                   "WHERE `TABLE_SCHEMA` = DATABASE() AND `TABLE_NAME` = :table"),
+                              {"table": table}).scalar()
+    rows = int(rows) if rows is not None else None
+    _cardinalityCache[table] = (now+Config["options"].get("countEstimateCacheTime", 300), rows)
+    return rows
+
+
+def _estimatable(Model):
+    """Check whether the table size estimate can be used as the result count of the current request.
+
+    The estimate covers the whole table, so it is only used for unfiltered lists requested by system administrators.
+    """
+    from tools.permissions import SystemAdminROPermission
+    Model._init()
+    if any(arg in request.args for arg in ("match", "filterProp")) or \
+       any(prop.key in request.args for prop in Model._meta.filters):
+        return False
+    user = (getattr(request, "auth", None) or {}).get("user")
+    return user is not None and SystemAdminROPermission() in user.permissions()
+
+
+def countQuery(Model, query, mode=None, scoped=False):
+    """Count results of a list query.
+
+    Parameters
+    ----------
+    Model : SQLAlchemy model with DataModel extension
+        Model the query operates on
+    query : Query
+        Query to count
+    mode : str, optional
+        Count mode. `exact` runs a count query, `estimate` returns the (cached) estimated number of rows in the table
+        and `none` skips counting. If None, the 'count' request parameter is used (default `exact`).
+        `estimate` falls back to `exact` unless the list is unfiltered and requested by a system administrator.
+    scoped : bool, optional
+        Whether the query is restricted to a subset of the table (e.g. a domain). The default is False.
+
+    Raises
+    ------
+    ValueError
+        Invalid count mode
+
+    Returns
+    -------
+    int
+        Number of results or None if not counted
+    """
+    mode = request.args.get("count", "exact") if mode is None else mode
+    if mode == "estimate" and (scoped or not _estimatable(Model)):
+        Metrics.inc("listCount", "estimateRejected")
+        mode = "exact"
+    start = time.monotonic()
+    if mode == "exact":
+        count = query.count()
+    elif mode == "estimate":
+        count = _tableCardinality(Model)
+    elif mode == "none":
+        count = None
+    else:
+        raise ValueError("Invalid count mode '{}'".format(mode))
+    Metrics.inc("listCount", mode)
+    Metrics.inc("listCount", mode+"Time", time.monotonic()-start)
+    return count
 
 
 def defaultListQuery(Model, filters=(), order=None, result="response", automatch=True, autofilter=True, autosort=True,
@@ -21,13 +145,19 @@ def defaultListQuery(Model, filters=(), order=None, result="response", automatch
 
     Automatically uses 'limit' (50), 'offset' (0) and 'level' (1) parameters from the request.
 
+    If the 'after' parameter is present, keyset pagination is used instead of 'offset'. The parameter contains the
+    cursor returned in the 'next' field of the previous page (or an empty string for the first page). Cursor pagination
+    only supports sorting by attributes of the model itself and disables match ranking.
+
+    The 'count' parameter selects how the total number of results is determined (see `countQuery`).
+
     The return value can be influenced by `result`: `list` will return a list ob objects, while the default `response`
     will return the complete JSON encoded flask response.
 
     If `automatch` is enabled, the results are filtered by prefix-matching each word against the configured columns. If no
     other sorting is active (`order` is None and no "sort" query parameter is given), the results are ranked by the
-    Damerau-Levenshtein distance to the search term. Note that ranking is done after the query and a low `limit` parameter
-    may prevent a good match from being selected at all.
+    database according to exact, prefix and substring matches. If `options.matchRerank` is enabled, the returned page is
+    additionally re-ranked by the Damerau-Levenshtein distance to the search term.
 
     Parameters
     ----------
@@ -61,24 +191,42 @@ def defaultListQuery(Model, filters=(), order=None, result="response", automatch
     offset = request.args.get("offset", "0")
     if len(offset) == 0:
         offset = None
+    cursor = request.args.get("after")
+    sorts = request.args.getlist("sort") if autosort else []
     verbosity = int(request.args.get("level", 1))
     query = (Model.optimized_query(verbosity) if query is None else Model.optimize_query(query, verbosity)).filter(*filters)
-    if autosort:
-        query = Model.autosort(query, request.args.getlist("sort"))
+    if cursor is not None:
+        try:
+            if order is not None:
+                raise ValueError("Cursor pagination not supported for this query")
+            query = Model.keyset(query, sorts, _decodeCursor(cursor))
+        except ValueError as err:
+            if result != "response":
+                raise
+            return jsonify(message=err.args[0]), 400
+        offset = None
+    elif autosort:
+        query = Model.autosort(query, sorts)
     if order is not None:
         query = query.order_by(*(order if type(order) in (list, tuple) else (order,)))
     if autofilter:
         query = Model.autofilter(query, request.args)
+    rank = order is None and "sort" not in request.args and automatch and "match" in request.args and cursor is None
     if automatch and "match" in request.args:
         matchStr = request.args["match"].lower()
         fields = set(request.args["matchFields"].split(",")) if "matchFields" in request.args else None
-        query = Model.automatch(query, request.args["match"], fields)
-    count = query.count() if include_count else None
+        query = Model.automatch(query, request.args["match"], fields, rank)
+    try:
+        count = countQuery(Model, query, scoped=len(filters) > 0) if include_count else None
+    except ValueError as err:
+        if result != "response":
+            raise
+        return jsonify(message=err.args[0]), 400
     if result == "query":
         return query, limit, offset, count
     query = query.limit(limit).offset(offset)
     objects = query.all()
-    if order is None and "sort" not in request.args and automatch and "match" in request.args:
+    if rank and Config["options"].get("matchRerank", True):
         scored = ((min(dldist(str(field).lower(), matchStr) for field in obj.matchvalues(fields) if field is not None), obj)
                   for obj in objects)
         objects = [so[1] for so in sorted(scored, key=lambda entry: entry[0])]
@@ -88,8 +236,10 @@ def defaultListQuery(Model, filters=(), order=None, result="response", automatch
     if result == "data":
         return data
     resp = dict(data=data)
-    if include_count:
+    if include_count and count is not None:
         resp[include_count] = count
+    if cursor is not None:
+        resp["next"] = _nextCursor(objects, limit, sorts)
     return jsonify(resp)
 
 
@@ -248,29 +398,31 @@ def defaultBatchDelete(Model, filters=()):
 
     If an ID is not found, it is ignored.
     If deletion of the object would violate database constraints, a HTTP 400 error is returned.
+    Objects are deleted with `orm.bulkDelete`.
 
     Parameters
     ----------
     Model : SQLAlchemy model with DataModel extension
         Model to delete from.
+    filters : iterable, optional
+        Additional filter expressions restricting the deletable objects. The default is ().
 
     Returns
     -------
     Response
-        Flask response containing the new object data or an error message.
+        Flask response containing the deleted IDs and number of affected rows, or an error message.
     """
+    from orm import bulkDelete
     if "ID" not in request.args:
         return jsonify(message="Missing ID list"), 400
     IDs = request.args["ID"].split(",")
-    objs = Model.query.filter(Model.ID.in_(IDs), *filters).all()
-    IDs = [obj.ID for obj in objs]
     try:
-        for obj in objs:
-            DB.session.delete(obj)
+        IDs, affected = bulkDelete(Model.query.filter(Model.ID.in_(IDs), *filters))
         DB.session.commit()
     except IntegrityError as err:
+        DB.session.rollback()
         return jsonify(message="Object deletion would violate database constraints", error=err.args[0]), 400
-    return jsonify(message="Delete successful.", deleted=IDs)
+    return jsonify(message="Delete successful.", deleted=IDs, affected=affected)
 
 
 def defaultListHandler(Model, filters=(), order=None, result="response", automatch=True, autofilter=True, autosort=True,
@@ -355,30 +507,44 @@ def userQuery(domainID=None):
         JSON response containing user data
     """
     from sqlalchemy import or_, String
-    from sqlalchemy.orm import aliased
+    from sqlalchemy.orm import aliased, selectinload
     from orm.users import Users, UserProperties
     from tools.constants import PropTags
-    from tools.DataModel import DataModel
-    from tools.misc import createMapping
+    from tools.DataModel import DataModel, matchFilters, matchRank
 
     Users._init()
     verbosity = int(request.args.get("level", 1))
     filters = (Users.domainID == domainID,) if domainID is not None else ()
     filters += (Users.ID > 0,)
-    query, limit, offset, _ = defaultListHandler(Users, filters=filters, result="query", include_count=None, automatch=False)
+    try:
+        query, limit, offset, _ = defaultListHandler(Users, filters=filters, result="query", include_count=None,
+                                                     automatch=False)
+    except ValueError as err:
+        return jsonify(message=err.args[0]), 400
+    propJoins = {}
+
+    def propJoin(query, tag, outer=True):
+        """Join property table, reusing existing joins of the same tag."""
+        if tag not in propJoins:
+            up = propJoins[tag] = aliased(UserProperties)
+            condition = (up.userID == Users.ID) & (up.tag == tag)
+            query = query.outerjoin(up, condition) if outer else query.join(up, condition)
+        return propJoins[tag], query
+
+    cursor = request.args.get("after")
     sorts = request.args.getlist("sort")
     for s in sorts:
         sprop, sorder = s.split(",", 1) if "," in s else (s, "asc")
         if hasattr(PropTags, sprop.upper()):
-            up = aliased(UserProperties)
-            query = query.join(up, (up.userID == Users.ID) & (up.tag == getattr(PropTags, sprop.upper())))\
-                         .order_by(up._propvalstr.desc() if sorder == "desc" else up._propvalstr.asc())
+            if cursor is not None:
+                return jsonify(message="Cannot use cursor with sort by '{}'".format(sprop)), 400
+            up, query = propJoin(query, getattr(PropTags, sprop.upper()), False)
+            query = query.order_by(up._propvalstr.desc() if sorder == "desc" else up._propvalstr.asc())
 
     if "match" in request.args:
         expr = request.args["match"]
         fields = set(request.args["matchFields"].split(",")) if "matchFields" in request.args else None
         isUnicode = any(ord(c) > 127 for c in expr)
-        matchexpr = tuple("%"+substr+"%" for substr in expr.split())
         matchables = Users._meta.matchables if fields is None else (m for m in Users._meta.matchables if m.alias in fields)
         targets = []
         for prop in matchables:
@@ -389,31 +555,42 @@ def userQuery(domainID=None):
             metaProp = DataModel.Prop(None)
             for prop in request.args["matchProps"].split(","):
                 if hasattr(PropTags, prop.upper()):
-                    up = aliased(UserProperties)
-                    query = query.outerjoin(up, (up.userID == Users.ID) & (up.tag == getattr(PropTags, prop.upper())))
+                    up, query = propJoin(query, getattr(PropTags, prop.upper()))
                     targets.append((metaProp, up._propvalstr))
-        filters = [column.ilike(match) for match in matchexpr for prop, column in targets if prop.match == "default"] +\
-                  [column == prop.tf(expr) for prop, column in targets if prop.match == "exact" and prop.tf(expr) is not None]
-        query = query.filter(or_(filter for filter in filters) if filters else False).reset_joinpoint()
+        filters = matchFilters(Users, targets, expr)
+        query = query.filter(or_(filter for filter in filters) if filters else False)
+        if not sorts and cursor is None:
+            rankExpr = matchRank((column for prop, column in targets if prop.match == "default"), expr)
+            query = query.order_by(rankExpr) if rankExpr is not None else query
+        query = query.reset_joinpoint()
 
     if "filterProp" in request.args:
         for filter in request.args["filterProp"].split(";"):
             prop, value = filter.split(":")
             try:
-                up = aliased(UserProperties)
-                query = query.outerjoin(up, (up.userID == Users.ID) & (up.tag == PropTags.deriveTag(prop)))\
-                             .filter(up._propvalstr == value if "," not in value else up._propvalstr.in_(value.split(",")))
+                up, query = propJoin(query, PropTags.deriveTag(prop))
+                query = query.filter(up._propvalstr == value if "," not in value else up._propvalstr.in_(value.split(",")))
             except ValueError:
                 return jsonify(message=f"Unknown user property '{prop}'"), 400
 
-    count = query.count()
-    data = [user.todict(verbosity) for user in query.limit(limit).offset(offset).all()]
+    try:
+        count = countQuery(Users, query, scoped=domainID is not None)
+    except ValueError as err:
+        return jsonify(message=err.args[0]), 400
+    if "properties" in request.args:
+        query = query.options(selectinload(Users._properties))
+    users = query.limit(limit).offset(offset).all()
+    data = [user.todict(verbosity, embedStore=False) for user in users]
+    if verbosity >= 2 and request.args.get("storeProps") != "false":
+        Users.embedStorePropertiesBulk(users)
     if verbosity < 2 and "properties" in request.args:
-        tags = [getattr(PropTags, prop.upper(), None) for prop in request.args["properties"].split(",")]
-        for user in data:
-            user["properties"] = {}
-        usermap = createMapping(data, lambda x: x["ID"])
-        properties = UserProperties.query.filter(UserProperties.userID.in_(usermap.keys()), UserProperties.tag.in_(tags)).all()
-        for prop in properties:
-            usermap[prop.userID]["properties"][prop.name] = prop.val
-    return jsonify(count=count, data=data)
+        names = {Users.PropMap._name(getattr(PropTags, prop.upper()))
+                 for prop in request.args["properties"].split(",") if hasattr(PropTags, prop.upper())}
+        for user, entry in zip(users, data):
+            entry["properties"] = {name: value for name, value in user.properties.items() if name in names}
+    resp = dict(data=data)
+    if count is not None:
+        resp["count"] = count
+    if cursor is not None:
+        resp["next"] = _nextCursor(users, limit, sorts)
+    return jsonify(resp)
@@ -2,22 +2,18 @@
 # SPDX-License-Identifier: AGPL-3.0-or-later
 # SPDX-FileCopyrightText: 2022 grommunio GmbH
 
-import shutil
-
 from flask import jsonify, request
 
 import api
 from api.core import API, secure
 from api.security import checkPermissions
 
-from services import Service, ServiceUnavailableError
+from services import Service
 from tools.ldap import downsyncObject, importObject
 from tools.permissions import SystemAdminPermission, SystemAdminROPermission, DomainAdminPermission, DomainAdminROPermission
 from tools.permissions import OrgAdminPermission
 from tools.tasq import TasQServer
 
-from orm import DB
-
 
 def _getTarget():
     """Get LDAP target organization and domains
@@ -135,55 +131,27 @@ def updateLdapUser(domainID, userID):
 @API.route(api.BaseRoute+"/domains/ldap/check", methods=["GET", "DELETE"])
 @secure(requireDB=True, authLevel="user")
 def checkLdapUsers():
-    from orm.users import Users
     orgID, domains = _getTarget()
     readonly = request.method == "GET"
+    params = {"remove": not readonly, "deleteFiles": request.args.get("deleteFiles") == "true"}
     if orgID is not None:
         Permission = DomainAdminROPermission if readonly else DomainAdminPermission
         for domain in domains:
             checkPermissions(Permission(domain.ID))
-        domainFilter = (Users.domainID.in_(domain.ID for domain in domains),)
+        params["domainIDs"] = [domain.ID for domain in domains]
+        permission = Permission(domains[0].ID) if "domain" in request.args else OrgAdminPermission(orgID)
     else:
-        checkPermissions(SystemAdminROPermission() if readonly else SystemAdminPermission())
-        domainFilter = ()
-    users = Users.query.filter(Users.externID != None, *domainFilter)\
-                       .with_entities(Users.ID, Users.username, Users.externID, Users.maildir, Users.orgID)\
-                       .all()
-    if len(users) == 0:
-        return jsonify(message="No LDAP users found", **{"orphaned" if request.method == "GET" else "deleted": []})
-    orphaned = []
-    for user in users:
-        with Service("ldap", user.orgID) as ldap:
-            if ldap.getUserInfo(user.externID) is None:
-                orphaned.append(user)
-    if len(orphaned) == 0:
-        return jsonify(message="All LDAP users are valid", **{"orphaned" if request.method == "GET" else "deleted": []})
-    orphanedData = [{"ID": user.ID, "username": user.username} for user in orphaned]
-    if request.method == "GET":
-        return jsonify(orphaned=orphanedData)
-    deleteMaildirs = request.args.get("deleteFiles") == "true"
-    homeserver = None
-    users = Users.query.filter(Users.ID.in_(orphan.ID for orphan in orphaned)).order_by(Users.homeserverID).all()
-    index = 0
-    while index < len(users):
-        try:
-            with Service("exmdb") as exmdb:
-                if homeserver != users[index].homeserverID:  # Reuse the exmdb client for users on the same server
-                    user = users[index]
-                    client = exmdb.ExmdbQueries(exmdb.host if user.homeserverID == 0 else user.homeserver.hostname,
-                                                exmdb.port, user.maildir, True)
-                    homeserver = user.homeserverID
-                while index < len(users) and users[index].homeserverID == homeserver:
-                    client.unloadStore(users[index].maildir)
-                    if deleteMaildirs:
-                        shutil.rmtree(users[index].maildir, ignore_errors=True)
-                    users[index].delete()
-                    index += 1
-        except ServiceUnavailableError:
-            API.logger.warning("Failed to unload store: exmdb service not available")
-            index += 1
-    DB.session.commit()
-    return jsonify(deleted=orphanedData)
+        permission = SystemAdminROPermission() if readonly else SystemAdminPermission()
+        checkPermissions(permission)
+    task = TasQServer.create("ldapCheck", params, permission=permission)
+    timeout = float(request.args["timeout"]) if "timeout" in request.args else None
+    TasQServer.wait(task.ID, timeout)
+    if not task.done:
+        return jsonify(message="Created background task #"+str(task.ID), taskID=task.ID), 202
+    key = "orphaned" if readonly else "deleted"
+    if task.state == task.COMPLETED:
+        return jsonify(message=task.message, **{key: task.params.get(key, [])})
+    return jsonify(message="Check failed: "+task.message), 503 if task.params.get("failed") else 500
 
 
 @API.route(api.BaseRoute+"/domains/ldap/dump", methods=["GET"])
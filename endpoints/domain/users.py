@@ -80,6 +80,37 @@ def createUser(domainID):
     return jsonify(result.fulldesc()), 201
 
 
+@API.route(api.BaseRoute+"/domains/<int:domainID>/users/batch", methods=["POST"])
+@secure(requireDB=True, authLevel="user")
+def createUserBatch(domainID):
+    checkPermissions(DomainAdminPermission(domainID))
+    from flask import Response, stream_with_context
+    from orm.users import Users
+    allowHomeserver = SystemAdminPermission() in request.auth["user"].permissions()
+    entries = []
+    for line in request.get_data(as_text=True).splitlines():
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError:
+            data = None
+        if isinstance(data, dict):
+            data["domainID"] = domainID
+            if not allowHomeserver:
+                data.pop("homeserver", None)
+        entries.append(data)
+
+    def results():
+        for index, result, code in Users.createBatch(entries):
+            if code == 201:
+                entry = dict(index=index, code=code, ID=result.ID, username=result.username)
+            else:
+                entry = dict(index=index, code=code, message=result)
+            yield json.dumps(entry, separators=(",", ":"))+"\n"
+    return Response(stream_with_context(results()), mimetype="application/x-ndjson")
+
+
 @API.route(api.BaseRoute+"/domains/<int:domainID>/users/<int:userID>", methods=["GET", "PATCH"])
 @secure(requireDB=True, authLevel="user")
 def userObjectEndpoint(domainID, userID):
@@ -154,6 +185,7 @@ def updateUserRoles(domainID, userID):
     add = requested-roles
     AdminUserRoleRelation.query.filter(AdminUserRoleRelation.userID == userID, AdminUserRoleRelation.roleID.in_(remove))\
                                .delete(synchronize_session=False)
+    AdminUserRoleRelation.NTtouch()
     for ID in add:
         DB.session.add(AdminUserRoleRelation(userID, ID))
     try:
@@ -406,7 +438,8 @@ def removeDevice(domainID, userID, deviceID):
 @secure(requireDB=True)
 def removeSyncStates(domainID, userID):
     checkPermissions(DomainAdminPermission(domainID))
-    from orm.users import Users
+    from orm import bulkDelete
+    from orm.users import DB, UserDevices, Users
     user = Users.query.filter(Users.ID == userID, Users.domainID == domainID).first()
     if user is None:
         return jsonify(message="User not found"), 404
@@ -415,7 +448,13 @@ def removeSyncStates(domainID, userID):
     with Service("exmdb") as exmdb:
         client = exmdb.user(user)
         client.removeSyncStates(Config["sync"]["syncStateFolder"])
-    return jsonify(message="Success")
+    try:
+        _, affected = bulkDelete(UserDevices.query.filter(UserDevices.userID == userID))
+        DB.session.commit()
+    except IntegrityError as err:
+        DB.session.rollback()
+        return jsonify(message="Object deletion would violate database constraints", error=err.args[0]), 400
+    return jsonify(message="Success", affected=affected)
 
 
 @API.route(api.BaseRoute+"/domains/<int:domainID>/users/<int:userID>/sync/<deviceID>/resync", methods=["PUT"])
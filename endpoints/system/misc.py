@@ -16,6 +16,7 @@ from tools.config import Config
 from tools.license import getLicense, updateCertificate
 from tools.permissions import SystemAdminPermission, SystemAdminROPermission
 from tools.dnsHealth import getHostByName
+from tools.metrics import Metrics
 from tools.misc import callUpdateScript
 
 import json
@@ -106,11 +107,18 @@ def signalDashboardService(unit, action):
         return jsonify(message=msg or "Success"), 500 if msg else 201
 
 
+@API.route(api.BaseRoute+"/system/dashboard/metrics", methods=["GET"])
+@secure()
+def getMetrics():
+    checkPermissions(SystemAdminROPermission())
+    return jsonify(Metrics.get())
+
+
 def dumpLicense():
     License = getLicense()
     try:
-        from orm.users import Users
-        currentUsers = Users.count()
+        from orm.users import LicenseCount
+        currentUsers = LicenseCount.get()
     except:
         currentUsers = None
     return jsonify(product=License.product,
@@ -16,8 +16,11 @@ else:
 
 
 from tools.config import Config
+from tools.metrics import Metrics
 
+import atexit
 import logging
+import threading
 logger = logging.getLogger("mysql")
 
 
@@ -28,6 +31,10 @@ class DBConn:
         self.session = scoped_session(sessionmaker(self.engine), threading.get_ident)
         self.__version = None
         self.__maxversion = 0
+        self.__pollInterval = Config["DB"].get("versionPollInterval", 60)
+        self.__pollerPID = None
+        self.__reloadPending = False
+        self.__lock = threading.Lock()
         self.initVersion()
 
     def __reinit(self):
@@ -80,10 +87,11 @@ class DBConn:
 
     def initVersion(self):
         self.__version = self._fetchVersion(True)
+        self.__reloadPending = False
         self.__reinit()
 
-    def requireReload(self):
-        """Check if a schema version update is available.
+    def _updateAvailable(self):
+        """Check database for schema version updates.
 
         Only queries the database if current version is undefined or is lower
         than the highest known version (i.e. an update would have an actual effect).
@@ -91,10 +99,58 @@ class DBConn:
         Returns
         -------
         bool
-            Whether an update is available and the schema should be reloaded
+            Whether an update is available
         """
         return (self.__version is None or self.__version < self.__maxversion) and self._fetchVersion(False) != self.__version
 
+    def _pollVersion(self):
+        """Periodically check for schema version updates.
+
+        Runs in a background thread and flags a reload when the version changed."""
+        import time
+        while True:
+            time.sleep(self.__pollInterval)
+            if self.__reloadPending:
+                continue
+            try:
+                self.__reloadPending = self._updateAvailable()
+            finally:
+                self.session.remove()
+            Metrics.inc("orm", "versionPolls")
+
+    def _startPoller(self):
+        """Start version poller thread if not already running in the current process."""
+        import os
+        import threading
+        if self.__pollerPID == os.getpid():
+            return
+        with self.__lock:
+            if self.__pollerPID == os.getpid():
+                return
+            threading.Thread(target=self._pollVersion, name="schema-version-poller", daemon=True).start()
+            self.__pollerPID = os.getpid()
+
+    def requireReload(self):
+        """Check if a schema version update is available.
+
+        If `DB.versionPollInterval` is positive, the schema version is checked periodically by a background thread
+        and this function only returns the result of the last check. Otherwise the database is queried directly
+        (see `_updateAvailable`).
+
+        A pending reload is only reported once.
+
+        Returns
+        -------
+        bool
+            Whether an update is available and the schema should be reloaded
+        """
+        if self.__pollInterval <= 0:
+            return self._updateAvailable()
+        self._startPoller()
+        with self.__lock:
+            pending, self.__reloadPending = self.__reloadPending, False
+        return pending
+
     @property
     def version(self):
         """Get schema version currently in use.
@@ -266,3 +322,138 @@ class NotifyTable:
         cls.__active = state
         if clear:
             cls.NTclear()
+
+
+def bulkDeletable(Model):
+    """Check whether instances of a model can be deleted without loading them.
+
+    This is the case if the model has a single column primary key, no delete events are registered (apart from
+    NotifyTable tracking) and all relationships that would require the ORM to update or delete dependent rows are
+    handled by the database.
+
+    Parameters
+    ----------
+    Model : SQLAlchemy model
+        Model to check
+
+    Returns
+    -------
+    bool
+        True if a set-based DELETE is equivalent to deleting each object, False otherwise
+    """
+    from sqlalchemy import inspect
+    from sqlalchemy.orm import interfaces
+    mapper = inspect(Model)
+    if len(mapper.primary_key) != 1:
+        return False
+    hooks = len(list(mapper.dispatch.before_delete))+len(list(mapper.dispatch.after_delete))
+    if issubclass(Model, NotifyTable) and event.contains(Model, "after_delete", Model.NTtouch):
+        hooks -= 1
+    if hooks:
+        return False
+    return all(rel.viewonly or rel.passive_deletes or rel.direction == interfaces.MANYTOONE for rel in mapper.relationships)
+
+
+def bulkDelete(query, chunkSize=1000):
+    """Delete all objects selected by a query.
+
+    If the model is `bulkDeletable`, only the primary keys are selected and the objects are deleted with DELETE
+    statements of at most `chunkSize` keys each. NotifyTable tracking is preserved by touching the table once.
+    Otherwise, the objects are loaded and deleted one by one.
+    Does not commit.
+
+    Parameters
+    ----------
+    query : Query
+        Query selecting the objects to delete. Must select a single model.
+    chunkSize : int, optional
+        Maximum number of keys per DELETE statement. The default is 1000.
+
+    Returns
+    -------
+    list
+        Primary keys of the selected objects
+    int
+        Number of deleted rows
+    """
+    from sqlalchemy import inspect
+    Model = query.column_descriptions[0]["entity"]
+    mapper = inspect(Model)
+    if not bulkDeletable(Model):
+        objs = query.all()
+        for obj in objs:
+            query.session.delete(obj)
+        Metrics.inc("batchDelete", "objects", len(objs))
+        return [mapper.primary_key_from_instance(obj)[0] for obj in objs], len(objs)
+    key = mapper.primary_key[0]
+    keys = [value for value, in query.with_entities(key)]
+    affected = 0
+    for i in range(0, len(keys), chunkSize):
+        affected += query.session.query(Model).filter(key.in_(keys[i:i+chunkSize])).delete(synchronize_session=False)
+    if affected and issubclass(Model, NotifyTable):
+        Model.NTtouch()
+    Metrics.inc("batchDelete", "bulk", affected)
+    return keys, affected
+
+
+class ReloadDispatcher:
+    """Coalesce service reloads requested by NotifyTable commits.
+
+    Units requested within `options.serviceReloadWindow` seconds after the first request are collected and reloaded
+    with a single systemctl call, so that each unit is reloaded at most once per window.
+    If the window is 0, units are reloaded immediately.
+    Pending reloads are executed at interpreter exit.
+    """
+    _lock = threading.Lock()
+    _pending = set()
+    _timer = None
+    _pid = None
+
+    @classmethod
+    def request(cls, *units):
+        """Request reload of systemd units.
+
+        Parameters
+        ----------
+        *units : str
+            Names of the units to reload
+        """
+        import os
+        Metrics.inc("serviceReload", "requests")
+        window = Config["options"].get("serviceReloadWindow", 1)
+        if window <= 0:
+            cls._reload(units)
+            return
+        with cls._lock:
+            if cls._pid != os.getpid():  # Timer threads do not survive forks
+                cls._pending, cls._timer, cls._pid = set(), None, os.getpid()
+            cls._pending.update(units)
+            if cls._timer is None:
+                cls._timer = threading.Timer(window, cls.flush)
+                cls._timer.daemon = True
+                cls._timer.start()
+
+    @classmethod
+    def flush(cls):
+        """Reload all pending units."""
+        with cls._lock:
+            units, cls._pending = cls._pending, set()
+            if cls._timer is not None:
+                cls._timer.cancel()
+                cls._timer = None
+        if units:
+            cls._reload(sorted(units))
+
+    @staticmethod
+    def _reload(units):
+        import time
+        from services import Service
+        start = time.time()
+        with Service("systemd", errors=Service.SUPPRESS_ALL) as sysd:
+            sysd.reloadService(*units)
+        Metrics.inc("serviceReload", "reloads")
+        Metrics.inc("serviceReload", "units", len(units))
+        Metrics.set("serviceReload", "lastDuration", time.time()-start)
+
+
+atexit.register(ReloadDispatcher.flush)
@@ -2,7 +2,7 @@
 # SPDX-License-Identifier: AGPL-3.0-or-later
 # SPDX-FileCopyrightText: 2021 grommunio GmbH
 
-from . import DB, OptionalC, OptionalNC, NotifyTable
+from . import DB, OptionalC, OptionalNC, NotifyTable, ReloadDispatcher
 from tools import formats
 from tools.DataModel import DataModel, Id, Text, Int, Date, RefProp
 from tools.DataModel import InvalidAttributeError, MismatchROError, MissingRequiredAttributeError
@@ -87,6 +87,7 @@ class OrgParam(DB.Base):
         _addIfDef(config["connection"], "connections", plain, "data_connections", type=int)
         _addIfDef(config, "baseDn", plain, "ldap_basedn")
         _addIfDef(config, "objectID", plain, "ldap_object_id")
+        _addIfDef(config, "cacheTTL", plain, "ldap_cache_ttl", type=int)
         _addIfDef(config["users"], "username", plain, "ldap_mail_attr")
         _addIfDef(config["users"], "filter", plain, "ldap_user_filter")
         _addIfDef(config["users"], "contactFilter", plain, "ldap_contact_filter")
@@ -119,6 +120,7 @@ class OrgParam(DB.Base):
             _addIfDef(flat, "ldap_start_tls", config["connection"], "starttls")
         _addIfDef(flat, "ldap_basedn", config, "baseDn")
         _addIfDef(flat, "ldap_object_id", config, "objectID")
+        _addIfDef(flat, "ldap_cache_ttl", config, "cacheTTL")
         if "users" in config:
             _addIfDef(flat, "ldap_mail_attr", config["users"], "username")
             _addIfDef(flat, "ldap_user_displayname", config["users"], "displayName")
@@ -408,9 +410,7 @@ class Domains(DataModel, DB.Base, NotifyTable):
 
     @classmethod
     def _commit(cls, *args, **kwargs):
-        with Service("systemd", errors=Service.SUPPRESS_ALL) as sysd:
-            sysd.reloadService("gromox-delivery.service", "gromox-delivery-queue.service",
-                               "gromox-http.service")
+        ReloadDispatcher.request("gromox-delivery.service", "gromox-delivery-queue.service", "gromox-http.service")
 
 
 from .users import Users
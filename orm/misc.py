@@ -255,6 +255,65 @@ class Servers(DataModel, DB.Base):
         targetPath = path.join(targetPath, server.hostname) if serverMount else targetPath
         return (0 if server is None else server.ID, targetPath)
 
+    @staticmethod
+    def allocUsers(requests):
+        """Select servers to store a batch of new users on.
+
+        Equivalent to calling `allocUser` for each user, but servers and policy are only loaded once.
+
+        Parameters
+        ----------
+        requests : iterable of tuple(int, int)
+            Pairs of user ID and requested server ID (None for automatic selection)
+
+        Raises
+        ------
+        ValueError
+            A requested server could not be found.
+
+        Returns
+        -------
+        list of tuple(int, str)
+            2-tuples containing the server ID and path for each request
+        """
+        from tools.config import Config
+        from os import path
+        import random
+        multiServer = DB.minVersion(105)
+        servers = Servers.query.order_by(Servers.ID).all() if multiServer else []
+        serverMap = {server.ID: server for server in servers}
+        policy = DBConf.getValue("grommunio-admin", "multi-server", "policy", default="round-robin") if servers else None
+        if policy not in (None, "balanced", "first", "last", "random", "round-robin"):
+            logger.warning("Unknown multi-server policy '{}'. Defaulting to round-robin.".format(policy))
+        load = dict(Servers.query.with_entities(Servers.ID, Servers.users)) if policy == "balanced" else {}
+        serverMount = Config["options"].get("serverExplicitMount")
+        prefix = Config["options"]["userPrefix"]
+        allocations = []
+        for userID, serverID in requests:
+            if serverID and multiServer:
+                server = serverMap.get(serverID)
+                if server is None:
+                    raise ValueError("Requested server #{} not found".format(serverID))
+            elif not servers:
+                server = None
+            elif policy == "balanced":
+                server = min(servers, key=lambda server: load[server.ID])
+            elif policy == "first":
+                server = servers[0]
+            elif policy == "last":
+                server = servers[-1]
+            elif policy == "random":
+                server = random.choice(servers)
+            else:
+                server = servers[userID % len(servers)]
+            if server is None:
+                allocations.append((0, prefix))
+                continue
+            if server.ID in load:
+                load[server.ID] += 1
+            allocations.append((server.ID, path.join(prefix, server.hostname) if serverMount else prefix))
+        return allocations
+
     @staticmethod
     def allocDomain(domainID, serverID=None):
         """Select a server to store new domain on.
@@ -4,16 +4,17 @@
 
 import json
 
-from sqlalchemy import Column, ForeignKey
+from sqlalchemy import Column, ForeignKey, event
 from sqlalchemy.dialects.mysql import INTEGER, TEXT, VARCHAR
 from sqlalchemy.orm import relationship
 
 from tools.DataModel import DataModel, Id, Int, RefProp, Text
+from tools.permissions import PermissionCache
 
-from . import DB
+from . import DB, NotifyTable
 
 
-class AdminRoles(DataModel, DB.Base):
+class AdminRoles(DataModel, DB.Base, NotifyTable):
     __tablename__ = "admin_roles"
 
     ID = Column("id", INTEGER(10, unsigned=True), unique=True, primary_key=True)
@@ -29,7 +30,10 @@ class AdminRoles(DataModel, DB.Base):
                       RefProp("users", link="userID", flat="user", flags="patch")))
 
 
-class AdminRolePermissionRelation(DataModel, DB.Base):
+    _commit = PermissionCache.invalidate
+
+
+class AdminRolePermissionRelation(DataModel, DB.Base, NotifyTable):
     __tablename__ = "admin_role_permission_relation"
 
     ID = Column("id", INTEGER(10, unsigned=True), primary_key=True)
@@ -62,8 +66,10 @@ class AdminRolePermissionRelation(DataModel, DB.Base):
                 raise ValueError(*err.args)
         return DataModel.fromdict(self, patches, *args, **kwargs)
 
+    _commit = PermissionCache.invalidate
+
 
-class AdminUserRoleRelation(DataModel, DB.Base):
+class AdminUserRoleRelation(DataModel, DB.Base, NotifyTable):
     __tablename__ = "admin_user_role_relation"
 
     userID = Column("user_id", INTEGER(10, unsigned=True), ForeignKey("users.id", ondelete="cascade"), primary_key=True)
@@ -82,4 +88,11 @@ class AdminUserRoleRelation(DataModel, DB.Base):
         else:
             self.role = role
 
+    _commit = PermissionCache.invalidate
+
+
+for _table in (AdminRoles, AdminRolePermissionRelation, AdminUserRoleRelation):
+    _table.NTregister()
+    event.listen(_table, "after_update", _table.NTtouch)
+
 from .users import Users
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2024 grommunio GmbH
+
+from . import DB, logger
+
+import unicodedata
+
+from sqlalchemy import Column, Index, event, func
+from sqlalchemy.dialects.mysql import INTEGER, VARCHAR
+
+from tools.config import Config
+from tools.DataModel import DataModel
+
+
+def trigrams(text):
+    """Get set of normalized trigrams contained in text.
+
+    Text is lowercased and stripped of accents to approximate the case and accent insensitive collation of the
+    matched columns. Trigrams are only used to select candidates, so the approximation must never exclude a match.
+
+    Parameters
+    ----------
+    text : str
+        Text to split
+
+    Returns
+    -------
+    set of str
+        Trigrams found in the text
+    """
+    text = "".join(c for c in unicodedata.normalize("NFKD", str(text).lower()) if not unicodedata.combining(c))
+    return {text[i:i+3] for i in range(len(text)-2)}
+
+
+class SearchIndex(DB.Base):
+    """Inverted trigram index for DataModel.automatch.
+
+    Stores the trigrams of all local matchable attributes of registered models. The table is not part of the
+    gromox schema and must be created by `grommunio-admin search rebuild` before the index can be enabled
+    (`options.searchIndex`).
+
+    The index is only kept up to date for changes made through the ORM. Objects modified by other means (e.g.
+    gromox tools or direct SQL) are not found by their new values until the index is rebuilt, candidates are always
+    re-checked against the actual columns, though.
+    The trigram column uses a case insensitive collation like the matched columns, so that lookups agree with `ilike`.
+    Trigrams that are equal under this collation are only stored once.
+    """
+    __tablename__ = "admin_search_index"
+
+    model = Column("model", VARCHAR(64), primary_key=True)
+    objectID = Column("object_id", INTEGER(10, unsigned=True), primary_key=True)
+    trigram = Column("trigram", VARCHAR(3, charset="utf8mb4", collation="utf8mb4_general_ci"), primary_key=True)
+
+    __table_args__ = (Index("trigram_lookup", "model", "trigram", "object_id"),)
+
+    models = {}
+
+    @staticmethod
+    def indexed(prop):
+        """Check whether a DataModel property is covered by the index.
+
+        Only attributes of the model itself are indexed.
+        """
+        return "match" in prop.flags and prop.match == "default" and prop.target is None and prop.proxy is None
+
+    @classmethod
+    def covers(cls, Model):
+        """Check whether a model is indexed."""
+        return Model.__tablename__ in cls.models
+
+    @classmethod
+    def candidates(cls, Model, word):
+        """Get query selecting the IDs of objects that may contain a word.
+
+        Parameters
+        ----------
+        Model : DataModel
+            Indexed model
+        word : str
+            Word to search for
+
+        Returns
+        -------
+        Query
+            Query returning the object IDs or None if the word is too short to use the index
+        """
+        grams = trigrams(word)
+        if len(grams) == 0:
+            return None
+        return DB.session.query(cls.objectID)\
+            .filter(cls.model == Model.__tablename__, cls.trigram.in_(grams))\
+            .group_by(cls.objectID).having(func.count(cls.trigram) == len(grams))
+
+    @classmethod
+    def _insert(cls):
+        """Get insert statement skipping trigrams that are already stored under the column collation."""
+        return cls.__table__.insert().prefix_with("IGNORE")
+
+    @classmethod
+    def _entries(cls, obj):
+        """Generate index rows of an object."""
+        values = (prop.value(obj, "unmask") for prop in obj._meta.matchables if cls.indexed(prop))
+        grams = set().union(*(trigrams(value) for value in values if value is not None))
+        return [{"model": obj.__tablename__, "object_id": obj.ID, "trigram": gram} for gram in grams]
+
+    @classmethod
+    def _update(cls, mapper, connection, target):
+        table = cls.__table__
+        connection.execute(table.delete().where((table.c.model == target.__tablename__) & (table.c.object_id == target.ID)))
+        entries = cls._entries(target)
+        if entries:
+            connection.execute(cls._insert(), entries)
+
+    @classmethod
+    def _delete(cls, mapper, connection, target):
+        table = cls.__table__
+        connection.execute(table.delete().where((table.c.model == target.__tablename__) & (table.c.object_id == target.ID)))
+
+    @classmethod
+    def register(cls, Model):
+        """Register model for indexing.
+
+        If the index is enabled, the entries of an object are updated whenever it is inserted, updated or deleted.
+        """
+        Model._init()
+        cls.models[Model.__tablename__] = Model
+        if Config["options"].get("searchIndex"):
+            event.listen(Model, "after_insert", cls._update)
+            event.listen(Model, "after_update", cls._update)
+            event.listen(Model, "after_delete", cls._delete)
+
+    @classmethod
+    def rebuild(cls, Model, chunkSize=1000):
+        """Rebuild index of a model.
+
+        Creates the index table if it does not exist. Does not commit.
+
+        Parameters
+        ----------
+        Model : DataModel
+            Registered model to rebuild the index for
+        chunkSize : int, optional
+            Number of objects to process at once. The default is 1000.
+
+        Returns
+        -------
+        int
+            Number of indexed objects
+        """
+        cls.__table__.create(DB.session.connection(), checkfirst=True)
+        table = cls.__table__
+        DB.session.execute(table.delete().where(table.c.model == Model.__tablename__))
+        count = 0
+        lastID = None
+        while True:
+            query = Model.query.order_by(Model.ID)
+            query = query.filter(Model.ID > lastID) if lastID is not None else query
+            objects = query.limit(chunkSize).all()
+            if len(objects) == 0:
+                break
+            entries = [entry for obj in objects for entry in cls._entries(obj)]
+            if entries:
+                DB.session.execute(cls._insert(), entries)
+            count += len(objects)
+            lastID = objects[-1].ID
+            DB.session.expunge_all()
+        logger.info("Rebuilt search index of {} ({} objects)".format(Model.__tablename__, count))
+        return count
+
+
+from .domains import Domains
+from .users import Users
+
+SearchIndex.register(Domains)
+SearchIndex.register(Users)
+if Config["options"].get("searchIndex"):
+    DataModel.searchIndex = SearchIndex
@@ -2,23 +2,27 @@
 # SPDX-License-Identifier: AGPL-3.0-or-later
 # SPDX-FileCopyrightText: 2020-2021 grommunio GmbH
 
-from . import DB, OptionalC, OptionalNC, NotifyTable, logger
+from . import DB, OptionalC, OptionalNC, NotifyTable, ReloadDispatcher, logger
 from services import Service
 from tools import formats
+from tools.config import Config
 from tools.constants import PropTags, PropTypes
 from tools.DataModel import DataModel, Id, Text, Int, BoolP, RefProp, Bool, Date
 from tools.DataModel import InvalidAttributeError, MismatchROError, MissingRequiredAttributeError
+from tools.metrics import Metrics
 from tools.rop import nxTime
 
 from sqlalchemy import Column, ForeignKey, event, func, inspect, select
 from sqlalchemy.dialects.mysql import ENUM, INTEGER, TEXT, TIMESTAMP, TINYINT, VARBINARY, VARCHAR
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.orm import column_property, relationship, selectinload, validates
+from sqlalchemy.ext.hybrid import Comparator, hybrid_property
+from sqlalchemy.orm import relationship, selectinload, validates
+from sqlalchemy.sql import operators
 
 import crypt
 import json
 import sys
+import time
 
 from datetime import datetime
 
@@ -128,6 +132,10 @@ class Users(DataModel, DB.Base, NotifyTable):
             return {tag: [getv(p) for p in prop] if PropTypes.ismv(tag) else getv(prop)
                     for tag, prop in self.__struct.items()}
 
+        def contentmap(self):
+            return {tag: [p.content for p in prop] if PropTypes.ismv(tag) else prop.content
+                    for tag, prop in self.__struct.items()}
+
     __tablename__ = "users"
 
     ID = Column("id", INTEGER(10, unsigned=True), nullable=False, primary_key=True, unique=True)
@@ -233,18 +241,94 @@ class Users(DataModel, DB.Base, NotifyTable):
     _chatUser = None
     _propcache = None
 
+    class CreateLimits:
+        """License and domain user limits of new users.
+
+        Domains and user counts are only queried once and updated locally for every accepted user, so that a single
+        instance can be used to check a whole batch of users.
+        """
+        def __init__(self):
+            self.__users = None
+            self.__domains = {}
+            self.__domainUsers = {}
+
+        def licensed(self):
+            """Check whether another licensed user can be created."""
+            from tools.license import getLicense
+            if self.__users is None:
+                self.__users = LicenseCount.get()
+            return self.__users < getLicense().users
+
+        def domain(self, domainID=None, domainname=None):
+            """Get domain by ID or name."""
+            from orm.domains import Domains
+            key = (domainID, domainname)
+            if key not in self.__domains:
+                self.__domains[key] = Domains.query.filter(Domains.ID == domainID if domainID is not None else
+                                                           Domains.domainname == domainname).first()
+            return self.__domains[key]
+
+        def domainFull(self, domain):
+            """Check whether the maximum number of users of a domain is reached."""
+            if domain.ID not in self.__domainUsers:
+                self.__domainUsers[domain.ID] = Users.count(Users.domainID == domain.ID)
+            return domain.maxUser <= self.__domainUsers[domain.ID]
+
+        def reserve(self, domain, licensed):
+            """Check limits and account for a new user.
+
+            Parameters
+            ----------
+            domain : orm.domains.Domains
+                Domain of the new user
+            licensed : bool
+                Whether the user counts against the license
+
+            Returns
+            -------
+            str
+                Error message or None if the user was accounted for
+            """
+            if licensed and not self.licensed():
+                return "License user limit exceeded"
+            if self.domainFull(domain):
+                return "Maximum number of domain users reached"
+            self.__domainUsers[domain.ID] += 1
+            if licensed:
+                self.__users += 1
+
+        def release(self, domain, licensed):
+            """Release a user accounted for by `reserve` that could not be created."""
+            self.__domainUsers[domain.ID] -= 1
+            if licensed:
+                self.__users -= 1
+
     @staticmethod
-    def checkCreateParams(data):
-        from orm.domains import Domains
-        from tools.license import getLicense
+    def checkCreateParams(data, limits=None, reserve=True):
+        """Check and complete parameters of a new user.
+
+        Parameters
+        ----------
+        data : dict
+            User parameters. Completed with the resolved domain and default properties.
+        limits : Users.CreateLimits, optional
+            Limits shared by a batch of users. The default is None, which checks the current database state.
+        reserve : bool, optional
+            Check license and domain limits and account for the user in `limits`. If False, the caller must call
+            `limits.reserve` before creating the user. The default is True.
+
+        Returns
+        -------
+        str
+            Error message or None if the user can be created
+        """
+        limits = limits or Users.CreateLimits()
         if "username" not in data:
             return "Missing username"
-        if data.get("status", Users.NORMAL) == Users.NORMAL and Users.count() >= getLicense().users:
-            return "License user limit exceeded"
         if "domainID" in data:
-            domain = Domains.query.filter(Domains.ID == data.get("domainID")).first()
+            domain = limits.domain(domainID=data.get("domainID"))
         elif "@" in data["username"]:
-            domain = Domains.query.filter(Domains.domainname == data["username"].split("@")[1]).first()
+            domain = limits.domain(domainname=data["username"].split("@")[1])
         else:
             domain = None
         if domain is None:
@@ -258,9 +342,6 @@ class Users(DataModel, DB.Base, NotifyTable):
                 data["username"] += "@"+domain.domainname
         data["domain"] = domain
         data["domainID"] = domain.ID
-        domainUsers = Users.count(Users.domainID == domain.ID)
-        if domain.maxUser <= domainUsers:
-            return "Maximum number of domain users reached"
         data["domainStatus"] = domain.domainStatus
         if "properties" not in data:
             data["properties"] = {}
@@ -268,6 +349,8 @@ class Users(DataModel, DB.Base, NotifyTable):
         properties["creationtime"] = datetime.now()
         if "displaytypeex" not in properties:
             properties["displaytypeex"] = 0
+        if reserve:
+            return limits.reserve(domain, data.get("status", Users.NORMAL) == Users.NORMAL)
 
     def __init__(self, props, *args, **kwargs):
         self._permissions = None
@@ -308,11 +391,25 @@ class Users(DataModel, DB.Base, NotifyTable):
         if syncStore == "always" or (syncStore and "properties" in patches):
             delete = [PropTags.deriveTag(tag) for tag, val in patches["properties"].items() if val is None] \
                 if "properties" in patches else None
-            self.syncStore(delete=delete)
+            self.syncStore(delete=delete, full=syncStore == "always")
+
+    @classmethod
+    def optimize_query(cls, query, spec):
+        """Optimize query by eager loading relationships.
 
-    def todict(self, spec, *args, **kwargs):
+        Additionally loads user properties and domains (required for `orgID`) of all selected users in a single query
+        if they are included in the output. See `DataModel.optimize_query` for more information.
+        """
+        query = super().optimize_query(query, spec)
+        if (isinstance(spec, int) and spec >= 2) or (not isinstance(spec, int) and "properties" in spec):
+            query = query.options(selectinload(cls._properties))
+        if (isinstance(spec, int) and spec >= 2) or (not isinstance(spec, int) and "orgID" in spec):
+            query = query.options(selectinload(cls.domain))
+        return query
+
+    def todict(self, spec, *args, embedStore=True, **kwargs):
         data = DataModel.todict(self, spec, *args, **kwargs)
-        if isinstance(spec, int) and spec >= 2:
+        if embedStore and isinstance(spec, int) and spec >= 2:
             self.embedStoreProperties()
         return data
 
@@ -340,9 +437,12 @@ class Users(DataModel, DB.Base, NotifyTable):
             return Permissions.sysadmin()
         if not hasattr(self, "_permissions") or self._permissions is None:
             from .roles import AdminUserRoleRelation as AURR, AdminRolePermissionRelation as ARPR, AdminRoles as AR
-            from tools.permissions import Permissions
-            perms = ARPR.query.filter(AURR.userID == self.ID).join(AR).join(AURR).all()
-            self._permissions = Permissions.fromDB(perms)
+            from tools.permissions import PermissionCache, Permissions
+            self._permissions, generation = PermissionCache.get(self.ID)
+            if self._permissions is None:
+                perms = ARPR.query.filter(AURR.userID == self.ID).join(AR).join(AURR).all()
+                self._permissions = Permissions.fromDB(perms)
+                PermissionCache.put(self.ID, self._permissions, generation)
         return self._permissions
 
     def getProp(self, name):
@@ -364,6 +464,14 @@ class Users(DataModel, DB.Base, NotifyTable):
     def chkPw(self, pw):
         return crypt.crypt(pw, self.password) == self.password
 
+    @hybrid_property
+    def orgID(self):
+        return self.domain.orgID if self.domain is not None else None
+
+    @orgID.comparator
+    def orgID(cls):
+        return _OrgIDComparator(cls)
+
     @property
     def propmap_id(self):
         if self._propcache is None:
@@ -551,7 +659,7 @@ class Users(DataModel, DB.Base, NotifyTable):
     @status.setter
     def status(self, val):
         from tools.license import getLicense
-        if self.status and not val and Users.count() >= getLicense().users:
+        if self.status and not val and LicenseCount.get() >= getLicense().users:
             raise ValueError("License user limit exceeded")
         self.addressStatus = ((self.addressStatus or 0) & ~self.USER_MASK) | (val & self.USER_MASK)
 
@@ -735,7 +843,7 @@ class Users(DataModel, DB.Base, NotifyTable):
                     return "Error during user setup: "+us.error, us.errorCode
                 if sync:
                     try:
-                        user.syncStore()
+                        user.syncStore(full=True)
                     except Exception:
                         pass
                     return user, 201
@@ -745,6 +853,125 @@ class Users(DataModel, DB.Base, NotifyTable):
             DB.session.rollback()
             return "Failed to create user "+" - ".join(str(arg) for arg in err.args), 500
 
+    @staticmethod
+    def createBatch(entries, chunkSize=100, sync=True):
+        """Create multiple users.
+
+        All entries are validated and checked for duplicates before the first user is created. License and domain
+        limits are then checked once for the whole batch, so that only users that are actually inserted count against
+        them. Home servers are allocated in a single pass per chunk of `chunkSize` users.
+        Each entry is processed independently, errors are reported for the entry and do not abort the batch.
+        Contacts are created individually (see `mkContact`).
+
+        Parameters
+        ----------
+        entries : iterable of dict
+            User parameters as accepted by `create`
+        chunkSize : int, optional
+            Number of users inserted and allocated at once. The default is 100.
+        sync : bool, optional
+            Whether to write the user properties to the stores after creation. The default is True.
+
+        Yields
+        ------
+        tuple(int, Users or str, int)
+            Index of the entry, the created user or an error message and a HTTP status code
+        """
+        from .misc import Servers
+        from tools.storage import UserSetup
+
+        def failed(err):
+            return "Failed to create user "+" - ".join(str(arg) for arg in err.args)
+
+        limits = Users.CreateLimits()
+        contacts = []
+        checked = []
+        for index, props in enumerate(entries):
+            if not isinstance(props, dict):
+                yield index, "Invalid user specification", 400
+                continue
+            if props.get("status") == Users.CONTACT:
+                contacts.append((index, props))
+                continue
+            error = Users.checkCreateParams(props, limits, reserve=False)
+            if error is not None:
+                yield index, error, 400
+                continue
+            checked.append((index, props))
+        names = [props["username"] for _, props in checked]
+        with DB.session.no_autoflush:
+            existing = {username.lower() for username, in Users.query.filter(Users.username.in_(names))
+                                                                     .with_entities(Users.username)} if names else set()
+        valid = []
+        for index, props in checked:
+            username = props["username"].lower()
+            if username in existing:
+                yield index, "User '{}' already exists".format(props["username"]), 400
+                continue
+            existing.add(username)
+            reservation = (props["domain"], props.get("status", Users.NORMAL) == Users.NORMAL)
+            error = limits.reserve(*reservation)
+            if error is not None:
+                yield index, error, 400
+                continue
+            chat = props.pop("chat", None)
+            try:
+                valid.append((index, Users(props), props.get("homeserver"), chat, reservation))
+            except (InvalidAttributeError, MismatchROError, MissingRequiredAttributeError, ValueError) as err:
+                limits.release(*reservation)
+                yield index, err.args[0], 400
+        for start in range(0, len(valid), chunkSize):
+            chunk = valid[start:start+chunkSize]
+            try:
+                DB.session.add_all(entry[1] for entry in chunk)
+                DB.session.flush()
+                allocations = Servers.allocUsers((user.ID, homeserver) for _, user, homeserver, _, _ in chunk)
+                for (_, user, _, _, _), (homeserverID, maildir) in zip(chunk, allocations):
+                    user.homeserverID, user.maildir = homeserverID, maildir
+                DB.session.commit()
+            except IntegrityError as err:
+                DB.session.rollback()
+                for index, _, _, _, reservation in chunk:
+                    limits.release(*reservation)
+                    yield index, "Object violates database constraints "+err.orig.args[1], 400
+                continue
+            except Exception as err:
+                DB.session.rollback()
+                for index, _, _, _, reservation in chunk:
+                    limits.release(*reservation)
+                    yield index, failed(err), 500
+                continue
+            for index, user, _, chat, _ in chunk:
+                try:  # The chunk is committed, a rollback only discards changes of the current user
+                    with UserSetup(user, DB.session) as us:
+                        us.run()
+                    if chat:
+                        try:
+                            user.chat = chat
+                        except ValueError as err:
+                            logger.error("Failed to activate chat: "+err.args[0])
+                    DB.session.commit()
+                except Exception as err:
+                    DB.session.rollback()
+                    logger.error("Failed to set up user {}: {}".format(user.username, failed(err)))
+                    yield index, failed(err), 500
+                    continue
+                if not us.success:
+                    yield index, "Error during user setup: "+us.error, us.errorCode
+                    continue
+                if sync:
+                    try:
+                        user.syncStore(full=True)
+                    except Exception:
+                        pass
+                yield index, user, 201
+        for index, props in contacts:
+            try:
+                yield (index, *Users.mkContact(props))
+            except Exception as err:
+                DB.session.rollback()
+                yield index, "Failed to create contact - "+" - ".join(str(arg) for arg in err.args), 500
+
     @classmethod
     def mkContact(cls, props, externID=None, *args, **kwargs):
         smtpaddress = props.get("username")
@@ -775,8 +1002,7 @@ class Users(DataModel, DB.Base, NotifyTable):
 
     @classmethod
     def _commit(*args, **kwargs):
-        with Service("systemd", errors=Service.SUPPRESS_ALL) as sysd:
-            sysd.reloadService("gromox-http.service", "gromox-zcore.service")
+        ReloadDispatcher.request("gromox-http.service", "gromox-zcore.service")
 
     @validates("username")
     def validateUsername(self, key, value, *args):
@@ -784,29 +1010,60 @@ class Users(DataModel, DB.Base, NotifyTable):
             raise ValueError("Username is already used as alternative name")
         return value
 
-    def syncStore(self, delete=None):
-        """Write all properties to the exmdb store.
+    def syncStore(self, delete=None, full=False):
+        """Write properties to the exmdb store.
 
+        Only properties that differ from the values last written to the store (see `tools.storage.StoreSyncState`)
+        are sent, unless `full` is set or the synchronized state is unknown. If the sync fails, the state is discarded
+        so that the next sync writes all properties.
         For users without a store, this function has no effect.
 
         Parameters
         ----------
         delete : List[int], optional
             List of tags to delete. The default is None.
+        full : bool, optional
+            Write all properties. The default is False.
+
+        Returns
+        -------
+        tuple(int, int)
+            Number of properties sent and skipped
         """
+        from tools.storage import StoreSyncState
         if not self.maildir:
-            return
-        with Service("exmdb") as exmdb:
-            props = []
-            for tag, value in self.properties.rawmap().items():
-                try:
-                    props.append(exmdb.TaggedPropval(tag, value))
-                except Exception:
-                    pass
-            client = exmdb.user(self)
-            client.setStoreProperties(0, props)
-            if delete:
-                client.removeStoreProperties(delete)
+            return 0, 0
+        state = None if full else StoreSyncState.get(self.ID)
+        allProps = self.properties.rawmap()
+        contents = self.properties.contentmap()
+        if state is not None:
+            changedTags = StoreSyncState.changed(contents, state)
+            changed = {tag: value for tag, value in allProps.items() if tag in changedTags}
+        else:
+            changed = allProps
+        try:
+            with Service("exmdb") as exmdb:
+                props = []
+                for tag, value in changed.items():
+                    try:
+                        props.append(exmdb.TaggedPropval(tag, value))
+                    except Exception:
+                        contents.pop(tag)
+                client = exmdb.user(self)
+                if props:
+                    client.setStoreProperties(0, props)
+                if delete:
+                    client.removeStoreProperties(delete)
+        except BaseException:
+            StoreSyncState.discard(self.ID)
+            Metrics.inc("storeSync", "failures")
+            raise
+        StoreSyncState.put(self.ID, contents)
+        skipped = len(allProps)-len(changed)
+        Metrics.inc("storeSync", "syncs")
+        Metrics.inc("storeSync", "sent", len(props))
+        Metrics.inc("storeSync", "skipped", skipped)
+        return len(props), skipped
 
     def embedStoreProperties(self):
         """Retrieve store properties and embed them in MySQL properties.
@@ -816,13 +1073,74 @@ class Users(DataModel, DB.Base, NotifyTable):
         if not self.maildir:
             return
         with Service("exmdb", errors=Service.SUPPRESS_ALL) as exmdb:
-            client = exmdb.user(self)
-            tags = client.getAllStoreProperties()
-            tags = [t for t in tags if t & 0xFFFF not in (PropTypes.BINARY, PropTypes.BINARY_ARRAY)]
-            props = client.getStoreProperties(0, tags)
-            self.properties.update({prop.tag: prop.val for prop in props})
+            self.properties.update(self._fetchStoreProperties(exmdb, self))
             DB.session.commit()
 
+    @staticmethod
+    def _fetchStoreProperties(exmdb, store):
+        """Get all non-binary store properties.
+
+        Parameters
+        ----------
+        exmdb : services.exmdb.ExmdbService
+            Exmdb service
+        store : Users or GenericObject
+            Object providing `maildir` and `homeserver` of the user
+
+        Returns
+        -------
+        dict
+            Mapping of tag -> value
+        """
+        client = exmdb.user(store)
+        tags = client.getAllStoreProperties()
+        tags = [t for t in tags if t & 0xFFFF not in (PropTypes.BINARY, PropTypes.BINARY_ARRAY)]
+        return {prop.tag: prop.val for prop in client.getStoreProperties(0, tags)}
+
+    @staticmethod
+    def embedStorePropertiesBulk(users):
+        """Retrieve store properties of multiple users and embed them in MySQL properties.
+
+        Equivalent to calling `embedStoreProperties` on each user, but the stores are queried concurrently by up to
+        `options.storePropertyThreads` threads and changes are committed only once.
+        Users are grouped by home server and the groups are processed in an interleaved order, so that all servers
+        are queried in parallel.
+
+        Users without a store are skipped.
+
+        Parameters
+        ----------
+        users : iterable of Users
+            Users to embed the store properties of
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from itertools import chain, zip_longest
+        from tools.misc import GenericObject
+
+        def fetch(store):
+            with Service("exmdb", errors=Service.SUPPRESS_ALL) as exmdb:
+                return Users._fetchStoreProperties(exmdb, store)
+
+        groups = {}
+        for user in users:
+            if not user.maildir:
+                continue
+            host = user.homeserver.hostname if user.homeserver is not None else None
+            store = GenericObject(maildir=user.maildir, homeserver=GenericObject(hostname=host) if host else None)
+            groups.setdefault(host, []).append((user, store))
+        if not groups:
+            return
+        ordered = [entry for entry in chain.from_iterable(zip_longest(*groups.values())) if entry is not None]
+        threads = max(1, min(Config["options"].get("storePropertyThreads", 8), len(ordered)))
+        start = time.time()
+        with ThreadPoolExecutor(threads) as executor:
+            for (user, _), props in zip(ordered, executor.map(fetch, (store for _, store in ordered))):
+                if props is not None:
+                    user.properties.update(props)
+        Metrics.inc("storeProperties", "users", len(ordered))
+        Metrics.set("storeProperties", "lastBatchDuration", time.time()-start)
+        DB.session.commit()
+
 
 class UserProperties(DB.Base):
     __tablename__ = "user_properties"
@@ -916,8 +1234,7 @@ class Aliases(DataModel, DB.Base, NotifyTable):
 
     @classmethod
     def _commit(*args, **kwargs):
-        with Service("systemd", errors=Service.SUPPRESS_ALL) as sysd:
-            sysd.reloadService("gromox-delivery.service", "gromox-http.service", "gromox-zcore.service")
+        ReloadDispatcher.request("gromox-delivery.service", "gromox-http.service", "gromox-zcore.service")
 
 
 class Altnames(DataModel, DB.Base):
@@ -1096,18 +1413,127 @@ class Forwards(DataModel, DB.Base):
 
 
 from .domains import Domains
-from . import misc, mlists, roles
+from . import misc, mlists, roles, search
 
 
 Users.NTregister()
 Aliases.NTregister()
 
+
+class LicenseCount:
+    """Number of licensed users (see `Users.count`), shared by all workers.
+
+    The count is stored in redis and adjusted after every commit that creates, deletes, activates or deactivates users.
+    It expires after `options.licenseCountReconcile` seconds and is then recounted from the database, which also
+    corrects changes made without the ORM (e.g. bulk updates).
+    If redis is not available, users are always counted in the database.
+    """
+    key = "grommunio-admin:licensedusers"
+    _incrScript = "if redis.call('exists', KEYS[1]) == 1 then return redis.call('incrby', KEYS[1], ARGV[1]) end"
+
+    @classmethod
+    def get(cls):
+        """Get number of licensed users.
+
+        Returns
+        -------
+        int
+            Number of users counting towards the license limit
+        """
+        with Service("redis", errors=Service.SUPPRESS_INOP) as r:
+            count = r.get(cls.key)
+            if count is not None:
+                Metrics.inc("licenseCount", "hits")
+                return int(count)
+            count = Users.count()
+            r.set(cls.key, count, ex=Config["options"].get("licenseCountReconcile", 300), nx=True)
+            Metrics.inc("licenseCount", "reconciliations")
+            return count
+        return Users.count()
+
+    @staticmethod
+    def _licensed(ID, maildir, addressStatus):
+        return ID != 0 and bool(maildir) and (addressStatus or 0) & Users.USER_MASK == Users.NORMAL
+
+    @classmethod
+    def _track(cls, target, delta):
+        if delta:
+            info = inspect(target).session.info
+            info[cls.key] = info.get(cls.key, 0)+delta
+
+    @classmethod
+    def _inserted(cls, mapper, connection, target):
+        cls._track(target, cls._licensed(target.ID, target.maildir, target.addressStatus))
+
+    @classmethod
+    def _deleted(cls, mapper, connection, target):
+        cls._track(target, -cls._licensed(target.ID, target.maildir, target.addressStatus))
+
+    @classmethod
+    def _updated(cls, mapper, connection, target):
+        def previous(attr):
+            history = state.attrs[attr].history
+            return history.deleted[0] if history.deleted else getattr(target, attr)
+
+        state = inspect(target)
+        cls._track(target, cls._licensed(target.ID, target.maildir, target.addressStatus) -
+                   cls._licensed(target.ID, previous("maildir"), previous("addressStatus")))
+
+    @classmethod
+    def _commit(cls, session):
+        delta = session.info.pop(cls.key, 0)
+        if delta:
+            with Service("redis", errors=Service.SUPPRESS_INOP) as r:
+                r.eval(cls._incrScript, 1, cls.key, delta)
+                Metrics.inc("licenseCount", "updates")
+
+    @classmethod
+    def _discard(cls, session, *args):
+        session.info.pop(cls.key, None)
+
+    @classmethod
+    def register(cls):
+        """Register SQLAlchemy event handlers."""
+        event.listen(Users, "after_insert", cls._inserted)
+        event.listen(Users, "before_delete", cls._deleted)
+        event.listen(Users, "before_update", cls._updated)
+        event.listen(DB.session, "after_commit", cls._commit)
+        event.listen(DB.session, "after_rollback", cls._discard)
+
+
+LicenseCount.register()
+
 if sqlalchemy.__version__.split(".") >= ["1", "4"]:
-    inspect(Users).add_property("orgID", column_property(select(Domains.orgID)
-                                                         .where(Domains.ID == Users.domainID).scalar_subquery()))
+    def _orgIDSubquery(cls):
+        return select(Domains.orgID).where(Domains.ID == cls.domainID).scalar_subquery()
+
+    def _domainIDs(criterion):
+        return select(Domains.ID).where(criterion)
 else:
-    inspect(Users).add_property("orgID", column_property(select([Domains.orgID])
-                                                         .where(Domains.ID == Users.domainID).as_scalar()))
+    def _orgIDSubquery(cls):
+        return select([Domains.orgID]).where(Domains.ID == cls.domainID).as_scalar()
+
+    def _domainIDs(criterion):
+        return select([Domains.ID]).where(criterion)
+
+
+class _OrgIDComparator(Comparator):
+    """SQL expression of `Users.orgID`.
+
+    The organization is not stored in the users table. Comparisons are translated into a semi-join on the domain
+    (`domain_id IN (SELECT id FROM domains WHERE org_id ...)`), which is resolved once per query using the indexes
+    of both tables instead of evaluating a subquery for each user.
+    Other operations (e.g. sorting) fall back to a correlated subquery, which is labeled `orgID` so that it can be
+    accessed by name when selected with `with_entities`.
+    """
+    def __init__(self, cls):
+        Comparator.__init__(self, _orgIDSubquery(cls).label("orgID"))
+        self.__cls = cls
+
+    def operate(self, op, *other, **kwargs):
+        if operators.is_comparison(op):
+            return self.__cls.domainID.in_(_domainIDs(op(Domains.orgID, *other, **kwargs)))
+        return op(self.expression, *other, **kwargs)
 
 
 @event.listens_for(Users, "expire")
@@ -4,6 +4,92 @@
 
 from . import ServiceHub
 
+from tools.metrics import Metrics
+
+import os
+import threading
+import time
+
+
+class ConnectionPool:
+    """Pool of idle exmdb connections.
+
+    Connections are kept separately for each combination of host, port, home directory and database type.
+    Connections idle for longer than `idleTimeout` seconds are discarded when leased, as the server might have closed
+    them in the meantime. The pool is reset in forked processes.
+    """
+    def __init__(self, factory, size, idleTimeout):
+        """Initialize pool.
+
+        Parameters
+        ----------
+        factory : callable
+            Function creating a new connection from (host, port, homedir, isPrivate)
+        size : int
+            Maximum number of idle connections per key
+        idleTimeout : float
+            Maximum time in seconds a connection may stay idle
+        """
+        self.factory = factory
+        self.size = size
+        self.idleTimeout = idleTimeout
+        self.__lock = threading.Lock()
+        self.__idle = {}
+        self.__pid = os.getpid()
+
+    def lease(self, *key):
+        """Get a connection.
+
+        Returns a healthy idle connection if available or creates a new one.
+
+        Parameters
+        ----------
+        *key : tuple
+            Host, port, homedir and isPrivate flag
+
+        Returns
+        -------
+        Connection object
+            Connection
+        bool
+            Whether the connection was taken from the pool
+        """
+        now = time.monotonic()
+        with self.__lock:
+            if self.__pid != os.getpid():
+                self.__idle, self.__pid = {}, os.getpid()
+                Metrics.set("exmdbPool", "idle", 0)
+            idle = self.__idle.get(key)
+            while idle:
+                connection, since = idle.pop()
+                Metrics.inc("exmdbPool", "idle", -1)
+                if now-since <= self.idleTimeout:
+                    Metrics.inc("exmdbPool", "reused")
+                    return connection, True
+                Metrics.inc("exmdbPool", "expired")
+        Metrics.inc("exmdbPool", "created")
+        return self.factory(*key), False
+
+    def release(self, key, connection):
+        """Return connection to the pool.
+
+        If the pool is full, the connection is closed.
+
+        Parameters
+        ----------
+        key : tuple
+            Key the connection was leased with
+        connection : Connection object
+            Connection to return
+        """
+        with self.__lock:
+            idle = self.__idle.setdefault(key, [])
+            if self.__pid == os.getpid() and len(idle) < self.size:
+                idle.append((connection, time.monotonic()))
+                Metrics.inc("exmdbPool", "idle")
+                return
+        Metrics.inc("exmdbPool", "closed")
+
 
 def exmdbHandleException(service, error):
     if isinstance(error, ExmdbService.ConnectionError):
@@ -12,10 +98,58 @@ def exmdbHandleException(service, error):
 
 @ServiceHub.register("exmdb", exmdbHandleException)
 class ExmdbService:
+    class _Lease:
+        """Connection leased from the connection pool.
+
+        Forwards all calls to the connection and returns it to the pool when the lease is garbage collected.
+        If the first call on a pooled connection fails with a connection error (e.g. because the server closed the
+        socket), the connection is dropped and the call is retried once on a new connection.
+        Connections that raised a connection or protocol error are discarded.
+        """
+        def __init__(self, pool, key, connection, reused, errors, retryErrors):
+            self.__pool = pool
+            self.__key = key
+            self.__connection = connection
+            self.__reused = reused
+            self.__errors = errors
+            self.__retryErrors = retryErrors
+            self.__broken = False
+
+        def __getattr__(self, attr):
+            target = getattr(self.__connection, attr)
+            if not callable(target):
+                return target
+
+            def call(*args, **kwargs):
+                try:
+                    try:
+                        result = getattr(self.__connection, attr)(*args, **kwargs)
+                    except self.__retryErrors:
+                        if not self.__reused:
+                            raise
+                        Metrics.inc("exmdbPool", "discarded")
+                        Metrics.inc("exmdbPool", "retried")
+                        self.__reused = False
+                        self.__connection = self.__pool.factory(*self.__key)
+                        Metrics.inc("exmdbPool", "created")
+                        result = getattr(self.__connection, attr)(*args, **kwargs)
+                except self.__errors:
+                    self.__broken = True
+                    raise
+                self.__reused = False
+                return result
+            return call
+
+        def __del__(self):
+            if self.__broken:
+                Metrics.inc("exmdbPool", "discarded")
+            else:
+                self.__pool.release(self.__key, self.__connection)
+
     class _BoundClient:
         def __init__(self, exmdb, host, port, homedir, isPrivate):
             self.__homedir = homedir
-            self.__client = exmdb.ExmdbQueries(host, port, homedir, isPrivate)
+            self.__client = exmdb._connect(host, port, homedir, isPrivate)
 
         def __getattr__(self, attr):
             target = getattr(self.__client, attr)
@@ -29,9 +163,12 @@ class ExmdbService:
     __methods = ("TaggedPropval", "FolderList", "FolderMemberList")
 
     def __init__(self):
+        from tools.config import Config
         self._loadPyexmdb()
         for method in self.__methods:
             setattr(self, method, getattr(self.pyexmdb, method))
+        self.pool = ConnectionPool(self.ExmdbQueries, Config["options"].get("exmdbPoolSize", 4),
+                                   Config["options"].get("exmdbPoolIdleTimeout", 60))
 
     @classmethod
     def _loadPyexmdb(cls):
@@ -67,7 +204,23 @@ class ExmdbService:
         pyexmdb.ExmdbQueries
             Exmdb client
         """
-        return self.ExmdbQueries(self.host, self.port, homedir, isPrivate)
+        return self._connect(self.host, self.port, homedir, isPrivate)
+
+    def _connect(self, host, port, homedir, isPrivate):
+        """Get a connection from the pool.
+
+        If pooling is disabled (`options.exmdbPoolSize` is 0), a new connection is created.
+
+        Returns
+        -------
+        services.exmdb.ExmdbService._Lease or pyexmdb.ExmdbQueries
+            Exmdb client
+        """
+        if self.pool.size <= 0:
+            return self.ExmdbQueries(host, port, homedir, isPrivate)
+        key = (host, port, homedir, isPrivate)
+        return self._Lease(self.pool, key, *self.pool.lease(*key), (self.ConnectionError, self.ExmdbProtocolError),
+                           self.ConnectionError)
 
     def user(self, user):
         """Create client for user.
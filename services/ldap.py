@@ -4,15 +4,23 @@
 
 from . import ServiceHub, ServiceDisabledError, ServiceUnavailableError, InstanceDefault
 
+import copy
 import ldap3
 import ldap3.core.exceptions as ldapexc
 import ldap3.utils.config as ldap3_conf
 import re
 import threading
+import time
 import yaml
 
+from collections import OrderedDict
+from contextlib import contextmanager
 from ldap3.utils.conv import escape_filter_chars
+from ldap3.utils.dn import parse_dn, to_dn
+from tools.metrics import Metrics
+
 import logging
+import os
 logger = logging.getLogger("ldap")
 
 # Reduce block time when LDAP server is not reachable
@@ -20,13 +28,232 @@ ldap3_conf.set_config_parameter("RESTARTABLE_SLEEPTIME", 1)
 ldap3_conf.set_config_parameter("RESTARTABLE_TRIES", 2)
 
 
+_dnSeparators = re.compile(r"\s*([,=+])\s*")
+
+_connectionErrors = (ldapexc.LDAPSocketOpenError, ldapexc.LDAPSocketSendError, ldapexc.LDAPSessionTerminatedByServerError,
+                     ldapexc.LDAPMaximumRetriesError)
+
+
+class ResultCache:
+    """Bounded LRU cache of LDAP lookup results.
+
+    Entries expire `ttl` seconds after they were added. A TTL of 0 disables the cache.
+    Hit and miss counts of all caches are reported in the `ldapCache` metrics section.
+    The cache is local to the process, clearing it does not affect caches of other worker processes.
+    """
+    _missing = object()
+    _hits = _misses = 0
+    _countLock = threading.Lock()
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    @property
+    def enabled(self):
+        return self.maxsize > 0 and self.ttl > 0
+
+    @classmethod
+    def _count(cls, hit):
+        with cls._countLock:
+            if hit:
+                cls._hits += 1
+            else:
+                cls._misses += 1
+            hitRate = cls._hits/(cls._hits+cls._misses)
+        Metrics.inc("ldapCache", "hits" if hit else "misses")
+        Metrics.set("ldapCache", "hitRate", hitRate)
+
+    def get(self, key, default=None):
+        """Get cached result.
+
+        Parameters
+        ----------
+        key : tuple
+            Cache key
+        default : Any, optional
+            Value to return if no valid entry exists. The default is None.
+
+        Returns
+        -------
+        Any
+            Cached result or default
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                self.entries.pop(key)
+                entry = None
+            if entry is not None:
+                self.entries.move_to_end(key)
+        self._count(entry is not None)
+        return default if entry is None else entry[1]
+
+    def put(self, key, value):
+        """Add result to the cache.
+
+        Parameters
+        ----------
+        key : tuple
+            Cache key
+        value : Any
+            Result to cache
+        """
+        with self.lock:
+            self.entries[key] = (time.monotonic()+self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """Remove all entries."""
+        with self.lock:
+            self.entries.clear()
+
+    def cached(self, key, func, *args, **kwargs):
+        """Get cached result or call function and cache its return value.
+
+        Results are copied when stored and when retrieved, so that callers cannot modify cached objects.
+        None results (i.e. objects not found) are not cached.
+
+        Parameters
+        ----------
+        key : tuple
+            Cache key
+        func : callable
+            Function to call on cache miss
+        *args : Any
+            Arguments forwarded to func
+        **kwargs : Any
+            Keyword arguments forwarded to func
+
+        Returns
+        -------
+        Any
+            Cached or computed result
+        """
+        if not self.enabled:
+            return func(*args, **kwargs)
+        value = self.get(key, self._missing)
+        if value is not self._missing:
+            return copy.deepcopy(value)
+        value = func(*args, **kwargs)
+        if value is not None:
+            self.put(key, copy.deepcopy(value))
+        return value
+
+
 def handleLdapError(service, error):
-    if isinstance(error,
-                  (ldapexc.LDAPSocketOpenError, ldapexc.LDAPSocketSendError, ldapexc.LDAPSessionTerminatedByServerError,
-                   ldapexc.LDAPMaximumRetriesError)):
+    if isinstance(error, _connectionErrors):
         return ServiceHub.SUSPENDED
 
 
+class ConnectionPool:
+    """Bounded pool of LDAP connections.
+
+    At most `size` connections are in use at the same time, additional leases block until a connection is returned or
+    `timeout` seconds have passed. Connections are created on demand and kept for reuse when returned.
+    Connections that raised a connection error or were closed by the lessee are unbound and discarded, all other
+    connections are returned to the pool, even if the lessee raised an exception. The pool is reset in forked
+    processes.
+    """
+    def __init__(self, name, factory, size, timeout):
+        """Initialize pool.
+
+        Parameters
+        ----------
+        name : str
+            Name of the pool, used as metrics prefix
+        factory : callable
+            Function creating a new connection
+        size : int
+            Maximum number of connections
+        timeout : float
+            Maximum time in seconds to wait for a free connection
+        """
+        self.name = name
+        self.factory = factory
+        self.size = max(size, 1)
+        self.timeout = timeout
+        self.__lock = threading.Lock()
+        self.__reset()
+
+    def __reset(self):
+        self.__idle = []
+        self.__slots = threading.BoundedSemaphore(self.size)
+        self.__pid = os.getpid()
+
+    def add(self, connection):
+        """Add an existing idle connection to the pool.
+
+        Parameters
+        ----------
+        connection : ldap3.Connection
+            Connection to add
+        """
+        with self.__lock:
+            if len(self.__idle) < self.size:
+                self.__idle.append(connection)
+
+    @contextmanager
+    def lease(self):
+        """Lease a connection.
+
+        Yields
+        ------
+        ldap3.Connection
+            Idle or newly created connection
+
+        Raises
+        ------
+        ServiceUnavailableError
+            No connection became available within the timeout
+        """
+        with self.__lock:
+            if self.__pid != os.getpid():
+                self.__reset()
+            slots = self.__slots
+        if not slots.acquire(blocking=False):
+            Metrics.inc("ldapPool", self.name+"Waits")
+            if not slots.acquire(timeout=self.timeout):
+                Metrics.inc("ldapPool", self.name+"Timeouts")
+                raise ServiceUnavailableError("No LDAP connection available")
+        try:
+            with self.__lock:
+                connection = self.__idle.pop() if self.__idle else None
+            if connection is None:
+                connection = self.factory()
+                Metrics.inc("ldapPool", self.name+"Created")
+            else:
+                Metrics.inc("ldapPool", self.name+"Reused")
+            discard = False
+            try:
+                yield connection
+            except _connectionErrors:
+                discard = True
+                raise
+            finally:
+                with self.__lock:
+                    if not discard and not connection.closed and slots is self.__slots and len(self.__idle) < self.size:
+                        self.__idle.append(connection)
+                        connection = None
+                if connection is not None:
+                    Metrics.inc("ldapPool", self.name+"Discarded")
+                    self._unbind(connection)
+        finally:
+            slots.release()
+
+    @staticmethod
+    def _unbind(connection):
+        """Unbind connection, ignoring any errors."""
+        try:
+            connection.unbind()
+        except Exception:
+            pass
+
+
 def argname(orgID=None):
     if orgID is not None:
         from orm.domains import Orgs
@@ -85,6 +312,13 @@ class SearchResult:
         else:
             self.error = "Unknown type"
 
+    def __deepcopy__(self, memo):
+        """Copy result data, sharing the LDAP service reference."""
+        result = memo[id(self)] = SearchResult.__new__(SearchResult)
+        for key, value in self.__dict__.items():
+            setattr(result, key, value if key == "_ldap" else copy.deepcopy(value, memo))
+        return result
+
     def __repr__(self):
         return "<{} {}>".format(self.type, self.email)
 
@@ -191,16 +425,23 @@ class LdapService:
         else:
             self._config = self._loadOrgConfig(orgID)
         self._userAttributes = self._checkConfig(self._config)
-        self.lock = threading.Lock()
         if self._config.get("disabled"):
             raise ServiceDisabledError("Service disabled by configuration")
         try:
-            self.conn = self.testConnection(self._config)
+            conn = self.testConnection(self._config)
         except ldap3.core.exceptions.LDAPInvalidDnError:
             raise ServiceUnavailableError("Invalid base DN")
         except Exception as err:
             msg = str(err.args[0]) if len(err.args) else type(err).__name__
             raise ServiceUnavailableError("Failed to connect to server: "+msg, *err.args[1:])
+        from tools.config import Config
+        size, timeout = Config["options"].get("ldapPoolSize", 4), Config["options"].get("ldapPoolTimeout", 10)
+        self.server = conn.server
+        self.pool = ConnectionPool("search", lambda: self._connect(self._config), size, timeout)
+        self.pool.add(conn)
+        self.authPool = ConnectionPool("auth", lambda: self._connect(self._config, bind=False), size, timeout)
+        ttl = self._config.get("cacheTTL", Config["options"].get("ldapCacheTTL", 0))
+        self.cache = ResultCache(Config["options"].get("ldapCacheSize", 1024), ttl)
         if "defaultQuota" in self._config["users"]:
             self._defaultProps = {prop: self._config["users"]["defaultQuota"] for prop in
                                   ("storagequotalimit", "prohibitsendquota", "prohibitreceivequota")}
@@ -319,14 +560,14 @@ class LdapService:
 
         def searchPaged(typeFilter, type, *args, **kwargs):
             filterExpr = "(&{}{}{})".format(baseFilter, typeFilter, customFilter)
-            if not self.conn.search(self._sbase, filterExpr, *args, **kwargs):
+            if not conn.search(self._sbase, filterExpr, *args, **kwargs):
                 return []
-            results = filtered(SearchResult(self, type, result) for result in self.conn.response)
-            cookie = self.conn.result.get("controls", {}).get("1.2.840.113556.1.4.319", {}).get("value", {}).get("cookie")
+            results = filtered(SearchResult(self, type, result) for result in conn.response)
+            cookie = conn.result.get("controls", {}).get("1.2.840.113556.1.4.319", {}).get("value", {}).get("cookie")
             while cookie and (not limit or len(results) < limit) and \
-                  self.conn.search(self._sbase, filterExpr, *args, **kwargs, paged_cookie=cookie):
-                results += filtered(SearchResult(self, type, result) for result in self.conn.response)
-                cookie = self.conn.result.get("controls", {}).get("1.2.840.113556.1.4.319", {}).get("value", {}).get("cookie")
+                  conn.search(self._sbase, filterExpr, *args, **kwargs, paged_cookie=cookie):
+                results += filtered(SearchResult(self, type, result) for result in conn.response)
+                cookie = conn.result.get("controls", {}).get("1.2.840.113556.1.4.319", {}).get("value", {}).get("cookie")
             return results[:limit] if limit and len(results) > limit else results
 
         if limit:
@@ -337,7 +578,7 @@ class LdapService:
         domainexpr = "(|{})".format("".join("({}=*@{})".format(username, d) for d in domains)) if domains is not None else ""
         filterexpr = "".join("("+f+")" for f in userconf.get("filters", ()))
         userFilter = "(&{}{}{})".format(filterexpr, userconf.get("filter", ""), domainexpr)
-        with self.lock:
+        with self.pool.lease() as conn:
             results = []
             if "user" in types:
                 results += searchPaged(userFilter, "user", *args, attributes=self._attrSet(attributes, "user"), **kwargs)
@@ -420,11 +661,37 @@ class LdapService:
         if len(response) > 1:
             return "Multiple entries found - please contact your administrator"
         userDN = response[0].DN
-        try:
-            ldap3.Connection(self._config["connection"].get("server"), user=userDN, password=password, auto_bind=True)
-        except ldapexc.LDAPBindError:
+        with self.authPool.lease() as conn:
+            try:
+                success = conn.rebind(user=userDN, password=password, authentication=ldap3.SIMPLE)
+            except ldapexc.LDAPBindError:
+                success = False
+            finally:
+                self._restoreBind(conn)
+        Metrics.inc("ldapPool", "authBinds")
+        if not success:
             return "Invalid username or Password"
 
+    def _restoreBind(self, conn):
+        """Rebind an authentication connection to the service account.
+
+        Connections that cannot be rebound are closed, so that they are discarded by the pool instead of being
+        reused with the credentials of the last authenticated user.
+
+        Parameters
+        ----------
+        conn : ldap3.Connection
+            Connection to rebind
+        """
+        conn.user = self._config["connection"].get("bindUser")
+        conn.password = self._config["connection"].get("bindPass")
+        try:
+            if conn.rebind(authentication=ldap3.SIMPLE if conn.user else ldap3.ANONYMOUS):
+                return
+        except ldapexc.LDAPException:
+            pass
+        ConnectionPool._unbind(conn)
+
     def downsyncUser(self, ID, props=None):
         """Create dictionary representation of the user from LDAP data.
 
@@ -470,6 +737,9 @@ class LdapService:
         ldap3.abstract.entry.Entry
             LDAP object or None if not found or ambiguous
         """
+        return self.cache.cached(("dump", ID), self._dumpUser, ID)
+
+    def _dumpUser(self, ID):
         res = self._search(self._matchFilters(ID), attributes="all")
         if len(res) != 1:
             return None
@@ -480,22 +750,34 @@ class LdapService:
     def escape_filter_chars(text, encoding=None):
         return escape_filter_chars(text, encoding)
 
-    def getAll(self, IDs):
+    def getAll(self, IDs, attributes=None, chunkSize=None):
         """Get user information for each ID.
 
-        Queries the same information as getUserInfo.
+        Queries the same information as getUserInfo unless other attributes are requested.
+        IDs are split into chunks, each of which is retrieved with a single OR-filtered search.
 
         Parameters
         ----------
         IDs : list of bytes or str
             IDs to search
+        attributes : str or list of str, optional
+            Attributes to query (see `_attrSet`). The default is None.
+        chunkSize : int, optional
+            Maximum number of IDs per search. The default is `options.ldapBatchSize`.
 
         Returns
         -------
         list
             List of GenericObjects with information about found users
         """
-        return self._search(self._matchFiltersMulti(IDs))
+        from tools.config import Config
+        chunkSize = chunkSize or Config["options"].get("ldapBatchSize", 500)
+        IDs = list(IDs)
+        results = []
+        for offset in range(0, len(IDs), chunkSize):
+            results += self._search(self._matchFiltersMulti(IDs[offset:offset+chunkSize]), attributes=attributes,
+                                    paged_size=chunkSize)
+        return results
 
     def getUserInfo(self, ID):
         """Get e-mail address of an ldap user.
@@ -509,6 +791,9 @@ class LdapService:
         GenericObject
             Object containing LDAP ID, username and display name of the user
         """
+        return self.cache.cached(("info", ID), self._getUserInfo, ID)
+
+    def _getUserInfo(self, ID):
         try:
             response = self._search(self._matchFilters(ID))
         except ldapexc.LDAPInvalidValueError:
@@ -517,6 +802,55 @@ class LdapService:
             return None
         return response[0]
 
+    def groupMemberships(self, pageSize=1000):
+        """Get group memberships of all objects.
+
+        Retrieves the group member attribute of all objects with a single paged search.
+
+        Parameters
+        ----------
+        pageSize : int, optional
+            Page size of the search. The default is 1000.
+
+        Returns
+        -------
+        dict
+            Mapping of normalized group DN (see `normalizeDN`) -> set of member IDs
+        """
+        memberAttr = self._config["groups"].get("groupMemberAttr", "memberOf")
+        memberships = {}
+        for result in self._search("({}=*)".format(memberAttr), attributes=(self._config["objectID"], memberAttr),
+                                   filterIncomplete=False, paged_size=pageSize):
+            if result.ID is None:
+                continue
+            groupDNs = result.data.get(memberAttr) or ()
+            for groupDN in (groupDNs if isinstance(groupDNs, list) else (groupDNs,)):
+                memberships.setdefault(self.normalizeDN(groupDN), set()).add(result.ID)
+        return memberships
+
+    @staticmethod
+    def normalizeDN(DN):
+        """Normalize DN for comparison.
+
+        Removes insignificant spaces around separators and converts the DN to lowercase.
+        DNs that cannot be parsed are normalized by removing all spaces around `,`, `=` and `+`.
+
+        Parameters
+        ----------
+        DN : str
+            DN to normalize
+
+        Returns
+        -------
+        str
+            Normalized DN
+        """
+        try:
+            rdns = (parse_dn(rdn.strip(), escape=False, strip=True) for rdn in to_dn(DN))
+            return ",".join("".join(attr+"="+value+sep for attr, value, sep in rdn) for rdn in rdns).lower()
+        except ldapexc.LDAPException:
+            return _dnSeparators.sub(r"\1", DN).lower()
+
     def groupMemberFilter(self, groupDN):
         """Generate filter expression for group members.
 
@@ -532,6 +866,14 @@ class LdapService:
         """
         return "({}={})".format(self._config["groups"].get("groupMemberAttr", "memberOf"), groupDN)
 
+    def invalidate(self):
+        """Discard all cached lookup results of this process.
+
+        Must be called whenever the directory is synchronized. Caches of other processes keep their entries until
+        they expire.
+        """
+        self.cache.clear()
+
     def searchUsers(self, query=None, domains=None, limit=None, pageSize=1000, filterIncomplete=True, types=None,
                     customFilter="", attributes=None):
         """Search for ldap users matching the query.
@@ -556,6 +898,13 @@ class LdapService:
         list
             List of user objects containing ID, e-mail and name
         """
+        key = ("search", query, tuple(domains) if domains is not None else None, limit, pageSize, filterIncomplete,
+               tuple(types) if types is not None else None, customFilter,
+               tuple(attributes) if isinstance(attributes, list) else attributes)
+        return list(self.cache.cached(key, self._searchUsers, query, domains, limit, pageSize, filterIncomplete, types,
+                                      customFilter, attributes))
+
+    def _searchUsers(self, query, domains, limit, pageSize, filterIncomplete, types, customFilter, attributes):
         try:
             exact = self.getUserInfo(self.unescapeFilterChars(query))
             exact = [] if exact is None else [exact]
@@ -586,17 +935,39 @@ class LdapService:
             return "Could not connect to LDAP server: "+" - ".join(str(v) for v in err.args)
 
     @classmethod
-    def testConnection(cls, config, active=True):
+    def _connect(cls, config, bind=True):
+        """Open a new connection.
+
+        Parameters
+        ----------
+        config : dict
+            LDAP configuration
+        bind : bool, optional
+            Bind with the configured credentials. If False, the connection is opened without bind.
+            The default is True.
+
+        Returns
+        -------
+        ldap3.Connection
+            New connection
+        """
         servers = [s[:-1] if s.endswith("/") else s for s in config["connection"]["server"].split()]
         pool = servers[0] if len(servers) == 1 else ldap3.ServerPool(servers, "FIRST", active=1)
-        user = config["connection"].get("bindUser")
-        password = config["connection"].get("bindPass")
+        user = config["connection"].get("bindUser") if bind else None
+        password = config["connection"].get("bindPass") if bind else None
         starttls = config["connection"].get("starttls")
         conn = ldap3.Connection(pool, user=user, password=password, client_strategy=ldap3.RESTARTABLE)
+        if not bind:
+            conn.open()
         if starttls and not conn.start_tls():
             logger.warning("Failed to initiate StartTLS connection")
-        if not conn.bind():
+        if bind and not conn.bind():
             raise ldapexc.LDAPBindError("LDAP bind failed ({}): {}".format(conn.result["description"], conn.result["message"]))
+        return conn
+
+    @classmethod
+    def testConnection(cls, config, active=True):
+        conn = cls._connect(config)
         if active:
             userconf = config["users"]
             filterexpr = "".join("("+f+")" for f in userconf.get("filters", ()))
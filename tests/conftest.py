@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2024 grommunio GmbH
+
+import os
+import sys
+
+import pytest
+
+# Configuration and resources are loaded relative to the repository root
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(root)
+sys.path.insert(0, root)
+
+
+class FakeRedis:
+    """Minimal in-memory replacement for the redis commands used by the caches."""
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def mget(self, *keys):
+        return [self.data.get(key) for key in keys]
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = str(value)
+        return True
+
+    def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def incrby(self, key, amount=1):
+        self.data[key] = str(int(self.data.get(key) or 0)+amount)
+        return int(self.data[key])
+
+    def incr(self, key, amount=1):
+        return self.incrby(key, amount)
+
+    def eval(self, script, numkeys, *args):
+        """Run the conditional increment script of `orm.users.LicenseCount`."""
+        key, amount = args[0], int(args[numkeys])
+        return self.incrby(key, amount) if key in self.data else None
+
+
+class FakeService:
+    """Replacement for `services.Service` providing fixed service managers."""
+    SUPPRESS_NONE = 0
+    SUPPRESS_INOP = 1
+    SUPPRESS_ALL = 2
+
+    def __init__(self, **managers):
+        self.managers = managers
+
+    def __call__(self, name, *args, **kwargs):
+        return _FakeServiceContext(self.managers[name])
+
+
+class _FakeServiceContext:
+    def __init__(self, manager):
+        self.manager = manager
+
+    def __enter__(self):
+        return self.manager
+
+    def __exit__(self, *args):
+        return False
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    """Replace `services.Service` by a `FakeService` providing a `FakeRedis` instance."""
+    services = pytest.importorskip("services")
+    redis = FakeRedis()
+    monkeypatch.setattr(services, "Service", FakeService(redis=redis))
+    return redis
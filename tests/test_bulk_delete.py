@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2024 grommunio GmbH
+
+import pytest
+
+sqlalchemy = pytest.importorskip("sqlalchemy")
+
+from sqlalchemy import Column, ForeignKey, Integer, String, create_engine, event  # noqa: E402
+from sqlalchemy.orm import relationship, sessionmaker  # noqa: E402
+
+from orm import NotifyTable, bulkDeletable, bulkDelete, declarative_base  # noqa: E402
+
+Base = declarative_base()
+
+
+class Entry(Base, NotifyTable):
+    __tablename__ = "entries"
+
+    ID = Column("id", Integer, primary_key=True)
+    name = Column("name", String(32))
+
+
+class Hooked(Base):
+    __tablename__ = "hooked"
+
+    ID = Column("id", Integer, primary_key=True)
+
+
+class Parent(Base):
+    __tablename__ = "parents"
+
+    ID = Column("id", Integer, primary_key=True)
+    children = relationship("Child", cascade="all, delete-orphan")
+
+
+class Child(Base):
+    __tablename__ = "children"
+
+    ID = Column("id", Integer, primary_key=True)
+    parentID = Column("parent_id", Integer, ForeignKey(Parent.ID))
+
+
+event.listen(Entry, "after_delete", Entry.NTtouch)
+deletedHooked = []
+event.listen(Hooked, "after_delete", lambda mapper, connection, target: deletedHooked.append(target.ID))
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(engine)()
+    session.add_all([Entry(ID=i, name="entry"+str(i)) for i in range(1, 11)])
+    session.add_all([Hooked(ID=i) for i in range(1, 4)])
+    session.commit()
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, stmt, *args: statements.append(stmt))
+    session.statements = statements
+    yield session
+    session.close()
+    Entry.NTclear()
+
+
+def test_bulk_deletable():
+    assert bulkDeletable(Entry)
+    assert bulkDeletable(Child)
+    assert not bulkDeletable(Hooked)
+    assert not bulkDeletable(Parent)
+
+
+def test_chunked_delete(session):
+    keys, affected = bulkDelete(session.query(Entry).filter(Entry.ID > 2), chunkSize=3)
+    session.commit()
+    assert sorted(keys) == list(range(3, 11))
+    assert affected == 8
+    assert sum(1 for stmt in session.statements if stmt.startswith("DELETE")) == 3
+    assert [ID for ID, in session.query(Entry.ID).order_by(Entry.ID)] == [1, 2]
+    assert Entry._NotifyTable__changed
+
+
+def test_hooked_delete(session):
+    deletedHooked.clear()
+    keys, affected = bulkDelete(session.query(Hooked))
+    session.commit()
+    assert sorted(keys) == sorted(deletedHooked) == [1, 2, 3]
+    assert affected == 3
+    assert session.query(Hooked).count() == 0
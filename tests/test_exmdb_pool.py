@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2024 grommunio GmbH
+
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("services")
+
+
+class FakeConnectionError(Exception):
+    pass
+
+
+class FakeProtocolError(Exception):
+    pass
+
+
+class FakeServer:
+    """Exmdb server stand-in. Restarting the server invalidates all open connections."""
+    def __init__(self):
+        self.generation = 0
+        self.up = True
+        self.connections = []
+
+    def connect(self, host, port, homedir, isPrivate):
+        if not self.up:
+            raise FakeConnectionError("Connection refused")
+        connection = FakeConnection(self)
+        self.connections.append(connection)
+        return connection
+
+    def restart(self):
+        self.generation += 1
+
+
+class FakeConnection:
+    def __init__(self, server):
+        self.server = server
+        self.generation = server.generation
+
+    def getStoreProperties(self, homedir, cpid, tags):
+        if self.generation != self.server.generation:
+            raise FakeConnectionError("Connection reset by peer")
+        return [(tag, homedir) for tag in tags]
+
+
+@pytest.fixture
+def server():
+    return FakeServer()
+
+
+@pytest.fixture
+def exmdb(server, monkeypatch):
+    from services.exmdb import ConnectionPool, ExmdbService
+    monkeypatch.setattr(ExmdbService, "ConnectionError", FakeConnectionError, raising=False)
+    monkeypatch.setattr(ExmdbService, "ExmdbProtocolError", FakeProtocolError, raising=False)
+    service = ExmdbService.__new__(ExmdbService)
+    service.host, service.port = "::1", "5000"
+    service.pool = ConnectionPool(server.connect, 2, 60)
+    return service
+
+
+user = SimpleNamespace(homeserver=None, maildir="/var/lib/gromox/user/0/1")
+
+
+def test_reuse(exmdb, server):
+    assert exmdb.user(user).getStoreProperties(0, [1]) == [(1, user.maildir)]
+    assert exmdb.user(user).getStoreProperties(0, [2]) == [(2, user.maildir)]
+    assert len(server.connections) == 1
+
+
+def test_retry_stale_connection(exmdb, server):
+    exmdb.user(user).getStoreProperties(0, [1])
+    server.restart()
+    assert exmdb.user(user).getStoreProperties(0, [1]) == [(1, user.maildir)]
+    assert len(server.connections) == 2
+    exmdb.user(user).getStoreProperties(0, [1])
+    assert len(server.connections) == 2  # Fresh connection was returned to the pool, stale one was dropped
+
+
+def test_server_down(exmdb, server):
+    exmdb.user(user).getStoreProperties(0, [1])
+    server.restart()
+    server.up = False
+    with pytest.raises(FakeConnectionError):
+        exmdb.user(user).getStoreProperties(0, [1])
+    server.up = True
+    exmdb.user(user).getStoreProperties(0, [1])
+    assert len(server.connections) == 2
+
+
+def test_no_retry_on_new_connection(exmdb, server):
+    client = exmdb.user(user)
+    client.getStoreProperties(0, [1])
+    server.restart()
+    with pytest.raises(FakeConnectionError):
+        client.getStoreProperties(0, [1])  # Connection was already used successfully, not stale from the pool
+    del client
+    exmdb.user(user).getStoreProperties(0, [1])
+    assert len(server.connections) == 2
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2024 grommunio GmbH
+
+import pytest
+
+sqlalchemy = pytest.importorskip("sqlalchemy")
+
+from sqlalchemy import Column, Integer, String, create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from orm import declarative_base  # noqa: E402
+from tools.DataModel import DataModel, Id, Text  # noqa: E402
+
+Base = declarative_base()
+
+
+class Entry(DataModel, Base):
+    __tablename__ = "entries"
+
+    ID = Column("id", Integer, primary_key=True)
+    name = Column("name", String(32), index=True)
+
+    _dictmapping_ = ((Id(), Text("name", flags="sort")),)
+
+
+@pytest.fixture(scope="module")
+def session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(engine)()
+    names = ["a", "b", None, "b", "c", None, "a", "d", "b", "c", "e", None]
+    session.bulk_insert_mappings(Entry, [{"ID": ID, "name": name} for ID, name in enumerate(names, 1)])
+    session.commit()
+    yield session
+    session.close()
+
+
+@pytest.mark.parametrize("sorts", [[], ["name"], ["name,desc"]])
+@pytest.mark.parametrize("limit", [1, 2, 5])
+def test_keyset_pages(session, sorts, limit):
+    expected = [entry.ID for entry in Entry.keyset(session.query(Entry), sorts)]
+    seen, cursor = [], None
+    while True:
+        page = Entry.keyset(session.query(Entry), sorts, cursor).limit(limit).all()
+        if not page:
+            break
+        seen += [entry.ID for entry in page]
+        cursor = page[-1].keysetValues(sorts)
+    assert seen == expected
+    assert sorted(seen) == list(range(1, 13))
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2024 grommunio GmbH
+
+import pytest
+
+pytest.importorskip("ldap3")
+
+
+@pytest.fixture
+def cache():
+    from services.ldap import ResultCache
+    return ResultCache(16, 60)
+
+
+def test_cached_results_are_copies(cache):
+    first = cache.cached("key", lambda: [{"name": "user"}])
+    first[0]["name"] = "modified"
+    first.append(None)
+    assert cache.cached("key", lambda: None) == [{"name": "user"}]
+
+
+def test_missing_results_not_cached(cache):
+    assert cache.cached("key", lambda: None) is None
+    assert cache.cached("key", lambda: "found") == "found"
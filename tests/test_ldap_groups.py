@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2024 grommunio GmbH
+
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("ldap3")
+pytest.importorskip("sqlalchemy")
+
+
+def test_group_members_mixed_case():
+    from services.ldap import LdapService
+    from tools.ldap import _groupMemberIDs
+    ldapgroups = [SimpleNamespace(email="Sales@Example.org", DN="CN=Sales, OU=Groups,DC=example,DC=org"),
+                  SimpleNamespace(email="unknown@example.org", DN="cn=unknown,ou=groups,dc=example,dc=org")]
+    groups = {"sales@example.org": 7}
+    memberships = {LdapService.normalizeDN("cn=sales,ou=groups,dc=example,dc=org"): {b"a", b"b"}}
+    assert _groupMemberIDs(ldapgroups, groups, memberships, LdapService.normalizeDN) == {7: {b"a", b"b"}}
+
+
+def test_normalize_dn():
+    from services.ldap import LdapService
+    assert LdapService.normalizeDN("CN=Sales,  OU=Groups,DC=Example,DC=org") == \
+        LdapService.normalizeDN("cn=sales,ou=groups,dc=example,dc=org")
+
+
+def test_normalize_dn_separators():
+    from services.ldap import LdapService
+    assert LdapService.normalizeDN(" CN = Sales\\, EMEA , OU=Groups + uid=x,DC=org") == \
+        "cn=sales\\, emea,ou=groups+uid=x,dc=org"
+    assert LdapService.normalizeDN("CN=Sales,  OU=Groups,DC=org=") == "cn=sales,ou=groups,dc=org="
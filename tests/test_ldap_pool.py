@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2024 grommunio GmbH
+
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("ldap3")
+
+
+class FakeConnection:
+    """Connection accepting only the service account credentials."""
+    def __init__(self):
+        self.user = "cn=service"
+        self.password = "secret"
+        self.closed = False
+        self.unbound = False
+
+    def rebind(self, user=None, password=None, authentication=None):
+        if user:
+            self.user = user
+        if password is not None:
+            self.password = password
+        if (self.user, self.password) != ("cn=service", "secret"):
+            import ldap3.core.exceptions as ldapexc
+            raise ldapexc.LDAPBindError("invalidCredentials")
+        return True
+
+    def unbind(self):
+        self.closed = self.unbound = True
+
+
+@pytest.fixture
+def service():
+    from services.ldap import ConnectionPool, LdapService
+    ldap = LdapService.__new__(LdapService)
+    ldap._config = {"connection": {"bindUser": "cn=service", "bindPass": "secret"}}
+    ldap.authPool = ConnectionPool("auth", FakeConnection, 1, 0.1)
+    ldap._search = lambda *args, **kwargs: [SimpleNamespace(DN="cn=user")]
+    ldap._matchFilters = lambda ID: None
+    return ldap
+
+
+def test_failed_auth_keeps_connection(service):
+    with service.authPool.lease() as conn:
+        pass
+    assert service.authUser("user", "wrong") is not None
+    with service.authPool.lease() as reused:
+        assert reused is conn
+        assert reused.user == "cn=service"
+        assert not reused.unbound
+
+
+def test_connection_error_discards(service):
+    import ldap3.core.exceptions as ldapexc
+    with pytest.raises(ldapexc.LDAPSocketSendError):
+        with service.authPool.lease() as conn:
+            raise ldapexc.LDAPSocketSendError("connection lost")
+    assert conn.unbound
+    with service.authPool.lease() as new:
+        assert new is not conn
+
+
+def test_other_error_returns_connection(service):
+    with pytest.raises(ValueError):
+        with service.authPool.lease() as conn:
+            raise ValueError()
+    with service.authPool.lease() as reused:
+        assert reused is conn
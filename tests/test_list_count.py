@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2024 grommunio GmbH
+
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("flask")
+
+
+class FakeModel:
+    __tablename__ = "users"
+    _meta = SimpleNamespace(filters=(SimpleNamespace(key="domainID"),))
+
+    @classmethod
+    def _init(cls):
+        pass
+
+
+class FakeQuery:
+    def count(self):
+        return 3
+
+
+@pytest.fixture
+def count(monkeypatch):
+    import endpoints
+    from api.core import API
+    monkeypatch.setattr(endpoints, "_tableCardinality", lambda Model: 1000)
+
+    def count(url, permissions, scoped=False):
+        from flask import request
+        with API.test_request_context(url):
+            request.auth = {"user": SimpleNamespace(permissions=lambda: permissions)}
+            return endpoints.countQuery(FakeModel, FakeQuery(), scoped=scoped)
+    return count
+
+
+def test_estimate(count):
+    from tools.permissions import Permissions, SystemAdminPermission
+    assert count("/api/v1/system/users?count=estimate", Permissions(SystemAdminPermission())) == 1000
+
+
+def test_estimate_fallback(count):
+    from tools.permissions import DomainAdminPermission, Permissions, SystemAdminPermission
+    admin = Permissions(SystemAdminPermission())
+    assert count("/api/v1/domains/1/users?count=estimate", Permissions(DomainAdminPermission(1))) == 3
+    assert count("/api/v1/domains/1/users?count=estimate", admin, scoped=True) == 3
+    assert count("/api/v1/system/users?count=estimate&match=john", admin) == 3
+    assert count("/api/v1/system/users?count=estimate&domainID=2", admin) == 3
+    assert count("/api/v1/system/users", admin) == 3
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2024 grommunio GmbH
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("openapi_core")
+
+
+@pytest.fixture(scope="module")
+def core():
+    from api import core
+    from endpoints import misc  # noqa: F401 - registers /status
+    return core
+
+
+def test_validate_request(core):
+    from flask import request
+    with core.API.test_request_context("/api/v1/status", method="GET"):
+        assert request.url_rule is not None
+        for _ in range(2):  # Second validation uses the cached route lookup
+            result = core.validator.validateRequest(request)
+            assert not result.errors
+
+
+def test_validate_response(core):
+    from flask import request
+    with core.API.test_request_context("/api/v1/status", method="GET"):
+        response = core.API.make_response(({"message": "API is operational"}, 200))
+        assert core.validator.validateResponse(request, response) == []
+
+
+def test_route_cache_size(core):
+    from flask import request
+    validator = core.validator
+    if not hasattr(validator, "routeCache"):
+        pytest.skip("Route cache not used with this openapi-core version")
+    with core.API.test_request_context("/api/v1/status", method="GET"):
+        validator.validateRequest(request)
+    assert 0 < len(validator.routeCache) <= validator.routeCacheSize
+
+
+def test_deferred_validation_bounded(core, monkeypatch):
+    import threading
+    from concurrent.futures import Future
+    futures = []
+
+    class Executor:
+        def submit(self, func, *args):
+            futures.append(Future())
+            return futures[-1]
+
+    monkeypatch.setattr(core, "_responseExecutor", Executor())
+    monkeypatch.setattr(core, "_responseSlots", threading.BoundedSemaphore(2))
+    assert core.deferResponseValidation(None, None)
+    assert core.deferResponseValidation(None, None)
+    assert not core.deferResponseValidation(None, None)  # Queue full, dropped
+    futures[0].set_result(None)
+    assert core.deferResponseValidation(None, None)
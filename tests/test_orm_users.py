@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2024 grommunio GmbH
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+
+@pytest.fixture(scope="module")
+def DB():
+    from orm import DB
+    if DB is None:
+        pytest.skip("Database not configured")
+    return DB
+
+
+def test_orgid_entity_name(DB):
+    from orm.users import Users
+    query = Users.query.with_entities(Users.ID, Users.orgID)
+    assert [column["name"] for column in query.column_descriptions] == ["ID", "orgID"]
+
+
+def test_orgid_row_access(DB):
+    from orm.domains import Domains
+    from orm.users import Users
+    if DB.testConnection() is not None:
+        pytest.skip("Database not available")
+    row = Users.query.with_entities(Users.ID, Users.domainID, Users.orgID).first()
+    if row is None:
+        pytest.skip("No users in database")
+    domain = Domains.query.filter(Domains.ID == row.domainID).with_entities(Domains.orgID).first()
+    assert row.orgID == domain.orgID
+
+
+def test_list_query_count(DB):
+    """Number of queries for a level 2 user list must not depend on the page size."""
+    pytest.importorskip("flask")
+    from sqlalchemy import event
+    from api.core import API
+    from endpoints import userQuery
+    from orm.users import Users
+    if DB.testConnection() is not None:
+        pytest.skip("Database not available")
+    if Users.query.filter(Users.ID > 0).count() < 10:
+        pytest.skip("Not enough users in database")
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    def listQueries(limit):
+        statements.clear()
+        with API.test_request_context("/api/v1/system/users?level=2&count=none&properties=displayname&limit="+str(limit)):
+            response = userQuery()
+            DB.session.remove()
+        assert len(response.get_json()["data"]) == limit
+        return len(statements)
+
+    event.listen(DB.engine, "after_cursor_execute", count)
+    try:
+        assert listQueries(2) == listQueries(10)
+    finally:
+        event.remove(DB.engine, "after_cursor_execute", count)
+
+
+def test_license_count_reconciliation(DB, monkeypatch):
+    """Redis license counter must match the database after random changes."""
+    import random
+    from conftest import FakeRedis, FakeService
+    from orm import users
+    from orm.domains import Domains
+    if DB.testConnection() is not None:
+        pytest.skip("Database not available")
+    domain = Domains.query.first()
+    if domain is None:
+        pytest.skip("No domains in database")
+    redis = FakeRedis()
+    monkeypatch.setattr(users, "Service", FakeService(redis=redis))
+    rand = random.Random(4711)
+    created = []
+    try:
+        assert users.LicenseCount.get() == users.Users.count()
+        for step in range(50):
+            action = rand.choice(("create", "create", "delete", "toggle") if created else ("create",))
+            user = rand.choice(created) if action != "create" else users.Users(None)
+            if action == "create":
+                user.username = "licensecount-test-{}@{}".format(step, domain.domainname)
+                user.domainID = domain.ID
+                user.maildir = rand.choice(("", "/var/lib/gromox/user/test"))
+                user.addressStatus = rand.choice((users.Users.NORMAL, users.Users.SUSPENDED))
+                DB.session.add(user)
+            elif action == "delete":
+                DB.session.delete(user)
+            else:
+                user.addressStatus = users.Users.SUSPENDED if user.addressStatus == users.Users.NORMAL else users.Users.NORMAL
+            if rand.random() < 0.2:
+                DB.session.rollback()
+            else:
+                DB.session.commit()
+                if action == "create":
+                    created.append(user)
+                elif action == "delete":
+                    created.remove(user)
+            assert int(redis.get(users.LicenseCount.key)) == users.Users.count()
+    finally:
+        DB.session.rollback()
+        for user in created:
+            DB.session.delete(user)
+        DB.session.commit()
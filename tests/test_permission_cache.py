@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2024 grommunio GmbH
+
+import pytest
+
+
+@pytest.fixture
+def cache(redis):
+    from tools.permissions import PermissionCache
+    return PermissionCache
+
+
+@pytest.fixture
+def permissions():
+    from tools.permissions import DomainAdminPermission, Permissions
+    return Permissions(DomainAdminPermission(1))
+
+
+def test_invalidation_across_workers(cache, permissions):
+    _, generation = cache.get(1)
+    cache.put(1, permissions, generation)
+    cached, _ = cache.get(1)
+    assert cached is not None
+    cache.invalidate()  # Role change committed by another worker
+    cached, _ = cache.get(1)
+    assert cached is None
+
+
+def test_put_after_concurrent_invalidation(cache, permissions):
+    _, generation = cache.get(1)
+    cache.invalidate()  # Role change committed while permissions were loaded from the database
+    cache.put(1, permissions, generation)
+    cached, _ = cache.get(1)
+    assert cached is None
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2024 grommunio GmbH
+
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import FakeRedis, FakeService
+
+pytest.importorskip("services")
+
+
+class FakeExmdb:
+    """Exmdb stand-in recording written properties."""
+    def __init__(self):
+        self.written = []
+        self.down = False
+
+    def TaggedPropval(self, tag, value):
+        return tag, value
+
+    def user(self, user):
+        return self
+
+    def setStoreProperties(self, flags, props):
+        if self.down:
+            raise ConnectionError("exmdb not reachable")
+        self.written.append(dict(props))
+
+    def removeStoreProperties(self, tags):
+        pass
+
+
+class FakePropMap:
+    def __init__(self, props):
+        self.props = props
+
+    def rawmap(self):
+        return dict(self.props)
+
+    def contentmap(self):
+        return dict(self.props)
+
+
+def test_unknown_state_is_full(redis):
+    from tools.storage import StoreSyncState
+    assert StoreSyncState.get(1) is None
+    StoreSyncState.put(1, {0x3001001F: "User", 0x3A06001F: "Given"})
+    state = StoreSyncState.get(1)
+    assert StoreSyncState.changed({0x3001001F: "User", 0x3A06001F: "Given"}, state) == set()
+    assert StoreSyncState.changed({0x3001001F: "Renamed", 0x3A06001F: "Given"}, state) == {0x3001001F}
+    StoreSyncState.discard(1)
+    assert StoreSyncState.get(1) is None
+
+
+def test_resync_after_failure(monkeypatch):
+    from orm import DB
+    if DB is None:
+        pytest.skip("Database not configured")
+    import services
+    from orm import users
+    exmdb = FakeExmdb()
+    service = FakeService(redis=FakeRedis(), exmdb=exmdb)
+    monkeypatch.setattr(services, "Service", service)
+    monkeypatch.setattr(users, "Service", service)
+    user = SimpleNamespace(ID=1, maildir="/tmp/user", properties=FakePropMap({0x3001001F: "User", 0x3A06001F: "Given"}))
+    assert users.Users.syncStore(user) == (2, 0)
+    assert users.Users.syncStore(user) == (0, 2)
+    user.properties = FakePropMap({0x3001001F: "Renamed", 0x3A06001F: "Given"})
+    exmdb.down = True
+    with pytest.raises(ConnectionError):
+        users.Users.syncStore(user)
+    exmdb.down = False
+    # Properties are loaded again from the database by the next request, the failed write must not be lost
+    assert users.Users.syncStore(user) == (2, 0)
+    assert exmdb.written[-1] == {0x3001001F: "Renamed", 0x3A06001F: "Given"}
@@ -2,11 +2,13 @@
 # SPDX-License-Identifier: AGPL-3.0-or-later
 # SPDX-FileCopyrightText: 2020 grommunio GmbH
 
-from sqlalchemy import func, or_, String
+import sqlalchemy
+from sqlalchemy import and_, case, false, func, or_, String
 from sqlalchemy.inspection import inspect as inspecc
 from sqlalchemy.orm import joinedload, aliased
 
 from collections.abc import Iterable
+from operator import attrgetter
 
 import logging
 logger = logging.getLogger("DataModel")
@@ -25,6 +27,76 @@ def _str2bool(string):
     raise ValueError("Argument must be either 'true' or 'false'")
 
 
+def matchRank(columns, expr):
+    """Create SQL expression ranking how well columns match an expression.
+
+    Exact matches are ranked 0, prefix matches 1, substring matches 2 and anything else 3.
+    If multiple columns are given, the best rank is used.
+
+    Parameters
+    ----------
+    columns : Iterable of Column
+        Columns to rank
+    expr : str
+        Match expression
+
+    Returns
+    -------
+    SQL expression
+        Rank expression or None if no columns are given
+    """
+    expr = expr.lower()
+
+    def rank(column):
+        whens = ((func.lower(column) == expr, 0), (column.ilike(expr+"%"), 1), (column.ilike("%"+expr+"%"), 2))
+        if sqlalchemy.__version__.split(".") >= ["1", "4"]:
+            return case(*whens, else_=3)
+        return case(list(whens), else_=3)
+
+    ranks = [rank(column) for column in columns]
+    if len(ranks) == 0:
+        return None
+    return ranks[0] if len(ranks) == 1 else func.least(*ranks)
+
+
+def matchFilters(Model, targets, expr):
+    """Create filter expressions for matching.
+
+    Each word of the expression is matched against the target columns. If a search index is configured
+    (`DataModel.searchIndex`) and covers all columns matched by default, matching is restricted to the index candidates,
+    which are still checked with `ilike`. Words that are too short to be looked up in the index and searches including
+    columns that are not indexed (e.g. joined attributes) are matched with `ilike` only, as the rows have to be scanned
+    anyway.
+
+    Parameters
+    ----------
+    Model : DataModel
+        Model to match
+    targets : list of tuple(DataModel.Prop, Column)
+        Properties and resolved columns to match against
+    expr : str
+        Match expression
+
+    Returns
+    -------
+    list
+        List of filter expressions, any of which must match
+    """
+    defaults = [(prop, column) for prop, column in targets if prop.match == "default"]
+    index = DataModel.searchIndex if DataModel.searchIndex is not None and DataModel.searchIndex.covers(Model) and\
+        len(defaults) and all(DataModel.searchIndex.indexed(prop) for prop, _ in defaults) else None
+    filters = []
+    for word in expr.split():
+        match = "%"+word+"%"
+        candidates = index.candidates(Model, word) if index is not None else None
+        if candidates is not None:
+            filters.append(and_(Model.ID.in_(candidates), or_(*(column.ilike(match) for _, column in defaults))))
+        else:
+            filters += [column.ilike(match) for _, column in defaults]
+    filters += [column == prop.tf(expr) for prop, column in targets if prop.match == "exact" and prop.tf(expr) is not None]
+    return filters
+
+
 class MismatchROError(BaseException):
     """Exception raised when a read-only attribute does not match."""
 
@@ -49,12 +121,17 @@ class DataModel:
     Provides standardizes implementation for reading and writing data from and to SQLAlchemy mapped tables.
     """
 
+    searchIndex = None  # Search index backend used by automatch, see orm.search.SearchIndex
+
     class Prop:
         """Property representation.
 
         Manages property settings.
         """
 
+        __slots__ = ("attr", "_alias", "flags", "args", "kwargs", "mask", "target", "flat", "dispname", "func", "qopt", "link",
+                     "filter", "proxy", "arg_tf", "match")
+
         def __init__(self, attr, alias=None, flags=None, args=(), kwargs={}, mask=None, target=None, dispname=None,
                      flat=None, func=None, link=None, filter=None, qopt=joinedload, proxy=None, arg_tf=None, match="default",
                      **unknown):
@@ -176,6 +253,33 @@ class DataModel:
                 val = base.val(*self.args, **self.kwargs)
             return val
 
+        def getter(self):
+            """Create function returning the value of an instance.
+
+            The function is equivalent to `value` with the default transformation, but all checks are performed in
+            advance. Proxy properties are not supported.
+
+            Returns
+            -------
+            function
+                Function taking the instance as single argument
+            """
+            attr = self.attr
+            if "ref" in self.flags:
+                deref = self.deref
+
+                def get(base):
+                    val = getattr(base, attr)
+                    return {k: deref(v) for k, v in val.items()} if isinstance(val, dict) else\
+                        [deref(v) for v in val] if _isCollection(val) else deref(val)
+                return get
+            if self.func is not None:
+                func, args, kwargs = self.func, self.args, self.kwargs
+                return lambda base: func(getattr(base, attr), *args, **kwargs)
+            if "call" in self.flags:
+                return self.value
+            return attrgetter(attr)
+
         def resolve(self, Model, query, unmask=False):
             """Resolve foreign columns and add join statements.
 
@@ -270,6 +374,38 @@ class DataModel:
                 self.lookup[m].flags.add("match")
             self.filters = tuple(self.props(predicate=lambda prop: prop.filter is not None))
             self.matchables = tuple(self.props(predicate=lambda prop: "match" in prop.flags))
+            self.serializers = {}
+
+        def serializer(self, level, exclude=frozenset()):
+            """Get serializer for a level.
+
+            The serializer is created on first use and cached. Levels outside of the defined range are clamped, so that
+            all levels beyond the highest one share a single serializer.
+
+            Parameters
+            ----------
+            level : int
+                Level of detail
+            exclude : frozenset, optional
+                Attributes to exclude. The default is frozenset().
+
+            Returns
+            -------
+            function
+                Function creating the dictionary representation of an instance
+            """
+            level = min(max(int(level), 0), len(self.levels)-1)
+            key = (level, exclude)
+            serializer = self.serializers.get(key)
+            if serializer is None:
+                getters = tuple((prop.key, prop.getter()) for prop in self.props(level, lambda prop: "hidden" not in prop.flags
+                                                                                 and prop.attr not in exclude
+                                                                                 and prop.proxy is None))
+
+                def serializer(obj):
+                    return {key: get(obj) for key, get in getters}
+                self.serializers[key] = serializer
+            return serializer
 
         def props(self, level=None, predicate=lambda x: True):
             """Return list of props available at level, fulfilling the predicate.
@@ -353,12 +489,10 @@ class DataModel:
         """
         self._init()
         if isinstance(spec, int):
-            propsel = lambda prop: "hidden" not in prop.flags and prop.attr not in exclude and prop.proxy is None
-        else:
-            sspec = set(spec)
-            propsel = lambda prop: prop.attr in sspec and prop.attr not in exclude and prop.proxy is None
-            spec = None
-        return {prop.key: prop.value(self) for prop in self._meta.props(spec, propsel)}
+            return self._meta.serializer(spec, frozenset(exclude))(self)
+        sspec = set(spec)
+        propsel = lambda prop: prop.attr in sspec and prop.attr not in exclude and prop.proxy is None
+        return {prop.key: prop.value(self) for prop in self._meta.props(None, propsel)}
 
     @classmethod
     def optimize_query(cls, query, spec):
@@ -573,20 +707,133 @@ class DataModel:
         return query
 
     @classmethod
-    def automatch(cls, query, expr, fields=None):
-        """Add fuzzy matching to query."""
+    def _keysetProps(cls, sorts):
+        """Get properties and orders used for keyset pagination.
+
+        Parameters
+        ----------
+        sorts : list
+            List of sort expressions
+
+        Raises
+        ------
+        ValueError
+            A sort expression references an attribute of another model
+
+        Returns
+        -------
+        list of tuple(DataModel.Prop, bool)
+            List of properties and whether to sort descending. Unknown sort expressions are ignored.
+        """
+        cls._init()
+        props = []
+        for s in sorts:
+            column, order = s.split(",", 1) if "," in s else (s, "asc")
+            prop = cls._meta.lookup.get(column)
+            if prop is None or "sort" not in prop.flags:
+                continue
+            if prop.target is not None or prop.proxy is not None:
+                raise ValueError("Cannot use cursor with sort by '{}'".format(column))
+            props.append((prop, order == "desc"))
+        return props
+
+    @classmethod
+    def keyset(cls, query, sorts, cursor=None):
+        """Apply keyset pagination to query.
+
+        Orders the query by the sort expressions (see `autosort`), followed by the ID. If a cursor is given, only rows
+        sorted after the cursor position are selected.
+        Only attributes of the model itself can be used for sorting.
+
+        Parameters
+        ----------
+        query : Query
+            SQLAlchemy Query
+        sorts : list
+            List of sort expressions
+        cursor : list, optional
+            Key values of the last row of the previous page, as returned by `keysetValues`. The default is None.
+
+        Raises
+        ------
+        ValueError
+            Sort expressions are not supported or the cursor does not match
+
+        Returns
+        -------
+        Query
+            Query with applied order by and filter expressions
+        """
+        keys = [(prop.value(cls, "unmask"), desc) for prop, desc in cls._keysetProps(sorts)]+[(cls.ID, False)]
+        query = query.order_by(*(column.desc() if desc else column.asc() for column, desc in keys))
+        if cursor is None:
+            return query
+        if len(cursor) != len(keys):
+            raise ValueError("Cursor does not match sort parameters")
+        conditions, equal = [], []
+        for (column, desc), value in zip(keys, cursor):
+            if value is None:  # NULL is sorted first in ascending and last in descending order
+                after = false() if desc else column.isnot(None)
+                same = column.is_(None)
+            else:
+                after = or_(column < value, column.is_(None)) if desc else column > value
+                same = column == value
+            conditions.append(and_(*equal, after))
+            equal.append(same)
+        query = query.filter(or_(*conditions))
+        column, desc = keys[0]
+        if len(keys) > 1 and cursor[0] is not None:  # Redundant bound allowing an index range scan on the first key
+            query = query.filter(or_(column <= cursor[0], column.is_(None)) if desc else column >= cursor[0])
+        return query
+
+    def keysetValues(self, sorts):
+        """Get key values for keyset pagination.
+
+        Parameters
+        ----------
+        sorts : list
+            List of sort expressions
+
+        Returns
+        -------
+        list
+            Values of the sort keys and ID
+        """
+        return [prop.value(self, "unmask") for prop, _ in self._keysetProps(sorts)]+[self.ID]
+
+    @classmethod
+    def automatch(cls, query, expr, fields=None, rank=False):
+        """Add fuzzy matching to query.
+
+        Parameters
+        ----------
+        query : Query
+            SQLAlchemy Query
+        expr : str
+            Match expression. Each word is matched separately.
+        fields : Iterable of str, optional
+            Restrict matching to these attributes. The default is None.
+        rank : bool, optional
+            Order results by match quality (see `matchRank`). The default is False.
+
+        Returns
+        -------
+        Query
+            Query with applied filters
+        """
         cls._init()
         isUnicode = any(ord(c) > 127 for c in expr)
-        matchexpr = tuple("%"+substr+"%" for substr in expr.split())
         matchables = cls._meta.matchables if fields is None else (m for m in cls._meta.matchables if m.alias in fields)
         targets = []
         for prop in matchables:
             column, query = prop.resolve(cls, query)
             if not (isUnicode and isinstance(column.type, String) and column.type.charset == "ascii"):
                 targets.append((prop, column))
-        filters = [column.ilike(match) for match in matchexpr for prop, column in targets if prop.match == "default"] +\
-                  [column == prop.tf(expr) for prop, column in targets if prop.match == "exact" and prop.tf(expr) is not None]
+        filters = matchFilters(cls, targets, expr)
         query = query.filter(or_(filter for filter in filters) if filters else False)
+        rankExpr = matchRank((column for prop, column in targets if prop.match == "default"), expr) if rank else None
+        if rankExpr is not None:
+            query = query.order_by(rankExpr)
         return query.reset_joinpoint()
 
     def matchvalues(self, fields=None):
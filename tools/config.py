@@ -58,6 +58,7 @@ def _defaultConfig():
     return {
         "DB": {
             "sessionTimout": 28800,
+            "versionPollInterval": 60,
             },
         "dns": {
             "disabled": False,
@@ -66,7 +67,11 @@ def _defaultConfig():
             },
         "openapi": {
             "validateRequest": True,
-            "validateResponse": True
+            "validateResponse": True,
+            "responseValidation": "always",
+            "responseSampleRate": 10,
+            "responseValidationThreads": 2,
+            "responseValidationQueueSize": 100
             },
         "options": {
             "antispamEndpoints": ["stat", "graph", "errors", "history"],
@@ -74,11 +79,26 @@ def _defaultConfig():
             "disableDB": False,
             "dataPath": "/usr/share/grommunio-admin-common",
             "portrait": "portrait.jpg",
+            "countEstimateCacheTime": 300,
+            "matchRerank": True,
+            "searchIndex": False,
+            "licenseCountReconcile": 300,
+            "storeSyncStateExpiry": 86400,
+            "serviceReloadWindow": 1,
             "domainStoreRatio": 10,
             "domainPrefix": "/var/lib/gromox/domain/",
             "userPrefix": "/var/lib/gromox/user/",
             "exmdbHost": "::1",
             "exmdbPort": "5000",
+            "exmdbPoolSize": 4,
+            "exmdbPoolIdleTimeout": 60,
+            "storePropertyThreads": 8,
+            "ldapPoolSize": 4,
+            "ldapPoolTimeout": 10,
+            "ldapBatchSize": 500,
+            "ldapSyncThreads": 4,
+            "ldapCacheTTL": 0,
+            "ldapCacheSize": 1024,
             "domainStorageLevels": 1,
             "userStorageLevels": 2,
             "dashboard": {
@@ -92,6 +112,9 @@ def _defaultConfig():
             "jwtPrivateKeyFile": "/var/lib/grommunio-admin-api/auth-private.pem",
             "jwtPublicKeyFile": "/var/lib/grommunio-admin-api/auth-public.pem",
             "rsaKeySize": 4096,
+            "tokenCacheSize": 1024,
+            "tokenCacheTTL": 300,
+            "permissionCacheExpiry": 3600,
             },
         "mconf": {
           "ldapPath": "/etc/gromox/ldap_adaptor.cfg",
@@ -6,12 +6,49 @@ import logging
 from orm import DB
 from services import Service, ServiceUnavailableError
 from sqlalchemy.exc import IntegrityError
+from tools.config import Config
 from tools.DataModel import MismatchROError, InvalidAttributeError
+from tools.metrics import Metrics
 from tools.misc import RecursiveDict
 
 logger = logging.getLogger("ldap")
 
 
+def _applyUserdata(user, userdata, externID=None):
+    """Apply LDAP data to a user inside a savepoint.
+
+    Does not commit. Changes are rolled back if they cannot be applied.
+
+    Parameters
+    ----------
+    user : orm.Users
+        User object to update
+    userdata : dict
+        Data as returned by SearchResult.userdata
+    externID : bytes, optional
+        Reassign externID to this ID. The default is None.
+
+    Returns
+    -------
+    str
+        Message
+    int
+        HTTP-like result code
+    """
+    try:
+        with DB.session.begin_nested():
+            try:
+                user.fromdict(userdata)
+            except ServiceUnavailableError:
+                logger.warning(f"Failed to synchronize store of user {user.username} - service unavailable")
+            user.externID = externID or user.externID
+        return "success", 200
+    except (InvalidAttributeError, MismatchROError, ValueError) as err:
+        return err.args[0], 400
+    except IntegrityError as err:
+        return err.orig.args[1], 400
+
+
 def downsyncUser(user, externID=None):
     """Synchronize a user from LDAP.
 
@@ -33,24 +70,84 @@ def downsyncUser(user, externID=None):
     """
     userdata = None
     with Service("ldap", user.orgID, errors=Service.SUPPRESS_INOP) as ldap:
+        ldap.invalidate()
         userdata = ldap.downsyncUser(externID or user.externID, user.properties)
 
     if userdata is None:
         return "Failed to get user data", 500
-    try:
-        try:
-            user.fromdict(userdata)
-        except ServiceUnavailableError:
-            logger.warning(f"Failed to synchronize store of user {user.username} - service unavailable")
-        user.externID = externID or user.externID
-        DB.session.commit()
-        return "success", 200
-    except (InvalidAttributeError, MismatchROError, ValueError) as err:
-        DB.session.rollback()
-        return err.args[0], 400
-    except IntegrityError as err:
-        DB.session.rollback()
-        return err.orig.args[1], 400
+    message, code = _applyUserdata(user, userdata, externID)
+    DB.session.commit()
+    return message, code
+
+
+def downsyncUsers(users, chunkSize=None):
+    """Synchronize multiple users and groups from LDAP.
+
+    LDAP objects are retrieved in chunks with one search per chunk and organization.
+    Changes are committed once per chunk. Objects that cannot be synchronized are skipped without affecting the rest
+    of the chunk. If the LDAP service of an organization is not available, its users are reported with code 503.
+
+    Parameters
+    ----------
+    users : Iterable[orm.Users]
+        Users to synchronize. Must have an externID.
+    chunkSize : int, optional
+        Number of users to process at once. The default is `options.ldapBatchSize`.
+
+    Yields
+    ------
+    orm.Users
+        Synchronized user
+    str
+        Message
+    int
+        HTTP-like result code
+    """
+    from orm.mlists import MLists
+    chunkSize = chunkSize or Config["options"].get("ldapBatchSize", 500)
+    orgs = {}
+    for user in users:
+        orgs.setdefault(user.orgID, []).append(user)
+    for orgID, orgUsers in orgs.items():
+        for offset in range(0, len(orgUsers), chunkSize):
+            chunk = orgUsers[offset:offset+chunkSize]
+            found, available = {}, False
+            with Service("ldap", orgID, errors=Service.SUPPRESS_INOP) as ldap:
+                if offset == 0:
+                    ldap.invalidate()
+                for result in ldap.getAll([user.externID for user in chunk], attributes="all"):
+                    found.setdefault(result.ID, []).append(result)
+                available = True
+            if not available:
+                Metrics.inc("ldapSync", "errors", len(chunk))
+                yield from ((user, "LDAP service not available", 503) for user in chunk)
+                continue
+            groupnames = [user.username for user in chunk if user.properties.get("displaytypeex") == 1]
+            mlists = {mlist.listname.lower(): mlist for mlist in
+                      MLists.query.filter(MLists.listname.in_(groupnames)).all()} if groupnames else {}
+            results = []
+            for user in chunk:
+                matches = found.get(user.externID, ())
+                if len(matches) == 0:
+                    results.append((user, "Failed to get user data", 500))
+                elif len(matches) > 1:
+                    results.append((user, "Multiple entries found", 500))
+                elif user.properties.get("displaytypeex") == 1:
+                    mlist = mlists.get(user.username.lower())
+                    results.append((user, *(_applyGroupdata(mlist, matches[0].userdata())
+                                            if mlist else ("No such group", 400))))
+                else:
+                    results.append((user, *_applyUserdata(user, matches[0].userdata())))
+            try:
+                DB.session.commit()
+            except Exception as err:
+                DB.session.rollback()
+                logger.error(f"Failed to commit synchronized users: {type(err).__name__}: {err}")
+                results = [(user, "Failed to save changes", 500) for user, _, _ in results]
+            Metrics.inc("ldapSync", "chunks")
+            Metrics.inc("ldapSync", "users", len(results))
+            Metrics.inc("ldapSync", "errors", sum(1 for _, _, code in results if code != 200))
+            yield from results
 
 
 def downsyncGroup(mlist, externID=None):
@@ -74,20 +171,45 @@ def downsyncGroup(mlist, externID=None):
     """
     listdata = None
     with Service("ldap", mlist.user.orgID, errors=Service.SUPPRESS_INOP) as ldap:
+        ldap.invalidate()
         listdata = ldap.downsyncUser(externID or mlist.user.externID, mlist.user.properties)
 
     if listdata is None:
         return "Failed to get group data", 500
+    message, code = _applyGroupdata(mlist, listdata, externID)
+    DB.session.commit()
+    return message, code
+
+
+def _applyGroupdata(mlist, listdata, externID=None):
+    """Apply LDAP data to a group inside a savepoint.
+
+    Does not commit. Changes are rolled back if they cannot be applied.
+
+    Parameters
+    ----------
+    mlist : orm.MLists
+        Group object to update
+    listdata : dict
+        Data as returned by SearchResult.userdata
+    externID : bytes, optional
+        Reassign externID to this ID. The default is None.
+
+    Returns
+    -------
+    str
+        Message
+    int
+        HTTP-like result code
+    """
     try:
-        mlist.fromdict(listdata)
-        mlist.user.externID = externID or mlist.user.externID
-        DB.session.commit()
+        with DB.session.begin_nested():
+            mlist.fromdict(listdata)
+            mlist.user.externID = externID or mlist.user.externID
         return "success", 200
     except (InvalidAttributeError, MismatchROError, ValueError) as err:
-        DB.session.rollback()
         return err.args[0], 400
     except IntegrityError as err:
-        DB.session.rollback()
         return err.orig.args[1], 400
 
 
@@ -123,6 +245,82 @@ def downsyncObject(user, externID=None):
     return message, code
 
 
+def checkLinkedUsers(users, chunkSize=None):
+    """Check whether the LDAP objects of linked users still exist.
+
+    LDAP objects are looked up in chunks with one search per chunk and organization.
+    Users whose LDAP object is not found or ambiguous are considered orphaned.
+
+    Parameters
+    ----------
+    users : Iterable
+        Users to check. Objects must provide `orgID` and `externID` attributes.
+    chunkSize : int, optional
+        Number of users to check at once. The default is `options.ldapBatchSize`.
+
+    Yields
+    ------
+    list
+        Users checked in this chunk
+    list
+        Orphaned users of this chunk
+    list
+        Users that could not be checked because the LDAP service is not available
+    """
+    chunkSize = chunkSize or Config["options"].get("ldapBatchSize", 500)
+    orgs = {}
+    for user in users:
+        orgs.setdefault(user.orgID, []).append(user)
+    for orgID, orgUsers in orgs.items():
+        for offset in range(0, len(orgUsers), chunkSize):
+            chunk = orgUsers[offset:offset+chunkSize]
+            try:
+                with Service("ldap", orgID) as ldap:
+                    found = {}
+                    for result in ldap.getAll([user.externID for user in chunk]):
+                        found[result.ID] = found.get(result.ID, 0)+1
+            except ServiceUnavailableError:
+                yield [], [], chunk
+                continue
+            Metrics.inc("ldapCheck", "users", len(chunk))
+            yield chunk, [user for user in chunk if found.get(user.externID) != 1], []
+
+
+def removeUsers(userIDs, deleteMaildirs=False):
+    """Delete users and unload their stores.
+
+    Parameters
+    ----------
+    userIDs : Iterable[int]
+        IDs of the users to delete
+    deleteMaildirs : bool, optional
+        Also remove user files from disk. The default is False.
+    """
+    import shutil
+    from orm.users import Users
+    homeserver = None
+    users = Users.query.filter(Users.ID.in_(userIDs)).order_by(Users.homeserverID).all()
+    index = 0
+    while index < len(users):
+        try:
+            with Service("exmdb") as exmdb:
+                if homeserver != users[index].homeserverID:  # Reuse the exmdb client for users on the same server
+                    user = users[index]
+                    client = exmdb.ExmdbQueries(exmdb.host if user.homeserverID == 0 else user.homeserver.hostname,
+                                                exmdb.port, user.maildir, True)
+                    homeserver = user.homeserverID
+                while index < len(users) and users[index].homeserverID == homeserver:
+                    client.unloadStore(users[index].maildir)
+                    if deleteMaildirs:
+                        shutil.rmtree(users[index].maildir, ignore_errors=True)
+                    users[index].delete()
+                    index += 1
+        except ServiceUnavailableError:
+            logger.warning("Failed to unload store: exmdb service not available")
+            index += 1
+    DB.session.commit()
+
+
 def importContact(candidate, ldap, orgID, syncExisting=False, domains=None, **kwargs):
     """Import contact from LDAP.
 
@@ -308,6 +506,57 @@ def importObject(candidate, ldap, **kwargs):
     raise TypeError(f"Unknown object type '{candidate.type}'")
 
 
+def _orgUsers(orgID):
+    """Get mapping of externID -> username of all linked users of an organization."""
+    from orm.users import Users
+    return {user.externID: user.username
+            for user in Users.query.filter(Users.orgID == orgID, Users.externID != None)
+                                   .with_entities(Users.externID, Users.username)}
+
+
+def _syncMembers(listIDs, memberIDs, users):
+    """Update member lists.
+
+    Does not commit.
+
+    Parameters
+    ----------
+    listIDs : Iterable[int]
+        IDs of the lists to update
+    memberIDs : dict
+        Mapping of list ID -> set of LDAP IDs of the desired members
+    users : dict
+        Mapping of LDAP ID -> username of known users
+
+    Returns
+    -------
+    dict
+        Mapping of list ID -> tuple of the number of added and removed members
+    """
+    from orm.mlists import Associations
+    listIDs = list(listIDs)
+    current = {listID: {} for listID in listIDs}
+    if listIDs:
+        for assoc in Associations.query.filter(Associations.listID.in_(listIDs)):
+            current[assoc.listID][assoc.username] = assoc
+    changes = {}
+    add = []
+    for listID, assocs in current.items():
+        desired = {users[ID] for ID in memberIDs.get(listID, ()) if ID in users}
+        removed = [assoc for username, assoc in assocs.items() if username not in desired]
+        added = desired-assocs.keys()
+        for assoc in removed:
+            DB.session.delete(assoc)
+        add += [(username, listID) for username in added]
+        changes[listID] = (len(added), len(removed))
+    DB.session.flush()  # necessary to fix case-confusions (i.e. User@example.org -> user@example.org)
+    DB.session.add_all([Associations(username, listID) for username, listID in add])
+    Metrics.inc("groupSync", "groups", len(changes))
+    Metrics.inc("groupSync", "added", len(add))
+    Metrics.inc("groupSync", "removed", sum(count for _, count in changes.values()))
+    return changes
+
+
 def syncGroupMembers(orgID, ldapgroup, ldap):
     """Synchronize group members.
 
@@ -327,23 +576,72 @@ def syncGroupMembers(orgID, ldapgroup, ldap):
     int | NoneType
         Number of users that were removed from the group or None if group not found
     """
-    from orm.mlists import Associations, MLists
-    from orm.users import Users
+    from orm.mlists import MLists
     group = MLists.query.filter(MLists.listname == ldapgroup.email).first()
     if group is None or group.user.orgID != orgID:
         return None, None
-    users = {user.externID: user.username
-             for user in Users.query.filter(Users.orgID == orgID, Users.externID != None)
-                                    .with_entities(Users.externID, Users.username)}
-    assocs = {assoc.username: assoc for assoc in Associations.query.filter(Associations.listID == group.ID).all()}
-    add = []
-    for member in ldap.searchUsers(attributes="idonly", customFilter=ldap.groupMemberFilter(ldapgroup.DN)):
-        assoc = assocs.pop(users.get(member.ID), None)
-        if assoc is None and member.ID in users:  # Do nothing if already associated or not known
-            add.append((users[member.ID], group.ID))
-    for assoc in assocs.values():
-        DB.session.delete(assoc)
-    DB.session.flush()  # necessary to fix case-confusions (i.e. User@example.org -> user@example.org)
-    DB.session.add_all([Associations(memberEmail, groupID) for memberEmail, groupID in add])
+    members = {member.ID for member in ldap.searchUsers(attributes="idonly",
+                                                        customFilter=ldap.groupMemberFilter(ldapgroup.DN))}
+    added, removed = _syncMembers((group.ID,), {group.ID: members}, _orgUsers(orgID))[group.ID]
+    DB.session.commit()
+    return added, removed
+
+
+def syncAllGroupMembers(orgID, ldap):
+    """Synchronize members of all groups.
+
+    Retrieves the memberships of all LDAP objects with a single search and updates all groups of the organization
+    in one transaction.
+
+    Parameters
+    ----------
+    orgID : int
+        Organization ID to limit groups and members to.
+    ldap : services.ldap.LdapService
+        LDAP connection to use
+
+    Returns
+    -------
+    list[tuple[str, int | NoneType, int | NoneType]]
+        List of (e-mail, added, removed) tuples for each LDAP group. Number of added and removed members are None if
+        the group does not exist.
+    """
+    from orm.mlists import MLists
+    from orm.users import Users
+    ldap.invalidate()
+    ldapgroups = ldap.searchUsers(types=("group",))
+    if not ldapgroups:
+        return []
+    names = [ldapgroup.email for ldapgroup in ldapgroups]
+    orgGroups = Users.query.filter(Users.orgID == orgID, Users.username.in_(names)).with_entities(Users.username)
+    groups = {group.listname.lower(): group.ID
+              for group in MLists.query.filter(MLists.listname.in_([user.username for user in orgGroups]))
+                                       .with_entities(MLists.ID, MLists.listname)}
+    memberIDs = _groupMemberIDs(ldapgroups, groups, ldap.groupMemberships(), ldap.normalizeDN)
+    changes = _syncMembers(memberIDs.keys(), memberIDs, _orgUsers(orgID))
     DB.session.commit()
-    return len(add), len(assocs)
+    return [(ldapgroup.email, *changes.get(groups.get(ldapgroup.email.lower()), (None, None)))
+            for ldapgroup in ldapgroups]
+
+
+def _groupMemberIDs(ldapgroups, groups, memberships, normalizeDN):
+    """Assign LDAP group members to lists.
+
+    Parameters
+    ----------
+    ldapgroups : Iterable[services.ldap.SearchResult]
+        LDAP group objects
+    groups : dict
+        Mapping of lowercase list name -> list ID
+    memberships : dict
+        Mapping of normalized group DN -> set of member IDs
+    normalizeDN : callable
+        Function normalizing a DN
+
+    Returns
+    -------
+    dict
+        Mapping of list ID -> set of member IDs
+    """
+    return {groups[ldapgroup.email.lower()]: memberships.get(normalizeDN(ldapgroup.DN), set())
+            for ldapgroup in ldapgroups if ldapgroup.email.lower() in groups}
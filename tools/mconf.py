@@ -82,6 +82,7 @@ def _transformLdap(conf):
     _addIfDef(LDAP["connection"], "connections", conf, "data_connections", type=int)
     _addIfDef(LDAP, "baseDn", conf, "ldap_search_base")
     _addIfDef(LDAP, "objectID", conf, "ldap_object_id")
+    _addIfDef(LDAP, "cacheTTL", conf, "ldap_cache_ttl", type=int)
     _addIfDef(LDAP["users"], "username", conf, "ldap_mail_attr")
     _addIfDef(LDAP["users"], "filters", conf, "ldap_user_filters", all=True)
     _addIfDef(LDAP["users"], "filter", conf, "ldap_user_filter")
@@ -111,6 +112,7 @@ def _flattenLdap(conf):
         _addIfDef(LDAP, "ldap_start_tls", conf["connection"], "starttls")
     _addIfDef(LDAP, "ldap_search_base", conf, "baseDn")
     _addIfDef(LDAP, "ldap_object_id", conf, "objectID")
+    _addIfDef(LDAP, "ldap_cache_ttl", conf, "cacheTTL")
     if "users" in conf:
         _addIfDef(LDAP, "ldap_mail_attr", conf["users"], "username")
         _addIfDef(LDAP, "ldap_user_displayname", conf["users"], "displayName")
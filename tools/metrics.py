@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: AGPL-3.0-or-later
+# SPDX-FileCopyrightText: 2024 grommunio GmbH
+
+import threading
+
+
+class Metrics:
+    """Process local collection of runtime counters and values.
+
+    Metrics are grouped into sections, usually one per component (e.g. `responseValidation` or `ldap`).
+    All methods are thread safe.
+    """
+    _lock = threading.Lock()
+    _data = {}
+
+    @classmethod
+    def inc(cls, section, name, value=1):
+        """Increment counter.
+
+        Parameters
+        ----------
+        section : str
+            Name of the metric section
+        name : str
+            Name of the counter
+        value : int, optional
+            Value to add. The default is 1.
+        """
+        with cls._lock:
+            sect = cls._data.setdefault(section, {})
+            sect[name] = sect.get(name, 0)+value
+
+    @classmethod
+    def set(cls, section, name, value):
+        """Set metric value.
+
+        Parameters
+        ----------
+        section : str
+            Name of the metric section
+        name : str
+            Name of the metric
+        value : Any
+            New value. Should be JSON serializable.
+        """
+        with cls._lock:
+            cls._data.setdefault(section, {})[name] = value
+
+    @classmethod
+    def get(cls, section=None):
+        """Get snapshot of metrics.
+
+        Parameters
+        ----------
+        section : str, optional
+            Only return metrics of this section. The default is None.
+
+        Returns
+        -------
+        dict
+            Copy of the requested metrics
+        """
+        with cls._lock:
+            if section is not None:
+                return dict(cls._data.get(section, {}))
+            return {name: dict(values) for name, values in cls._data.items()}
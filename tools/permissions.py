@@ -629,3 +629,80 @@ class DomainPurgePermission(PermissionBase):
             Set containing "DomainPurge" capability.
         """
         return {"DomainPurge"} | super().capabilities()
+
+
+class PermissionCache:
+    """Cache of compiled user permissions shared by all workers.
+
+    Entries are stored in redis together with the role generation they were loaded in. Every commit changing one of
+    the role tables increments the generation, which invalidates all cached entries.
+    If redis is not available, permissions are always loaded from the database.
+    """
+    generationKey = "grommunio-admin:rolegeneration"
+    keyPrefix = "grommunio-admin:permissions-"
+
+    @classmethod
+    def get(cls, userID):
+        """Get cached permissions of a user.
+
+        Parameters
+        ----------
+        userID : int
+            ID of the user
+
+        The returned generation must be passed to `put` when storing permissions loaded after a cache miss,
+        so that a concurrent invalidation is not masked by the new entry.
+
+        Returns
+        -------
+        tools.permissions.Permissions
+            Cached permissions or None if not cached or outdated
+        str
+            Current role generation or None if redis is not available
+        """
+        import json
+        from services import Service
+        from tools.metrics import Metrics
+        generation = None
+        with Service("redis", errors=Service.SUPPRESS_INOP) as r:
+            generation, data = r.mget(cls.generationKey, cls.keyPrefix+str(userID))
+            if data is not None:
+                data = json.loads(data)
+                if data["generation"] == generation:
+                    Metrics.inc("permissionCache", "hits")
+                    return Permissions(*(Permissions.load(perm) for perm in data["permissions"])), generation
+        Metrics.inc("permissionCache", "misses")
+        return None, generation
+
+    @classmethod
+    def put(cls, userID, permissions, generation):
+        """Store permissions of a user.
+
+        Parameters
+        ----------
+        userID : int
+            ID of the user
+        permissions : tools.permissions.Permissions
+            Permissions to store
+        generation : str
+            Role generation read before loading the permissions from the database
+        """
+        import json
+        from services import Service
+        from tools.config import Config
+        dumped = [Permissions.dump(perm) for perm in permissions]
+        if None in dumped:
+            return
+        with Service("redis", errors=Service.SUPPRESS_INOP) as r:
+            data = {"generation": generation, "permissions": dumped}
+            r.set(cls.keyPrefix+str(userID), json.dumps(data, separators=(",", ":")),
+                  ex=Config["security"].get("permissionCacheExpiry", 3600))
+
+    @classmethod
+    def invalidate(cls, *args, **kwargs):
+        """Invalidate all cached permissions."""
+        from services import Service
+        from tools.metrics import Metrics
+        with Service("redis", errors=Service.SUPPRESS_INOP) as r:
+            r.incr(cls.generationKey)
+            Metrics.inc("permissionCache", "invalidations")
@@ -403,3 +403,83 @@ class UserSetup(SetupContext):
         DB.execute("INSERT INTO configurations VALUES (1, ?)", (self.user.username,))
         DB.commit()
         DB.close()
+
+
+class StoreSyncState:
+    """Digests of the property values last written to each user store, shared by all workers.
+
+    `Users.syncStore` only writes properties whose digest differs from the stored one. The state is kept in redis
+    and discarded when a sync fails, so that the next sync writes all properties again. Entries expire after
+    `options.storeSyncStateExpiry` seconds. If no state is known (e.g. redis is not available), all properties are
+    written.
+    """
+    keyPrefix = "grommunio-admin:storesync-"
+
+    @staticmethod
+    def digest(content):
+        """Get digest of a property content."""
+        import hashlib
+        return hashlib.sha1(repr(content).encode("utf-8")).hexdigest()[:16]
+
+    @classmethod
+    def changed(cls, contents, state):
+        """Get tags whose content differs from the synchronized state.
+
+        Parameters
+        ----------
+        contents : dict
+            Mapping of property tag to current content
+        state : dict
+            Synchronized state as returned by `get`
+
+        Returns
+        -------
+        set of int
+            Tags of the changed properties
+        """
+        return {tag for tag, content in contents.items() if state.get(str(tag)) != cls.digest(content)}
+
+    @classmethod
+    def get(cls, userID):
+        """Get synchronized state of a user store.
+
+        Parameters
+        ----------
+        userID : int
+            ID of the user
+
+        Returns
+        -------
+        dict
+            Mapping of property tag (as string) to content digest or None if the state is unknown
+        """
+        import json
+        from services import Service
+        with Service("redis", errors=Service.SUPPRESS_INOP) as r:
+            data = r.get(cls.keyPrefix+str(userID))
+            return json.loads(data) if data is not None else None
+
+    @classmethod
+    def put(cls, userID, contents):
+        """Store synchronized state of a user store.
+
+        Parameters
+        ----------
+        userID : int
+            ID of the user
+        contents : dict
+            Mapping of property tag to content of all properties present in the store
+        """
+        import json
+        from services import Service
+        state = {str(tag): cls.digest(content) for tag, content in contents.items()}
+        with Service("redis", errors=Service.SUPPRESS_INOP) as r:
+            r.set(cls.keyPrefix+str(userID), json.dumps(state, separators=(",", ":")),
+                  ex=Config["options"].get("storeSyncStateExpiry", 86400))
+
+    @classmethod
+    def discard(cls, userID):
+        """Mark synchronized state of a user store as unknown."""
+        from services import Service
+        with Service("redis", errors=Service.SUPPRESS_INOP) as r:
+            r.delete(cls.keyPrefix+str(userID))
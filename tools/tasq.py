@@ -134,12 +134,50 @@ class Worker:
             client = exmdb.ExmdbQueries(host, exmdb.port, task.params["homedir"], task.params["private"])
             client.deleteFolder(task.params["homedir"], task.params["folderID"], task.params.get("clear", False))
 
-    def _ldapSyncUser(self, user):
-        from tools.ldap import downsyncObject
-        result, code = downsyncObject(user)
-        if code == 200:
-            return {"ID": user.ID, "username": user.username, "code": 200, "message": "Synchronization successful"}
-        return {"ID": user.ID, "username": user.username, "code": code, "message": result}
+    def ldapCheck(self, task):
+        from orm import DB
+        from orm.users import Users
+        from services import ServiceUnavailableError
+        from tools.ldap import checkLinkedUsers, removeUsers
+
+        DB.session.rollback()
+        domainIDs = task.params.get("domainIDs")
+        domainFilter = () if domainIDs is None else (Users.domainID.in_(domainIDs),)
+        users = Users.query.filter(Users.externID != None, *domainFilter)\
+                           .with_entities(Users.ID, Users.username, Users.externID, Users.orgID).all()
+        key = "deleted" if task.params.get("remove") else "orphaned"
+        task.params[key] = []
+        if len(users) == 0:
+            task.message = "No LDAP users found"
+            return
+        checked, orphaned, failed = 0, [], 0
+        for chunk, chunkOrphaned, chunkFailed in checkLinkedUsers(users):
+            checked += len(chunk)
+            failed += len(chunkFailed)
+            orphaned += chunkOrphaned
+            task.message = "{}/{} checked, {} orphaned".format(checked, len(users), len(orphaned))
+            self.bump()
+        if failed:
+            task.params["failed"] = failed
+            raise ServiceUnavailableError("Failed to check {} user{} - LDAP not available"
+                                          .format(failed, "" if failed == 1 else "s"))
+        task.params[key] = [{"ID": user.ID, "username": user.username} for user in orphaned]
+        if len(orphaned) == 0:
+            task.message = "All LDAP users are valid"
+            return
+        if task.params.get("remove"):
+            removeUsers([user.ID for user in orphaned], task.params.get("deleteFiles", False))
+            task.message = "{} orphaned user{} deleted".format(len(orphaned), "" if len(orphaned) == 1 else "s")
+        else:
+            task.message = "{} orphaned user{} found".format(len(orphaned), "" if len(orphaned) == 1 else "s")
+
+    def _ldapSyncUsers(self, users):
+        from tools.ldap import downsyncUsers
+        for user, result, code in downsyncUsers(users):
+            if code == 200:
+                yield user, {"ID": user.ID, "username": user.username, "code": 200, "message": "Synchronization successful"}
+            else:
+                yield user, {"ID": user.ID, "username": user.username, "code": code, "message": result}
 
     def _ldapSyncImportUser(self, candidate, ldap, lang):
         from tools.ldap import importObject
@@ -170,29 +208,85 @@ class Worker:
         return syncStatus
 
     def _ldapSyncGroupMembers(self, orgID, ldap):
-        from tools.ldap import syncGroupMembers
+        from tools.ldap import syncAllGroupMembers
         self.message = "Synchronizing group members"
         self.bump()
         status = []
-        for ldapgroup in ldap.searchUsers(types=("group",)):
-            add, remove = syncGroupMembers(orgID, ldapgroup, ldap)
+        for email, add, remove in syncAllGroupMembers(orgID, ldap):
             if None in (add, remove):
-                status.append(dict(username=ldapgroup.email, code=404, message="Group not found"))
+                status.append(dict(username=email, code=404, message="Group not found"))
             else:
-                status.append(dict(username=ldapgroup.email, code=200,
+                status.append(dict(username=email, code=200, added=add, removed=remove,
                                    message=f"{add} added to/{remove} removed from member list"
                                    if add+remove else "member list unchanged"))
         return status
 
+    def _ldapSyncOrg(self, orgID, userfilter, domainFilter, noLdapOrgs, task, record, bump):
+        """Synchronize users of a single LDAP configuration.
+
+        Runs in a separate thread with its own database session.
+
+        Returns
+        -------
+        list
+            Sync status of all processed objects
+        float
+            Time in seconds
+        """
+        from orm import DB
+        from orm.domains import Domains
+        from orm.users import Users
+        from services import Service, ServiceUnavailableError
+        from sqlalchemy.orm import selectinload
+        import time
+
+        start = time.time()
+        syncStatus = []
+        synced = set()
+        try:
+            users = Users.query.filter(Users.externID != None, *userfilter)\
+                               .options(selectinload(Users._properties)).all()
+            for user, status in self._ldapSyncUsers(users):
+                record(status)
+                syncStatus.append(status)
+                if status["code"] == 200:
+                    synced.add(user.externID)
+
+            if task.params.get("import"):
+                domains = Domains.query.filter(Domains.orgID == orgID, *domainFilter)\
+                                       .with_entities(Domains.ID, Domains.domainname).all()
+                if orgID == 0 and noLdapOrgs:
+                    domains += Domains.query.filter(Domains.orgID.in_(noLdapOrgs))\
+                                      .with_entities(Domains.ID, Domains.domainname).all()
+                try:
+                    ldap = Service("ldap", orgID).service()
+                    ldap.invalidate()
+                    status = self._ldapSyncImport(ldap, orgID, domains, synced, task.params.get("lang"), bump)
+                    for entry in status:
+                        record(entry)
+                    syncStatus += status
+                    self._ldapSyncGroupMembers(orgID, ldap)
+                except ServiceUnavailableError:
+                    pass
+        finally:
+            DB.session.remove()
+        return syncStatus, time.time()-start
+
     def ldapSync(self, task):
         def bump():
             nonlocal last
-            if time.time()-last < updateInterval:
-                return
-            updateMessage()
-            last = time.time()
+            with lock:
+                if time.time()-last < updateInterval:
+                    return
+                updateMessage()
+                last = time.time()
             self.bump()
 
+        def record(status):
+            with lock:
+                counts[statusCat(status["code"])] += 1
+            bump()
+
         def statusCat(code):
             return "created" if code == 201 else "synced" if code == 200 else "error"
 
@@ -203,14 +297,16 @@ class Worker:
             if counts["error"]:
                 task.message += ", {} error{}".format(counts["error"], "" if counts["error"] == 1 else "s")
 
+        from concurrent.futures import ThreadPoolExecutor
         from orm import DB
         from orm.domains import Domains, OrgParam, Orgs
         from orm.users import Aliases, Users
-        from services import Service, ServiceUnavailableError
+        from .config import Config
         import time
 
         DB.session.rollback()
         start = last = time.time()
+        lock = threading.Lock()
         orgID = task.params.get("orgID")
         domainID = task.params.get("domainID")
         updateInterval = task.params.get("updateInterval", 5)
@@ -222,62 +318,44 @@ class Worker:
         if domainID is not None:
             domainFilter = (Domains.ID == domainID,)
             domain = Domains.query.filter(Domains.ID == domainID).with_entities(Domains.orgID).first()
-            orgIDs = [domain.orgID]
-            userfilter = [Users.domainID == domainID]
+            userfilter = (Users.domainID == domainID,)
+            userfilters = {domain.orgID: userfilter}
         elif orgID is not None:
-            orgIDs = [orgID]
-            userfilter = [Users.orgID == orgID]
+            userfilter = (Users.orgID == orgID,)
+            userfilters = {orgID: userfilter}
         else:
             noLdapOrgs = {org.ID for org in Orgs.query.with_entities(Orgs.ID)}
             ldapOrgs = set(OrgParam.ldapOrgs())
-            orgIDs = ldapOrgs.union((0,))
             noLdapOrgs -= ldapOrgs
+            userfilters = {orgID: (Users.orgID == orgID,) for orgID in ldapOrgs}
+            userfilters[0] = (Users.orgID.in_(noLdapOrgs.union((0,))),)
             userfilter = ()
 
-        users = Users.query.filter(Users.externID != None, *userfilter).all()
-        counts = dict(created=0, synced=0, error=0, create=0, sync=len(users))
-        syncStatus = []
-        synced = set()
-
-        for user in users:
-            bump()
-            try:
-                status = self._ldapSyncUser(user)
-                syncStatus.append(status)
-                counts[statusCat(status["code"])] += 1
-                if status["code"] == 200:
-                    synced.add(user.externID)
-            except ServiceUnavailableError as err:
-                syncStatus.append(dict(ID=user.ID, username=user.username, code=503, message=err.args[0]))
-                counts["error"] += 1
-
-        if task.params.get("import"):
-            for orgID in orgIDs:
-                domains = Domains.query.filter(Domains.orgID == orgID, *domainFilter)\
-                                       .with_entities(Domains.ID, Domains.domainname).all()
-                if orgID == 0 and noLdapOrgs:
-                    domains += Domains.query.filter(Domains.orgID.in_(noLdapOrgs))\
-                                      .with_entities(Domains.ID, Domains.domainname).all()
-                ldap = Service("ldap", orgID).service()
-                try:
-                    status = self._ldapSyncImport(ldap, orgID, domains, synced, task.params.get("lang"), bump)
-                    counts["synced"] += sum(1 for s in status if s["code"] == 200)
-                    counts["created"] += sum(1 for s in status if s["code"] == 201)
-                    counts["error"] += sum(1 for s in status if s["code"] not in (200, 201))
-                    syncStatus += status
-                    self._ldapSyncGroupMembers(orgID, ldap)
-                except ServiceUnavailableError:
-                    pass
+        counts = dict(created=0, synced=0, error=0, create=0,
+                      sync=Users.query.filter(Users.externID != None, *userfilter).count())
+        DB.session.remove()
+
+        threads = max(1, min(Config["options"].get("ldapSyncThreads", 4), len(userfilters)))
+        with ThreadPoolExecutor(threads, thread_name_prefix="LDAP sync") as executor:
+            futures = {orgID: executor.submit(self._ldapSyncOrg, orgID, userfilter, domainFilter, noLdapOrgs, task,
+                                              record, bump)
+                       for orgID, userfilter in userfilters.items()}
+            syncStatus = []
+            timing = []
+            for orgID, future in futures.items():
+                status, duration = future.result()
+                syncStatus += status
+                timing.append(dict(orgID=orgID, objects=len(status), duration=round(duration, 3)))
 
         Aliases.NTactive(True)
         Users.NTactive(True)
 
-
         updateMessage()
         task.message += " ({:.1f}s)".format(time.time()-start)
         task.params["result"] = syncStatus
+        task.params["timing"] = timing
 
-    cmap = {"control": control, "debug": debug, "delFolder": deleteFolder, "ldapSync": ldapSync}
+    cmap = {"control": control, "debug": debug, "delFolder": deleteFolder, "ldapCheck": ldapCheck, "ldapSync": ldapSync}
 
 
 class TasQServer: